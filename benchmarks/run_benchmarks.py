@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+"""
+measure the wall time and the peak memory (RSS) of the world generation stages
+
+Every stage runs on every input in a fresh process, so the peak memory of one stage does not hide the others.
+The results are written to a JSON file and compared with a stored baseline, the script fails (exit code 1)
+if a stage got slower or needs more memory than allowed by the tolerances.
+
+ROS is not needed: every process uses a temporary copy of the package (links to the scripts and resources,
+empty models folder) instead of looking it up with rospkg, and a stub 'rosrun' which always fails.
+"""
+
+import json
+import os, sys
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+# import relative to rover_sim
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.package_path import PACKAGE_DIR_VARIABLE, set_rover_sim_path
+from rover_sim.benchmarks.stages import PACKAGE_DIR, STAGES, prepare_inputs
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# differences below these values are measurement noise, not regressions
+MIN_TIME_DIFFERENCE = 0.05
+MIN_MEMORY_DIFFERENCE = 10.0
+
+ROSRUN_STUB = """#!/bin/sh
+echo "rosrun is not available in the benchmarks: rosrun $*" >&2
+exit 1
+"""
+
+
+def peak_rss():
+    """peak memory (resident set size) of the current process
+
+    Returns:
+        float -- peak RSS (MB)
+    """
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def stub_ros(run_folder):
+    """use a temporary rover_sim package and a failing 'rosrun' in this process and its children
+
+    Arguments:
+        run_folder {str} -- folder of the current run
+    """
+
+    package_dir = os.path.join(run_folder, 'rover_sim')
+    os.makedirs(os.path.join(package_dir, 'models'))
+    for name in ('scripts', 'resources', 'package.xml'):
+        os.symlink(os.path.join(PACKAGE_DIR, name), os.path.join(package_dir, name))
+
+    bin_dir = os.path.join(run_folder, 'bin')
+    os.makedirs(bin_dir)
+    rosrun = os.path.join(bin_dir, 'rosrun')
+    with open(rosrun, 'w') as f:
+        f.write(ROSRUN_STUB)
+    os.chmod(rosrun, 0o755)
+
+    set_rover_sim_path(package_dir)
+    os.environ[PACKAGE_DIR_VARIABLE] = package_dir
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ.get('PATH', '')
+
+
+def run_stage(stage, files, run_folder):
+    """run a stage in the current process and measure it (see --worker)
+
+    Arguments:
+        stage {str} -- name of the stage
+        files {[str]} -- paths to the heightmap, landmarks and start position files
+        run_folder {str} -- empty folder of this run
+
+    Returns:
+        {} -- wall time (s), memory after the preparation and peak memory (MB)
+    """
+
+    stub_ros(run_folder)
+
+    prepare = dict(STAGES)[stage]
+    measured = prepare(files, run_folder)
+    setup_rss = peak_rss()
+
+    start = time.time()
+    measured()
+    wall_time = time.time() - start
+
+    return {'time': wall_time, 'setup_rss': setup_rss, 'peak_rss': peak_rss()}
+
+
+def measure(stage, files, work_folder, repeat=1):
+    """run a stage in fresh processes, keep the best of several runs
+
+    Arguments:
+        stage {str} -- name of the stage
+        files {[str]} -- paths to the heightmap, landmarks and start position files
+        work_folder {str} -- folder for the runs
+
+    Keyword Arguments:
+        repeat {int} -- number of runs (default: {1})
+
+    Returns:
+        {} -- wall time (s), memory after the preparation and peak memory (MB), or the error message
+    """
+
+    best = None
+    for _ in range(repeat):
+        run_folder = tempfile.mkdtemp(prefix=stage + '_', dir=work_folder)
+        result_path = os.path.join(run_folder, 'result.json')
+        log_path = os.path.join(run_folder, 'output.txt')
+
+        # the output of the stages is only interesting if something fails
+        with open(log_path, 'w') as log:
+            returncode = subprocess.call([sys.executable, os.path.abspath(__file__), '--worker', stage, result_path]
+                                         + list(files) + [run_folder], stdout=log, stderr=subprocess.STDOUT)
+        if returncode != 0:
+            with open(log_path) as log:
+                return {'error': log.read()[-2000:]}
+
+        with open(result_path) as f:
+            result = json.load(f)
+        shutil.rmtree(run_folder)
+
+        if best is None:
+            best = result
+        else:
+            best = dict((key, min(best[key], result[key])) for key in best)
+
+    return best
+
+
+def find_regressions(results, baseline, time_tolerance=0.25, memory_tolerance=0.15):
+    """compare the results with the baseline, stages missing in one of them are ignored
+
+    Arguments:
+        results {{}} -- results by input and stage name
+        baseline {{}} -- baseline results by input and stage name
+
+    Keyword Arguments:
+        time_tolerance {float} -- allowed relative increase of the wall time (default: {0.25})
+        memory_tolerance {float} -- allowed relative increase of the peak memory (default: {0.15})
+
+    Returns:
+        [str] -- descriptions of the regressions
+    """
+
+    regressions = []
+    for input_name in sorted(results):
+        for stage, result in sorted(results[input_name].items()):
+            base = baseline.get(input_name, {}).get(stage)
+            if base is None or 'error' in base or 'error' in result:
+                continue
+
+            for key, tolerance, min_difference, unit in (('time', time_tolerance, MIN_TIME_DIFFERENCE, 's'),
+                                                         ('peak_rss', memory_tolerance, MIN_MEMORY_DIFFERENCE, 'MB')):
+                if result[key] > base[key] * (1 + tolerance) and result[key] - base[key] > min_difference:
+                    regressions.append('{} {}: {} {:.2f} {} > baseline {:.2f} {} (+{:.0f}%)'.format(
+                        input_name, stage, key, result[key], unit, base[key], unit, 100 * (result[key] / base[key] - 1)))
+
+    return regressions
+
+
+def run_benchmarks(input_names=None, stage_names=None, scales=(2, 4), repeat=1, output=None, baseline=None,
+                   save_baseline=False, time_tolerance=0.25, memory_tolerance=0.15):
+    """run the benchmarks, write the results and compare them with the baseline
+
+    Keyword Arguments:
+        input_names {[str]} -- names of the inputs (default: {None}, all)
+        stage_names {[str]} -- names of the stages (default: {None}, all)
+        scales {()} -- upscaling factors of the synthetic heightmaps (default: {(2, 4)})
+        repeat {int} -- number of runs of every stage, the best one is kept (default: {1})
+        output {str} -- path of the results file (default: {None}, 'results.json' next to this script)
+        baseline {str} -- path of the baseline file (default: {None}, 'baseline.json' next to this script)
+        save_baseline {bool} -- store the results as new baseline instead of comparing them (default: {False})
+        time_tolerance {float} -- allowed relative increase of the wall time (default: {0.25})
+        memory_tolerance {float} -- allowed relative increase of the peak memory (default: {0.15})
+
+    Returns:
+        bool -- True if no stage failed or regressed
+    """
+
+    if output is None:
+        output = os.path.join(BENCHMARKS_DIR, 'results.json')
+    if baseline is None:
+        baseline = os.path.join(BENCHMARKS_DIR, 'baseline.json')
+
+    stage_names = stage_names or [name for name, _ in STAGES]
+    unknown = set(stage_names) - set(dict(STAGES))
+    if unknown:
+        raise ValueError('Unknown stages: ' + ', '.join(sorted(unknown)))
+
+    work_folder = tempfile.mkdtemp(prefix='rover_sim_benchmarks_')
+    try:
+        inputs = prepare_inputs(work_folder, scales)
+        input_names = input_names or sorted(inputs)
+        unknown = set(input_names) - set(inputs)
+        if unknown:
+            raise ValueError('Unknown inputs: ' + ', '.join(sorted(unknown)))
+
+        print("{:<14} {:<22} {:>10} {:>14}".format("Input", "Stage", "Time (s)", "Peak RSS (MB)"))
+        results = {}
+        for input_name in input_names:
+            for stage in stage_names:
+                result = measure(stage, inputs[input_name], work_folder, repeat)
+                results.setdefault(input_name, {})[stage] = result
+
+                if 'error' in result:
+                    print("{:<14} {:<22} {:>10} {:>14}".format(input_name, stage, "FAILED", ""))
+                else:
+                    print("{:<14} {:<22} {:>10.3f} {:>14.1f}".format(input_name, stage, result['time'], result['peak_rss']))
+    finally:
+        shutil.rmtree(work_folder)
+
+    document = {
+        'date': datetime.now().isoformat(),
+        'machine': {'platform': platform.platform(), 'processor': platform.processor(),
+                    'python': platform.python_version()},
+        'results': results,
+    }
+
+    with open(output, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+    print("\nResults written to " + output)
+
+    success = True
+    for input_name in sorted(results):
+        for stage, result in sorted(results[input_name].items()):
+            if 'error' in result:
+                print("\n{} {} failed:\n{}".format(input_name, stage, result['error']))
+                success = False
+
+    if save_baseline:
+        shutil.copyfile(output, baseline)
+        print("Baseline written to " + baseline)
+    elif os.path.exists(baseline):
+        with open(baseline) as f:
+            regressions = find_regressions(results, json.load(f)['results'], time_tolerance, memory_tolerance)
+        if regressions:
+            print("\nRegressions against " + baseline + ":\n" + "\n".join(regressions))
+            success = False
+        else:
+            print("No regressions against " + baseline)
+    else:
+        print("No baseline found at " + baseline + ", use --save-baseline to store one")
+
+    return success
+
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1 and sys.argv[1] == '--worker':
+        # single measurement in a fresh process: stage, result file, input files and run folder
+        stage, result_path = sys.argv[2:4]
+        files, run_folder = sys.argv[4:-1], sys.argv[-1]
+        with open(result_path, 'w') as f:
+            json.dump(run_stage(stage, files, run_folder), f)
+        sys.exit(0)
+
+    from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
+
+    # parse command line arguments
+    parser = ArgumentParser(
+        description="Measure the wall time and peak memory of the world generation stages and compare them with a baseline",
+        formatter_class=ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("-i", "--inputs", type=str, nargs="+", help="Names of the inputs, e.g. DTM01_v2 or DTM01_v2_x2, all if not given")
+    parser.add_argument("-s", "--stages", type=str, nargs="+", choices=[name for name, _ in STAGES], help="Names of the stages, all if not given")
+    parser.add_argument("--scales", type=int, nargs="*", help="Upscaling factors of the synthetic heightmaps (based on DTM01_v2)", default=[2, 4])
+    parser.add_argument("-r", "--repeat", type=int, help="Number of runs of every stage, the best one is kept", default=1)
+    parser.add_argument("-o", "--output", type=str, help="Path of the results file", default=os.path.join(BENCHMARKS_DIR, 'results.json'))
+    parser.add_argument("-b", "--baseline", type=str, help="Path of the baseline file", default=os.path.join(BENCHMARKS_DIR, 'baseline.json'))
+    parser.add_argument("--save-baseline", action="store_true", help="Store the results as new baseline instead of comparing them")
+    parser.add_argument("--time-tolerance", type=float, help="Allowed relative increase of the wall time", default=0.25)
+    parser.add_argument("--memory-tolerance", type=float, help="Allowed relative increase of the peak memory", default=0.15)
+    args = parser.parse_args()
+
+    success = run_benchmarks(input_names=args.inputs, stage_names=args.stages, scales=args.scales, repeat=args.repeat,
+                             output=args.output, baseline=args.baseline, save_baseline=args.save_baseline,
+                             time_tolerance=args.time_tolerance, memory_tolerance=args.memory_tolerance)
+
+    if not success:
+        sys.exit(1)
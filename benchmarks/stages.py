@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+inputs and stages of the world generation benchmarks (see run_benchmarks.py)
+
+Every stage is a function called with the input files (heightmap, landmarks, start position) and an empty run folder,
+it prepares its data and returns the function which is measured.
+"""
+
+import numpy as np
+import os, sys
+import shutil
+
+# import relative to rover_sim
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.heightmap import read_heightmap
+from rover_sim.scripts.generate_terrain import generate_normal_array, generate_index_array, generate_uv_array, \
+    generate_collada, generate_mesh
+from rover_sim.scripts.landmarks.generate_landmarks import create_landmarks
+from rover_sim.scripts.fix_landmark_heights import fix_landmark_heights
+from rover_sim.scripts.world_build import world_build
+
+# path to the rover_sim package
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# height written into the invalid points of the synthetic heightmaps
+INVALID_HEIGHT = 2.89
+
+# shipped inputs: heightmap csv file (ERC ver2 or ver1), landmarks csv file and start position
+SHIPPED_INPUTS = {
+    'DTM05_v2': ('providedFiles/erc2018final/DTM05_v2.txt', 'worlds/erc2018final/Landmarks.csv', 'worlds/erc2018final/start.yaml'),
+    'DTM01_v2': ('providedFiles/erc2018final/DTM01_v2.txt', 'worlds/erc2018final/Landmarks.csv', 'worlds/erc2018final/start.yaml'),
+    'DTM01_v1': ('providedFiles/erc2018final/DTM01_v1.txt', 'worlds/erc2018final/Landmarks.csv', 'worlds/erc2018final/start.yaml'),
+    'Generated': ('worlds/Generated/Heightmap.csv', 'worlds/Generated/Landmarks.csv', 'worlds/Generated/start.yaml'),
+}
+
+# shipped input which is upscaled for the synthetic inputs
+SYNTHETIC_SOURCE = 'DTM01_v2'
+
+
+def upscale_heightmap(heightmap, factor):
+    """interpolate the heights bilinearly on a grid with a smaller spacing
+
+    Arguments:
+        heightmap {Heightmap} -- the heights with their context information
+        factor {int} -- number of new grid cells per old grid cell along x and y
+
+    Returns:
+        () -- 2d array of heights [ind_x, ind_y] (invalid points set to INVALID_HEIGHT), spacing (x, y) and origin (x, y)
+    """
+
+    def weights(number_of_points):
+        positions = np.arange((number_of_points - 1) * factor + 1) / float(factor)
+        lower = np.minimum(positions.astype(int), number_of_points - 2)
+        return lower, lower + 1, positions - lower
+
+    x_0, x_1, t_x = weights(heightmap.shape[0])
+    y_0, y_1, t_y = weights(heightmap.shape[1])
+    t_x = t_x[:, np.newaxis]
+
+    heights = heightmap.heights.astype(np.float64)
+    lower = heights[x_0][:, y_0] * (1 - t_x) + heights[x_1][:, y_0] * t_x
+    upper = heights[x_0][:, y_1] * (1 - t_x) + heights[x_1][:, y_1] * t_x
+    heights = lower * (1 - t_y) + upper * t_y
+
+    # a new point is invalid if one of the surrounding old points is invalid
+    if heightmap.valid is not None:
+        valid = heightmap.valid
+        valid = valid[x_0][:, y_0] & valid[x_1][:, y_0] & valid[x_0][:, y_1] & valid[x_1][:, y_1]
+        heights[~valid] = INVALID_HEIGHT
+
+    spacing = (heightmap.spacing[0] / factor, heightmap.spacing[1] / factor)
+    return heights, spacing, heightmap.origin
+
+
+def write_heightmap_csv(csv_file_path, heights, spacing, origin):
+    """write heights as ERC csv file (ver2)
+
+    Arguments:
+        csv_file_path {str} -- path of the csv file
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y]
+        spacing {()} -- grid spacing (x, y)
+        origin {()} -- coordinates of heights[0, 0] (x, y)
+    """
+
+    number_of_cols, number_of_rows = heights.shape
+
+    with open(csv_file_path, 'wb') as f:
+        f.write(b"Number of Rows | Number of Columns | Grid spacing rows | Grid spacing columns | Coordinates of the first point in the matrix (x,y)\n")
+        # the first row is the one with the largest y
+        f.write(" {} {} {} {} {} {}\n".format(number_of_rows, number_of_cols, spacing[1], spacing[0], origin[0],
+                                              origin[1] + (number_of_rows - 1) * spacing[1]).encode('utf8'))
+        np.savetxt(f, heights[:, ::-1].T, fmt="%.2f", delimiter=", ")
+
+
+def prepare_inputs(input_folder, scales=(2, 4)):
+    """collect the shipped inputs and write the synthetic upscaled heightmaps
+
+    Arguments:
+        input_folder {str} -- folder for the synthetic heightmaps
+
+    Keyword Arguments:
+        scales {()} -- upscaling factors of the synthetic heightmaps (default: {(2, 4)})
+
+    Returns:
+        {str: ()} -- absolute paths to the heightmap, landmarks and start position files by input name
+    """
+
+    inputs = dict((name, tuple(os.path.join(PACKAGE_DIR, path) for path in paths))
+                  for name, paths in SHIPPED_INPUTS.items())
+
+    heightmap_csv, landmarks_csv, start_yaml = inputs[SYNTHETIC_SOURCE]
+    heightmap = read_heightmap(heightmap_csv)
+
+    for factor in scales:
+        name = '{}_x{}'.format(SYNTHETIC_SOURCE, factor)
+        csv_file_path = os.path.join(input_folder, name + '.txt')
+        if not os.path.exists(csv_file_path):
+            write_heightmap_csv(csv_file_path, *upscale_heightmap(heightmap, factor))
+        inputs[name] = (csv_file_path, landmarks_csv, start_yaml)
+
+    return inputs
+
+
+def parse_stage(files, run_folder):
+    """parse the heightmap csv file"""
+    return lambda: read_heightmap(files[0])
+
+
+def normals_stage(files, run_folder):
+    """calculate the vertex normals of the terrain"""
+    coords = read_heightmap(files[0]).coordinates()
+    return lambda: generate_normal_array(coords)
+
+
+def indices_stage(files, run_folder):
+    """generate the triangle indices of the terrain"""
+    coords = read_heightmap(files[0]).coordinates()
+    return lambda: generate_index_array(coords)
+
+
+def uvs_stage(files, run_folder):
+    """generate the uv coordinates of the terrain"""
+    coords = read_heightmap(files[0]).coordinates()
+    return lambda: generate_uv_array(coords)
+
+
+def collada_stage(files, run_folder):
+    """build the pycollada mesh of the terrain and write it"""
+    coords = read_heightmap(files[0]).coordinates()
+    output_file_path = os.path.join(run_folder, 'mesh.dae')
+    return lambda: generate_collada(coords, '../textures/texture.png').write(output_file_path)
+
+
+def collada_stream_stage(files, run_folder):
+    """generate the mesh arrays of the terrain and stream them into a Collada file"""
+    coords = read_heightmap(files[0]).coordinates()
+    output_file_path = os.path.join(run_folder, 'mesh.dae')
+    return lambda: generate_mesh(coords, 'dae')(output_file_path, '../textures/texture.png')
+
+
+def landmarks_stage(files, run_folder):
+    """create the landmarks model and the landmark models it includes"""
+    output_path = os.path.join(run_folder, 'models')
+    os.makedirs(output_path)
+    return lambda: create_landmarks('all_landmarks', files[1], output_path, None)
+
+
+def fix_landmark_heights_stage(files, run_folder):
+    """snap the landmarks to the terrain"""
+    output = os.path.join(run_folder, 'Landmarks.csv')
+    return lambda: fix_landmark_heights(files[0], files[1], output, 0, use_cache=False)
+
+
+def world_build_stage(files, run_folder):
+    """build the whole world"""
+    world_path = os.path.join(run_folder, 'world')
+    os.makedirs(world_path)
+    for file_path, file_name in zip(files, ('Heightmap.csv', 'Landmarks.csv', 'start.yaml')):
+        shutil.copyfile(file_path, os.path.join(world_path, file_name))
+
+    # cold build with an empty cache
+    return lambda: world_build(world_path, yes=True, cache_dir=os.path.join(run_folder, '.cache'))
+
+
+# benchmarked stages in the order of the pipeline
+STAGES = [
+    ('parse', parse_stage),
+    ('normals', normals_stage),
+    ('indices', indices_stage),
+    ('uvs', uvs_stage),
+    ('collada', collada_stage),
+    ('collada_stream', collada_stream_stage),
+    ('landmarks', landmarks_stage),
+    ('fix_landmark_heights', fix_landmark_heights_stage),
+    ('world_build', world_build_stage),
+]
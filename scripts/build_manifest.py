@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+build manifest of a world, records the inputs and outputs of every build step
+so unchanged steps can be skipped
+"""
+
+import json
+import os
+
+from rover_sim.scripts.heightmap_cache import file_hash, write_atomic
+
+# name of the manifest file inside of the world folder
+MANIFEST_NAME = '.build_manifest.json'
+
+# increase if the format of the manifest changes
+MANIFEST_VERSION = 1
+
+# files inside of input folders which are not relevant for the build
+IGNORED_EXTENSIONS = ('.pyc', '.pyo')
+
+
+def manifest_path(world_path):
+    """path of the manifest file of a world
+
+    Arguments:
+        world_path {str} -- path to the world folder
+
+    Returns:
+        str -- path to the manifest file
+    """
+
+    return os.path.join(world_path, MANIFEST_NAME)
+
+
+def read_manifest(world_path):
+    """read the manifest of the last build of a world
+
+    Arguments:
+        world_path {str} -- path to the world folder
+
+    Returns:
+        dict -- the manifest, empty if it is missing, broken or of an old version
+    """
+
+    try:
+        with open(manifest_path(world_path)) as fp:
+            manifest = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return {'version': MANIFEST_VERSION, 'steps': {}}
+
+    if manifest.get('version') != MANIFEST_VERSION:
+        return {'version': MANIFEST_VERSION, 'steps': {}}
+
+    return manifest
+
+
+def write_manifest(world_path, manifest):
+    """write the manifest of a world
+
+    Arguments:
+        world_path {str} -- path to the world folder
+        manifest {dict} -- the manifest
+    """
+
+    write_atomic(manifest_path(world_path),
+                 lambda fp: fp.write(json.dumps(manifest, indent=2, sort_keys=True).encode('utf8')))
+
+
+def list_files(paths):
+    """all the files of some files and folders
+
+    Arguments:
+        paths {[str]} -- paths to files or folders
+
+    Returns:
+        [str] -- sorted absolute paths of the files
+    """
+
+    files = []
+    for path in paths:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            for folder, folder_names, file_names in os.walk(path):
+                # skip hidden folders (e.g. caches)
+                folder_names[:] = [name for name in folder_names if not name.startswith('.')]
+                files.extend(os.path.join(folder, name) for name in file_names
+                             if not name.startswith('.') and not name.endswith(IGNORED_EXTENSIONS))
+        else:
+            files.append(path)
+
+    return sorted(files)
+
+
+def input_state(paths, previous=None):
+    """fingerprints of the input files of a build step
+
+    Files with the same size and modification time as in the previous build are not hashed again.
+
+    Arguments:
+        paths {[str]} -- paths to the input files or folders (all the files inside)
+
+    Keyword Arguments:
+        previous {dict} -- input state of the previous build (default: {None})
+
+    Returns:
+        dict -- path mapped to size, modification time and content hash of the file (None if it is missing)
+    """
+
+    previous = previous or {}
+
+    state = {}
+    for path in list_files(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            state[path] = None
+            continue
+
+        old = previous.get(path)
+        if old is not None and old[:2] == [stat.st_size, stat.st_mtime]:
+            state[path] = old
+        else:
+            state[path] = [stat.st_size, stat.st_mtime, file_hash(path)]
+
+    return state
+
+
+def is_up_to_date(manifest, step, inputs, options):
+    """check if the outputs of a build step are still valid
+
+    Arguments:
+        manifest {dict} -- manifest of the previous build
+        step {str} -- name of the build step
+        inputs {dict} -- current input state (see input_state)
+        options {dict} -- current options of the build step
+
+    Returns:
+        bool -- True if the inputs and options did not change and all the outputs exist
+    """
+
+    entry = manifest['steps'].get(step)
+    if entry is None:
+        return False
+
+    def hashes(state):
+        return dict((path, fingerprint and fingerprint[2]) for path, fingerprint in state.items())
+
+    # compare through json, so tuples and lists are equal
+    return (hashes(entry['inputs']) == hashes(inputs)
+            and entry['options'] == json.loads(json.dumps(options))
+            and all(os.path.exists(path) for path in entry['outputs']))
+
+
+def record_step(manifest, step, inputs, options, outputs, **info):
+    """store the inputs and outputs of a finished build step in the manifest
+
+    Arguments:
+        manifest {dict} -- the manifest
+        step {str} -- name of the build step
+        inputs {dict} -- input state (see input_state)
+        options {dict} -- options of the build step
+        outputs {[str]} -- paths of the generated files and folders
+
+    Keyword Arguments:
+        info -- additional information about the outputs, e.g. names of the generated models
+    """
+
+    entry = json.loads(json.dumps(dict(info, inputs=inputs, options=options, outputs=outputs)))
+    manifest['steps'][step] = entry
+
+
+def previous_inputs(manifest, step):
+    """input state of a build step in the previous build
+
+    Arguments:
+        manifest {dict} -- manifest of the previous build
+        step {str} -- name of the build step
+
+    Returns:
+        dict -- input state, empty if the step is unknown
+    """
+
+    return manifest['steps'].get(step, {}).get('inputs', {})
@@ -5,58 +5,49 @@ snap the landmarks to the terrain according to the heights provided in the heigh
 
 import numpy as np
 import os, sys
-from rospkg import RosPack
 import csv
 
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-def get_context_info_from_csv(csv_file_path):
+from rover_sim.scripts.package_path import rover_sim_path
+from rover_sim.scripts.heightmap_cache import load_heightmap
+
+def get_context_info_from_csv(csv_file_path, use_cache=True):
     """This function extracts the context info from a csv file based on the provided files of the ERC
 
     Arguments:
-        csv_file_path {str} -- path to the ERC csv file (ver2)
+        csv_file_path {str} -- path to the ERC csv file (ver2 or ver1)
+
+    Keyword Arguments:
+        use_cache {bool} -- use the binary heightmap cache instead of parsing the csv file every time (default: {True})
 
     Returns:
         () -- touple containing the spacing and the coordinates of the first point in the matrix
     """
 
-    # read context informations from *.csv file
-    with open(csv_file_path) as fp:
-        for i, line in enumerate(fp):
-            if i != 1:
-                continue
-
-            # we are only interested in the spacing and coords_0
-            _, _, spacing_y, spacing_x, x_0, y_0 = np.fromstring(line, dtype=float, sep=' ')
+    heightmap = load_heightmap(csv_file_path, use_cache=use_cache)
+    spacing_x, spacing_y = heightmap.spacing
+    x_0, y_0 = heightmap.origin
 
-            break
+    # the first point in the matrix (ver2) is the one with the largest y
+    return (spacing_y, spacing_x, x_0, y_0 + (heightmap.shape[1] - 1) * spacing_y)
 
-    return (spacing_y, spacing_x, x_0, y_0)
 
-
-def get_heights_from_csv(csv_file_path):
+def get_heights_from_csv(csv_file_path, use_cache=True):
     """This function extracts the heights from a csv file based on the provided files of the ERC
 
     Arguments:
-        csv_file_path {str} -- path to the ERC csv file (ver2)
+        csv_file_path {str} -- path to the ERC csv file (ver2 or ver1)
+
+    Keyword Arguments:
+        use_cache {bool} -- use the binary heightmap cache instead of parsing the csv file every time (default: {True})
 
     Returns:
         [[]] -- array of heights
     """
 
-    # load heights from *.csv file
-    heights = np.loadtxt(open(csv_file_path), delimiter=',', skiprows=2)
-
-    # transform the matrix so heights are accessible by intuitive indices
-    heights = np.swapaxes(np.flip(heights, 0), 0, 1)
-
-    # apply threshold (set invalid values to 0)
-    heights[heights >= 2.8] = 0
-
-    return heights
+    return load_heightmap(csv_file_path, use_cache=use_cache).heights
 
 def get_landmark_coords_from_csv(csv_file_path):
     """This function extracts the landmarks' coordinates from a csv file based on the provided 
@@ -74,61 +65,25 @@ def get_landmark_coords_from_csv(csv_file_path):
 
     return coords
 
-def interpolate_heights(context_info, heights, coords, offset):
-    """This function interpolates the correct heights at a coordinate based on the provided heightmap
+def interpolate_heights(heightmap, coords, offset):
+    """This function interpolates the correct heights at the coordinates based on the provided heightmap
     
     Arguments:
-        context_info {()} -- spacing and coordinates of the first point in the matrix
-        heigths {[[]]} -- array of heights provided by a heightmap
+        heightmap {Heightmap} -- the heights with their context information
         coords {[[]]} -- array of landmarks' coordinates
+        offset {float} -- height offset added to all landmarks
 
     Returns:
-        [] -- array of interpolated heights
+        [] -- array of interpolated heights, NaN for landmarks outside of the heightmap or on invalid points
     """
 
-    # extract the context information
-    spacing_y, spacing_x, x_0, y_0 = context_info
-    number_of_cols, number_of_rows = heights.shape
-
-    # convert y_0 to actual coordinate at ind_y=0
-    y_0 -= (number_of_rows-1)*spacing_y
-
-    # init the new heights
-    landmark_heights = []
+    coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
 
-    # for each landmark, interpolate the correct height
-    for (coord_x, coord_y) in coords:
+    # bilinear interpolation of all the landmarks at once
+    landmark_heights = heightmap.sample(coords[:, 0], coords[:, 1])
 
-        # index left of x-coord
-        ind_x = (int) ((coord_x - x_0) / spacing_x)
-
-        # absolute offset to x-coordinate at ind_x
-        offset_x = (x_0 + coord_x) % spacing_x      # x_0 as it might not be a multiple of spacing_x
-
-        # offset percentage
-        offset_x /= spacing_x
-
-        # same for the y-coord
-        ind_y = (int) ((coord_y - y_0) / spacing_y)
-        offset_y = (y_0 + coord_y) % spacing_y
-        offset_y /= spacing_y
-
-        #interpolate
-        height = (offset_x * offset_y * heights[ind_x][ind_y] 
-                    + offset_x * (1-offset_y) * heights[ind_x][ind_y+1]
-                    + (1-offset_x) * offset_y * heights[ind_x+1][ind_y]
-                    + (1-offset_x) * (1-offset_y) * heights[ind_x+1][ind_y+1])
-
-        # add static offset
-        height += offset
-
-        # adapt values to precision of the given *.csv files
-        height = round(height, 2)
-
-        # save landmarks' heights in a list
-        landmark_heights.append(height)
-
-    return landmark_heights
+    # add static offset and adapt values to precision of the given *.csv files
+    return np.round(landmark_heights + offset, 2)
 
 def save_fixed_landmarks(output, landmarks, landmark_heights):
     """This function saves the newly interpolated heights to a proper output file
@@ -136,7 +91,7 @@ def save_fixed_landmarks(output, landmarks, landmark_heights):
     Arguments:
         output {str} -- path to output file (fixed landmarks)
         landmarks {str} -- path to input file (original landmarks)
-        landmark_heights {[]} -- array of landmarks' interpolated heights
+        landmark_heights {[]} -- array of landmarks' interpolated heights (NaN: keep the original height)
     """
 
     # read original landmarks' information from file
@@ -151,7 +106,8 @@ def save_fixed_landmarks(output, landmarks, landmark_heights):
         if i == 0:
             continue
 
-        lines[i][3] = landmark_heights[i-1]
+        if not np.isnan(landmark_heights[i-1]):
+            lines[i][3] = float(landmark_heights[i-1])
 
     # write the new landmark file
     with open(output, 'w') as writeFile:
@@ -160,27 +116,30 @@ def save_fixed_landmarks(output, landmarks, landmark_heights):
 
     writeFile.close()
 
-def fix_landmark_heights(heightmap, landmarks, output, offset):
+def fix_landmark_heights(heightmap, landmarks, output, offset, use_cache=True):
     """snap the landmarks to the terrain according to the heights provided in the heightmap
 
     Arguments:
-        heightmap {str} -- path to the ERC csv file (ver2)
+        heightmap {str} -- path to the ERC csv file (ver2 or ver1)
         landmarks {str} -- path to input file (original landmarks)
         output {str} -- path to output file (fixed landmarks)
         offset {float} -- height offset added to all landmarks
-    """
 
-    # read context info
-    context_info = get_context_info_from_csv(heightmap)
+    Keyword Arguments:
+        use_cache {bool} -- use the binary heightmap cache instead of parsing the csv file every time (default: {True})
+    """
 
-    # read heigths
-    heights = get_heights_from_csv(heightmap)
+    # read heigths with their context info
+    heights = load_heightmap(heightmap, use_cache=use_cache)
 
     # read landmark coords
     coords = get_landmark_coords_from_csv(landmarks)
 
     # calculate the correct heights by interpolating
-    landmark_heights = interpolate_heights(context_info, heights, coords, offset)
+    landmark_heights = interpolate_heights(heights, coords, offset)
+
+    for i in np.nonzero(np.isnan(landmark_heights))[0]:
+        print("Landmark {} is outside of the heightmap or on invalid points, keeping its height".format(i + 1))
 
     # save new heights to a proper *.csv file
     save_fixed_landmarks(output, landmarks, landmark_heights)
@@ -191,9 +150,9 @@ if __name__ == '__main__':
     from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
     
     # default values
-    heightmap_csv_path = os.path.join(rover_sim_dir, 'worlds/erc2018final/Heightmap.csv')
-    landmarks_csv_path = os.path.join(rover_sim_dir, 'worlds/erc2018final/Landmarks.csv')
-    fixed_landmarks_path = os.path.join(rover_sim_dir, 'worlds/erc2018final/Landmarks.csv')
+    heightmap_csv_path = os.path.join(rover_sim_path(), 'worlds/erc2018final/Heightmap.csv')
+    landmarks_csv_path = os.path.join(rover_sim_path(), 'worlds/erc2018final/Landmarks.csv')
+    fixed_landmarks_path = os.path.join(rover_sim_path(), 'worlds/erc2018final/Landmarks.csv')
     height_offset = 0
 
     # parse command line arguments
@@ -201,11 +160,13 @@ if __name__ == '__main__':
         description="snap the landmarks to the terrain according to the heights provided in the heightmap",
         formatter_class=ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("-m", "--heightmap", type=str, help="path to an ERC csv file (ver2)", default=heightmap_csv_path)
+    parser.add_argument("-m", "--heightmap", type=str, help="path to an ERC csv file (ver2 or ver1)", default=heightmap_csv_path)
     parser.add_argument("-l", "--landmarks", type=str, help="path to a heightmap csv file", default=landmarks_csv_path)
     parser.add_argument("-o", "--output", type=str, help="output path for fixed landmarks csv file", default=fixed_landmarks_path)
     parser.add_argument("-s", "--offset", type=float, help="height offset added to all landmarks", default=height_offset)
+    parser.add_argument("--no-cache", action="store_true", help="always parse the heightmap csv file, do not use the binary cache")
     args = parser.parse_args()
 
     # fix landmark heigths
-    fix_landmark_heights(heightmap=args.heightmap, landmarks=args.landmarks, output=args.output, offset=args.offset)
+    fix_landmark_heights(heightmap=args.heightmap, landmarks=args.landmarks, output=args.output, offset=args.offset,
+                         use_cache=not args.no_cache)
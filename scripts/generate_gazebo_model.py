@@ -1,11 +1,16 @@
 #!/usr/bin/env python
 
 from lxml import etree
-import os
+import os, sys
 import numpy as np
-from rospkg import RosPack
 from shutil import copyfile
 
+# import relative to rover_sim
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.package_path import rover_sim_path
+from rover_sim.scripts.profiling import stage
+
 def replace_texture_path_on_template(template_file_path, output_file_path, new_texture_relative_path, template_texture_path='texture.png'):
     """replaces the texture path in a mesh file with a new one
     
@@ -26,6 +31,28 @@ def replace_texture_path_on_template(template_file_path, output_file_path, new_t
     with open(output_file_path, "w") as f:
         f.write(newText)
 
+def write_mesh(mesh, output_file_path, new_texture_relative_path):
+    """writes a mesh file with the correct texture path
+    
+    Arguments:
+        mesh {str|function|object} -- path to a template mesh file (copied, see replace_texture_path_on_template),
+                                      a function called with the output file path and the relative texture path
+                                      or an in-memory mesh with a write method (e.g. collada.Collada, texture path already set)
+        output_file_path {str} -- path of the new mesh file
+        new_texture_relative_path {str} -- relative path of the texture relative to the new mesh file
+    """
+
+    if callable(mesh):
+        mesh(output_file_path, new_texture_relative_path)
+    elif hasattr(mesh, 'write'):
+        mesh.write(output_file_path)
+    else:
+        replace_texture_path_on_template(
+            template_file_path= mesh,
+            output_file_path= output_file_path,
+            new_texture_relative_path= new_texture_relative_path
+        )
+
 def create_model_config(name, output_file_path, description=None):
     """ creates a config file for a gazebo model
     
@@ -145,29 +172,83 @@ def create_model_sdf(name, model_file_path, output_file_path, pose=[0, 0, 0, 0,
     tree.write(os.path.join(output_file_path, 'model.sdf'), pretty_print=True, encoding='utf8', xml_declaration=True)
 
 
-def create_gazebo_model(name, output_folder, template_mesh_vis, template_texture, 
-        pose=[0, 0, 0, 0, 0, 0], size=[1, 1, 1], template_mesh_col=None, model_folder=None,
-        description=None, static=True, ghost=False):
-    """generates a whole gazebo model for a given mesh with texture
+def create_heightmap_sdf(name, heightmap_file_path, texture_file_path, output_file_path, size, pos, texture_size=None):
+    """generates the sdf file for a static gazebo model using the native heightmap geometry
     
     Arguments:
         name {str} -- name of the model
-        output_folder {str} -- path to the folder in which the model should be generated, the path will be created
-        template_mesh_vis {str} -- path to the template visual mesh (will be copied)
-        template_texture {str} -- path to the texture (will be copied)
+        heightmap_file_path {str} -- path to the heightmap image in sdf format (model://...)
+        texture_file_path {str} -- path to the diffuse texture in sdf format (model://...)
+        output_file_path {str} -- path of the folder where the sdf file should be generated
+        size {list} -- size of the heightmap (x, y and the height difference between black and white pixels)
+        pos {list} -- position of the center of the heightmap (height of black pixels)
     
     Keyword Arguments:
-        pose {list} -- position and rotation of the model (default: {[0, 0, 0, 0, 0, 0]})
-        size {list} -- size of the model (default: {[1, 1, 1]})
-        template_mesh_col {str} -- optional path to a template collision mesh (will be copied) (default: {None})
-        model_folder {str} -- path to the gazebo model folder (must be parent of output_folder) 
-                              (mesh references not relative to base package) (default: {None})
-        description {str} -- optional description of the model (default: {None})
-        static {bool} -- model does not move (default: {True})
-        ghost {bool} -- model has no collision (default: {False})
+        texture_size {float} -- size of the area covered by one texture tile (default: {None}, whole heightmap)
     """
+    sdf = etree.Element('sdf')
+    sdf.set('version', '1.6')
 
-    base_path = os.path.join(output_folder, name)
+    model = etree.SubElement(sdf, 'model')
+    model.set('name', name)
+
+    static_node = etree.SubElement(model, 'static')
+    static_node.text = 'true'
+
+    link = etree.SubElement(model, 'link')
+    link.set('name', 'link')
+
+    def heightmap_geometry(parent):
+        geometry = etree.SubElement(parent, 'geometry')
+        heightmap = etree.SubElement(geometry, 'heightmap')
+
+        uri = etree.SubElement(heightmap, 'uri')
+        uri.text = heightmap_file_path
+
+        size_node = etree.SubElement(heightmap, 'size')
+        size_node.text = ' '.join('{:.7g}'.format(value) for value in size)
+
+        pos_node = etree.SubElement(heightmap, 'pos')
+        pos_node.text = ' '.join('{:.7g}'.format(value) for value in pos)
+
+        return heightmap
+
+    # collision
+    collision = etree.SubElement(link, 'collision')
+    collision.set('name', 'collision')
+    heightmap_geometry(collision)
+
+    # visual
+    visual = etree.SubElement(link, 'visual')
+    visual.set('name', 'visual')
+    heightmap = heightmap_geometry(visual)
+
+    texture = etree.Element('texture')
+    diffuse = etree.SubElement(texture, 'diffuse')
+    diffuse.text = texture_file_path
+    normal = etree.SubElement(texture, 'normal')
+    normal.text = 'file://media/materials/textures/flat_normal.png'
+    texture_size_node = etree.SubElement(texture, 'size')
+    texture_size_node.text = '{:.7g}'.format(texture_size if texture_size else max(size[0], size[1]))
+    # textures have to be defined before the uri
+    heightmap.insert(0, texture)
+
+    tree = etree.ElementTree(sdf)
+    tree.write(os.path.join(output_file_path, 'model.sdf'), pretty_print=True, encoding='utf8', xml_declaration=True)
+
+
+def prepare_model_folder(base_path, subfolders=('textures', 'meshes')):
+    """creates the folder of a gazebo model with its subfolders
+    
+    Arguments:
+        base_path {str} -- path of the model folder, the path will be created
+    
+    Keyword Arguments:
+        subfolders {()} -- names of the subfolders (default: {('textures', 'meshes')})
+    
+    Returns:
+        bool -- False if there already is a model in the folder (it will be left untouched)
+    """
 
     # check if output folder exists (path to it)
     if os.path.exists(base_path):
@@ -177,15 +258,63 @@ def create_gazebo_model(name, output_folder, template_mesh_vis, template_texture
             #raise ValueError('The folder is not empty: ' + base_path)
             print('The folder is not empty: ' + base_path)
             print('Skipping creation, leaving old model\n')
-            return
+            return False
 
     # generate it if necessary
     else:
         os.makedirs(base_path)
 
     # create subfolder
-    os.makedirs(os.path.join(base_path, 'textures'))
-    os.makedirs(os.path.join(base_path, 'meshes'))
+    for subfolder in subfolders:
+        os.makedirs(os.path.join(base_path, subfolder))
+
+    return True
+
+
+def model_uri(base_path, model_folder=None):
+    """gazebo uri of a model folder
+    
+    Arguments:
+        base_path {str} -- path of the model folder
+    
+    Keyword Arguments:
+        model_folder {str} -- path to the gazebo model folder (must be parent of base_path) (default: {None}, relative to rover_sim)
+    
+    Returns:
+        str -- uri of the model (model://...)
+    """
+
+    # no model folder specified => use package relative addressing instead
+    if model_folder is None:
+        relative_path = os.path.join('rover_sim', os.path.relpath(base_path, rover_sim_path()))
+    else:
+        relative_path = os.path.relpath(base_path, model_folder)
+
+    return 'model://' + relative_path
+
+
+def create_gazebo_heightmap_model(name, output_folder, heightmap_image, template_texture, size, pos,
+        model_folder=None, description=None):
+    """generates a static gazebo model using the native heightmap geometry
+    
+    Arguments:
+        name {str} -- name of the model
+        output_folder {str} -- path to the folder in which the model should be generated, the path will be created
+        heightmap_image {str} -- path to the heightmap image, square with 2^n+1 pixels per side (will be copied)
+        template_texture {str} -- path to the texture (will be copied)
+        size {list} -- size of the heightmap (x, y and the height difference between black and white pixels)
+        pos {list} -- position of the center of the heightmap (height of black pixels)
+    
+    Keyword Arguments:
+        model_folder {str} -- path to the gazebo model folder (must be parent of output_folder) 
+                              (references not relative to base package) (default: {None})
+        description {str} -- optional description of the model (default: {None})
+    """
+
+    base_path = os.path.join(output_folder, name)
+
+    if not prepare_model_folder(base_path, subfolders=('textures',)):
+        return
 
     # copy texture
     _, texture_extension = os.path.splitext(template_texture)
@@ -195,20 +324,9 @@ def create_gazebo_model(name, output_folder, template_mesh_vis, template_texture
     relative_texture_path = 'textures/texture' + texture_extension
     copyfile(template_texture, os.path.join(base_path, relative_texture_path))
 
-
-    # replace the texturepath in the template
-    replace_texture_path_on_template(
-        template_file_path= template_mesh_vis,
-        output_file_path= os.path.join(base_path, 'meshes/mesh.dae'),
-        new_texture_relative_path= os.path.join('..',relative_texture_path)
-    )
-
-    if template_mesh_col:
-        replace_texture_path_on_template(
-            template_file_path= template_mesh_col,
-            output_file_path= os.path.join(base_path, 'meshes/collision_mesh.dae'),
-            new_texture_relative_path= os.path.join('..',relative_texture_path)
-        )
+    # copy heightmap image
+    relative_heightmap_path = 'textures/heightmap.png'
+    copyfile(heightmap_image, os.path.join(base_path, relative_heightmap_path))
 
     create_model_config(
         name,  
@@ -216,43 +334,121 @@ def create_gazebo_model(name, output_folder, template_mesh_vis, template_texture
         description=description
     )
 
-    # no model folder specified => use package relative addressing instead
-    if model_folder is None:
-        rospack = RosPack()
-        rover_sim_dir = rospack.get_path('rover_sim')
-        relative_path = os.path.join('rover_sim', os.path.relpath(base_path, rover_sim_dir))
-    else:
-        relative_path = os.path.relpath(base_path, model_folder)
+    uri = model_uri(base_path, model_folder)
+
+    create_heightmap_sdf(
+        name,
+        heightmap_file_path= uri + '/' + relative_heightmap_path,
+        texture_file_path= uri + '/' + relative_texture_path,
+        output_file_path= base_path,
+        size= size,
+        pos= pos
+    )
+
+
+def create_gazebo_model(name, output_folder, template_mesh_vis, template_texture, 
+        pose=[0, 0, 0, 0, 0, 0], size=[1, 1, 1], template_mesh_col=None, model_folder=None,
+        description=None, static=True, ghost=False, copy_texture=True, mesh_extension='.dae', collision_mesh_extension=None):
+    """generates a whole gazebo model for a given mesh with texture
+    
+    Arguments:
+        name {str} -- name of the model
+        output_folder {str} -- path to the folder in which the model should be generated, the path will be created
+        template_mesh_vis {str|function|object} -- path to the template visual mesh (will be copied),
+                                                   a writer function or an in-memory mesh (see write_mesh)
+        template_texture {str} -- path to the texture (will be copied)
     
-    mesh_vis_path = 'model://' + relative_path + '/meshes/mesh.dae'
+    Keyword Arguments:
+        pose {list} -- position and rotation of the model (default: {[0, 0, 0, 0, 0, 0]})
+        size {list} -- size of the model (default: {[1, 1, 1]})
+        template_mesh_col {str|function|object} -- optional template collision mesh (see template_mesh_vis) (default: {None})
+        model_folder {str} -- path to the gazebo model folder (must be parent of output_folder) 
+                              (mesh references not relative to base package) (default: {None})
+        description {str} -- optional description of the model (default: {None})
+        static {bool} -- model does not move (default: {True})
+        ghost {bool} -- model has no collision (default: {False})
+        copy_texture {bool} -- copy the texture into the model, otherwise the meshes reference the texture file
+                               directly, e.g. a texture atlas shared by several models (default: {True})
+        mesh_extension {str} -- file extension of the visual mesh, e.g. '.obj' (default: {'.dae'})
+        collision_mesh_extension {str} -- file extension of the collision mesh, e.g. '.stl' (default: {None}, same as the visual mesh)
+    
+    Returns:
+        bool -- False if there already was a model in the folder (it is left untouched)
+    """
 
-    if template_mesh_col:
-        mesh_col_path = 'model://' + relative_path + '/meshes/collision_mesh.dae'
+    base_path = os.path.join(output_folder, name)
+
+    if not prepare_model_folder(base_path, subfolders=('textures', 'meshes') if copy_texture else ('meshes',)):
+        return False
+
+    # copy texture
+    _, texture_extension = os.path.splitext(template_texture)
+    if not os.path.exists(template_texture):
+        raise ValueError('The texture file is missing in the folder ' + template_texture)
+
+    if copy_texture:
+        relative_texture_path = 'textures/texture' + texture_extension
+        with stage('texture copy'):
+            copyfile(template_texture, os.path.join(base_path, relative_texture_path))
+        mesh_texture_path = os.path.join('..',relative_texture_path)
     else:
-        mesh_col_path = None
+        mesh_texture_path = os.path.relpath(os.path.abspath(template_texture), os.path.join(base_path, 'meshes'))
 
-    create_model_sdf(
-        name, 
-        model_file_path= mesh_vis_path,
-        pose= pose,
-        size= size,
-        output_file_path=base_path,
-        collision_model_file_path=mesh_col_path,
-        static= static,
-        ghost= ghost
-    )
+
+    if collision_mesh_extension is None:
+        collision_mesh_extension = mesh_extension
+
+    # write the meshes with the new texture path
+    with stage('mesh write'):
+        write_mesh(
+            template_mesh_vis,
+            output_file_path= os.path.join(base_path, 'meshes/mesh' + mesh_extension),
+            new_texture_relative_path= mesh_texture_path
+        )
+
+    if template_mesh_col:
+        with stage('collision mesh write'):
+            write_mesh(
+                template_mesh_col,
+                output_file_path= os.path.join(base_path, 'meshes/collision_mesh' + collision_mesh_extension),
+                new_texture_relative_path= mesh_texture_path
+            )
+
+    with stage('sdf'):
+        create_model_config(
+            name,  
+            output_file_path= base_path,
+            description=description
+        )
+
+        uri = model_uri(base_path, model_folder)
+
+        mesh_vis_path = uri + '/meshes/mesh' + mesh_extension
+
+        if template_mesh_col:
+            mesh_col_path = uri + '/meshes/collision_mesh' + collision_mesh_extension
+        else:
+            mesh_col_path = None
+
+        create_model_sdf(
+            name, 
+            model_file_path= mesh_vis_path,
+            pose= pose,
+            size= size,
+            output_file_path=base_path,
+            collision_model_file_path=mesh_col_path,
+            static= static,
+            ghost= ghost
+        )
+
+    return True
 
 if __name__ == '__main__':
 
     from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
-    rospack = RosPack()
-
-    # get path of package
-    rover_sim_dir = rospack.get_path('rover_sim')
-    
     # default values
-    output_folder = os.path.join(rover_sim_dir, 'models')
+    output_folder = os.path.join(rover_sim_path(), 'models')
 
     # parse command line arguments
     parser = ArgumentParser(
@@ -1,27 +1,26 @@
 #!/usr/bin/env python
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import os, sys
-from rospkg import RosPack
 
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+from rover_sim.scripts.package_path import rover_sim_path
 from rover_sim.scripts.generate_gazebo_model import create_gazebo_model
+from rover_sim.scripts.landmarks.generate_landmark_texture import load_font
 
 def create_name_texture(name, path):
 
     font_size = 80
-    font_path =  os.path.join(rover_sim_dir, 'resources/names/DejaVuSans-Bold.ttf')
+    font_path =  os.path.join(rover_sim_path(), 'resources/names/DejaVuSans-Bold.ttf')
     size = (600, 300)
 
     # base image
     # Gazebo doesn't support transparent textures :(
     img = Image.new('RGBA', size, (255,255,255,255))
 
-    # get a font
-    fnt = ImageFont.truetype(font_path, font_size)
+    # get a font (cached, it is the same for all the names)
+    fnt = load_font(font_path, font_size)
     # get a drawing context
     d = ImageDraw.Draw(img)
 
@@ -59,7 +58,7 @@ def create_name(name, output_folder, pose=[0, 0, 0, 0, 0, 0]):
     create_gazebo_model(
         name=name, 
         output_folder=output_folder, 
-        template_mesh_vis=os.path.join(rover_sim_dir, 'resources','names','name_default.dae'), 
+        template_mesh_vis=os.path.join(rover_sim_path(), 'resources','names','name_default.dae'), 
         template_texture=temp_texture_path,
         pose=pose,
         template_mesh_col=None,
@@ -77,8 +76,8 @@ def create_logo(name, output_folder, pose):
     create_gazebo_model(
         name=name, 
         output_folder=output_folder, 
-        template_mesh_vis=os.path.join(rover_sim_dir,'resources','names','exp_logo.dae'), 
-        template_texture=os.path.join(rover_sim_dir,'resources','names','Exploration_logo.png'),
+        template_mesh_vis=os.path.join(rover_sim_path(),'resources','names','exp_logo.dae'), 
+        template_texture=os.path.join(rover_sim_path(),'resources','names','Exploration_logo.png'),
         pose=pose,
         template_mesh_col=None,
         description="Name credit",
@@ -93,7 +92,7 @@ if __name__ == '__main__':
     from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
     # default values
-    output_folder = os.path.join(rover_sim_dir, 'models', 'names')
+    output_folder = os.path.join(rover_sim_path(), 'models', 'names')
 
     # parse command line arguments
     parser = ArgumentParser(
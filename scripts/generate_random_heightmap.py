@@ -1,91 +1,227 @@
-#!/usr/bin/env python3
-
-#TODO use python 2?
-
-#TODO give a seed value, and save it somewhere, so we can recreate the exaxt same random world
-
-#TODO specify size in arguments
-
+#!/usr/bin/env python
 """
 This script generates terrain in the ERC provided format and writes it down into a csv file
 
-Todo:
-Replace hardcode of file paths and variables with an apropriate command line arguements
-
+The heights are fractal Brownian motion (several octaves of Perlin noise) evaluated with numpy,
+optionally with craters, boulders and slopes stamped in. The settings (including the seed) are
+written next to the csv file, so the terrain can be recreated.
 """
 
-
-from PIL import Image
 import numpy as np
 import os, sys
-import random
-import csv
-import io
-from sys import maxsize
-from noise import pnoise2 # if error: pip install noise (or pip3)
-from argparse import ArgumentParser
-from rospkg import RosPack # if error: pip3 install rospkg
+import yaml
 
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.terrain_features import add_terrain_features
 
+# gradient directions of the Perlin noise
+GRADIENTS = np.array([[1, 1], [-1, 1], [1, -1], [-1, -1], [1, 0], [-1, 0], [0, 1], [0, -1]], dtype=np.float64)
+
+# maximal number of heights evaluated at once
+CHUNK_SIZE = 1024 * 1024
+
+
+def permutation_table(seed):
+    """random permutation of the Perlin noise lattice
 
-def create_random_heightmap(output_file):
-    """Creates random heightmap as .csv
-    
     Arguments:
-        output_file {str} -- Path of generated heightmap csv file
+        seed {int} -- seed of the random generator
+
+    Returns:
+        [] -- permutation of 0..255, repeated once so lookups do not have to wrap around
+    """
+
+    permutation = np.random.RandomState(seed).permutation(256)
+    return np.concatenate((permutation, permutation))
+
+
+def perlin_noise(xs, ys, permutation):
+    """evaluate 2d Perlin noise
+
+    Arguments:
+        xs {[]} -- x coordinates (in lattice units)
+        ys {[]} -- y coordinates (in lattice units)
+        permutation {[]} -- permutation table (see permutation_table)
+
+    Returns:
+        [] -- noise values, roughly in [-1, 1]
     """
 
-    map_height = 110
-    map_width = 60
-    rows_spacing = 0.5
-    columns_spacing = 0.5
-    noise_base = random.randint(0,100)
+    x_floor = np.floor(xs)
+    y_floor = np.floor(ys)
+    x_cell = x_floor.astype(np.int64) & 255
+    y_cell = y_floor.astype(np.int64) & 255
+
+    # position inside of the lattice cell
+    x = xs - x_floor
+    y = ys - y_floor
 
-    max_altitude = 2
-    min_altitude = -0.5
-    data = np.empty ([map_width, map_height])
+    def gradient(x_offset, y_offset):
+        # dot product of the corner gradient and the vector from the corner
+        corner = permutation[permutation[x_cell + x_offset] + y_cell + y_offset] & 7
+        return GRADIENTS[corner, 0] * (x - x_offset) + GRADIENTS[corner, 1] * (y - y_offset)
 
-    iterator = np.nditer(data, flags=["multi_index"], op_flags=['writeonly'])
+    # smooth interpolation weights (6t^5 - 15t^4 + 10t^3)
+    u = x * x * x * (x * (x * 6 - 15) + 10)
+    v = y * y * y * (y * (y * 6 - 15) + 10)
 
-    # Calculating noise
-    while not iterator.finished:
-        iterator[0] = round(pnoise2 (iterator.multi_index[0]/ map_width, iterator.multi_index[1]/map_height, octaves = 4, base = noise_base), 5)
-        iterator.iternext()
+    bottom_left = gradient(0, 0)
+    top_left = gradient(0, 1)
+    bottom = bottom_left + u * (gradient(1, 0) - bottom_left)
+    top = top_left + u * (gradient(1, 1) - top_left)
 
-    #Normalizing noise within range
-    data = min_altitude + (max_altitude - min_altitude) * (data - np.min(data))/(np.max(data) - np.min(data)) 
+    return bottom + v * (top - bottom)
 
 
-    with io.open(output_file, 'w+', newline='') as f:
-        writer = csv.writer(f, delimiter="|" , quoting = csv.QUOTE_NONE)
-        writer.writerow (["Number of Rows ",  " Number of Columns ", " Grid spacing rows ", " Grid spacing columns ", " Coordinates of the first point in the matrix (x,y)"])   
-        writer = csv.writer(f, delimiter=" " , quoting = csv.QUOTE_NONE)
-        writer.writerow ([str(map_height), str(map_width), str(rows_spacing), str(columns_spacing), str(0), str(map_height//2)])
-    
+def fbm_noise(xs, ys, permutation, octaves=4, persistence=0.5, lacunarity=2.0):
+    """evaluate fractal Brownian motion, a sum of Perlin noise with increasing frequency and decreasing amplitude
 
-        np.savetxt(f, data, fmt="%.5f", delimiter=",")
+    Arguments:
+        xs {[]} -- x coordinates (in lattice units of the first octave)
+        ys {[]} -- y coordinates (in lattice units of the first octave)
+        permutation {[]} -- permutation table (see permutation_table)
 
+    Keyword Arguments:
+        octaves {int} -- number of noise layers (default: {4})
+        persistence {float} -- amplitude factor between the octaves (default: {0.5})
+        lacunarity {float} -- frequency factor between the octaves (default: {2.0})
 
-    # Uncomment this if you want to get nice pictures as the output
+    Returns:
+        [] -- noise values
     """
-    w, h = data.shape
-    data -= np.min(data)
-    data /= np.max(data)
-    data *= 255
-    data = np.stack((data,)*3, axis=-1)
 
-    img = Image.fromarray(np.uint8(data), 'RGB')
+    result = np.zeros(np.broadcast(xs, ys).shape)
+    amplitude = 1.0
+    frequency = 1.0
+    for _ in range(octaves):
+        result += amplitude * perlin_noise(xs * frequency, ys * frequency, permutation)
+        amplitude *= persistence
+        frequency *= lacunarity
 
-    path = "../worlds/gterrain.png"
-    img.save(path)
-    img.show()
+    return result
+
+
+def random_heights(size, spacing=0.5, seed=0, scale=50.0, octaves=4, persistence=0.5, lacunarity=2.0,
+                   min_altitude=-0.5, max_altitude=2.0, features=None):
+    """generate random terrain heights
+
+    Arguments:
+        size {()} -- number of grid points along x and y
+
+    Keyword Arguments:
+        spacing {float} -- distance between the grid points (m) (default: {0.5})
+        seed {int} -- seed of the random generator (default: {0})
+        scale {float} -- size of the largest terrain features (m) (default: {50.0})
+        octaves {int} -- number of noise layers (default: {4})
+        persistence {float} -- amplitude factor between the octaves (default: {0.5})
+        lacunarity {float} -- frequency factor between the octaves (default: {2.0})
+        min_altitude {float} -- lowest height of the terrain (m) (default: {-0.5})
+        max_altitude {float} -- highest height of the terrain (m) (default: {2.0})
+        features {dict} -- keyword arguments of add_terrain_features, e.g. crater_density (default: {None}, only noise)
+
+    Returns:
+        [[]] -- 2d float32 array of heights [ind_y, ind_x] in the order of the csv file (first row has the largest y)
     """
 
+    number_of_cols, number_of_rows = size
+    if number_of_cols < 2 or number_of_rows < 2:
+        raise ValueError('The terrain needs at least 2 x 2 grid points')
+
+    permutation = permutation_table(seed)
 
+    xs = np.arange(number_of_cols) * (spacing / scale)
+    heights = np.empty((number_of_rows, number_of_cols), dtype=np.float32)
+
+    # evaluate the noise in chunks of rows to limit the memory of the temporary arrays
+    chunk_rows = max(1, CHUNK_SIZE // number_of_cols)
+    for first_row in range(0, number_of_rows, chunk_rows):
+        rows = np.arange(first_row, min(first_row + chunk_rows, number_of_rows))
+        ys = (number_of_rows - 1 - rows) * (spacing / scale)
+        heights[rows] = fbm_noise(xs[np.newaxis, :], ys[:, np.newaxis], permutation, octaves, persistence, lacunarity)
+
+    normalize_heights(heights, min_altitude, max_altitude)
+
+    if features:
+        # features are stamped in grid order [ind_x, ind_y] (view of the heights)
+        add_terrain_features(heights[::-1].T, spacing, seed=seed, **features)
+        normalize_heights(heights, min_altitude, max_altitude)
+
+    return heights
+
+
+def normalize_heights(heights, min_altitude, max_altitude):
+    """scale the heights into a range (in place)
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights
+        min_altitude {float} -- lowest height (m)
+        max_altitude {float} -- highest height (m)
+    """
+
+    lowest, highest = heights.min(), heights.max()
+    heights -= lowest
+    heights *= (max_altitude - min_altitude) / max(highest - lowest, 1e-9)
+    heights += min_altitude
+
+
+def create_random_heightmap(output_file, size=(110, 70), spacing=0.5, seed=None, scale=50.0, octaves=4,
+                            persistence=0.5, lacunarity=2.0, min_altitude=-0.5, max_altitude=2.0, features=None):
+    """Creates random heightmap as .csv, the settings are stored in a .yaml file with the same name
+
+    The lower left corner of the terrain is at (0, 0).
+
+    Arguments:
+        output_file {str} -- Path of generated heightmap csv file
+
+    Keyword Arguments:
+        size {()} -- number of grid points along x and y (default: {(110, 70)})
+        spacing {float} -- distance between the grid points (m) (default: {0.5})
+        seed {int} -- seed of the random generator, the same seed creates the same terrain (default: {None}, random)
+        scale {float} -- size of the largest terrain features (m) (default: {50.0})
+        octaves {int} -- number of noise layers (default: {4})
+        persistence {float} -- amplitude factor between the octaves (default: {0.5})
+        lacunarity {float} -- frequency factor between the octaves (default: {2.0})
+        min_altitude {float} -- lowest height of the terrain (m) (default: {-0.5})
+        max_altitude {float} -- highest height of the terrain (m) (default: {2.0})
+        features {dict} -- keyword arguments of add_terrain_features, e.g. crater_density (default: {None}, only noise)
+
+    Returns:
+        int -- the used seed
+    """
+
+    if seed is None:
+        seed = np.random.randint(0, 2 ** 31 - 1)
+
+    settings = dict(
+        size=[int(size[0]), int(size[1])],
+        spacing=float(spacing),
+        seed=int(seed),
+        scale=float(scale),
+        octaves=int(octaves),
+        persistence=float(persistence),
+        lacunarity=float(lacunarity),
+        min_altitude=float(min_altitude),
+        max_altitude=float(max_altitude),
+        features=dict(features or {}),
+    )
+
+    heights = random_heights(**settings)
+    number_of_rows, number_of_cols = heights.shape
+
+    with open(output_file, 'wb') as f:
+        f.write(b"Number of Rows | Number of Columns | Grid spacing rows | Grid spacing columns | Coordinates of the first point in the matrix (x,y)\n")
+        # the first row is the one with the largest y
+        f.write("{} {} {} {} {} {}\n".format(number_of_rows, number_of_cols, spacing, spacing,
+                                             0, (number_of_rows - 1) * spacing).encode('utf8'))
+        np.savetxt(f, heights, fmt="%.5f", delimiter=",")
+
+    # store the settings, so the terrain can be recreated
+    with open(os.path.splitext(output_file)[0] + '.yaml', 'w') as f:
+        yaml.safe_dump(settings, f, default_flow_style=False)
+
+    return seed
 
 
 if __name__ == '__main__':
@@ -95,11 +231,29 @@ if __name__ == '__main__':
 
     # parse command line arguments
     parser = ArgumentParser(
-        description="Creates random heightmap as .csv",
-        formatter_class=ArgumentDefaultsHelpFormatter    
+        description="Creates random heightmap as .csv, the settings (including the seed) are stored in a .yaml file with the same name",
+        formatter_class=ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("-o", "--output", type=str, help = "Path of generated heightmap csv file")
+    parser.add_argument("-o", "--output", type=str, help = "Path of generated heightmap csv file", required=True)
+    parser.add_argument("-s", "--size", type=int, nargs=2, metavar=("NX", "NY"), help = "Number of grid points along x and y", default=[110, 70])
+    parser.add_argument("--spacing", type=float, help = "Distance between the grid points (m)", default=0.5)
+    parser.add_argument("--seed", type=int, help = "Seed of the random generator, random if not given")
+    parser.add_argument("--scale", type=float, help = "Size of the largest terrain features (m)", default=50.0)
+    parser.add_argument("--octaves", type=int, help = "Number of noise layers", default=4)
+    parser.add_argument("--min-altitude", type=float, help = "Lowest height of the terrain (m)", default=-0.5)
+    parser.add_argument("--max-altitude", type=float, help = "Highest height of the terrain (m)", default=2.0)
+    parser.add_argument("--craters", type=float, help = "Average number of craters per square meter", default=0.0)
+    parser.add_argument("--boulders", type=float, help = "Average number of boulders per square meter", default=0.0)
+    parser.add_argument("--slopes", type=int, help = "Number of slopes across the terrain", default=0)
     args = parser.parse_args()
 
-    # generate model
-    create_random_heightmap(args.output)
+    # only noise if no features are requested
+    features = None
+    if args.craters or args.boulders or args.slopes:
+        features = dict(crater_density=args.craters, boulder_density=args.boulders, slopes=args.slopes)
+
+    # generate heightmap
+    seed = create_random_heightmap(args.output, size=args.size, spacing=args.spacing, seed=args.seed, scale=args.scale,
+                                   octaves=args.octaves, min_altitude=args.min_altitude, max_altitude=args.max_altitude,
+                                   features=features)
+    print("Created random heightmap with seed " + str(seed))
@@ -6,135 +6,166 @@ generate the texure and the mesh of a ERC terrain in a specified folder
 
 from collada import source, geometry, material, scene, Collada
 import numpy as np
+from PIL import Image
 import os, sys
+import tempfile
+from multiprocessing import Pool
 from shutil import copyfile
-from rospkg import RosPack
 
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from rover_sim.scripts.generate_gazebo_model import create_gazebo_model
+from rover_sim.scripts.package_path import rover_sim_path
+from rover_sim.scripts.generate_gazebo_model import create_gazebo_model, create_gazebo_heightmap_model
+from rover_sim.scripts.heightmap import read_heightmap
+from rover_sim.scripts.heightmap_cache import load_heightmap, default_cache_dir, file_hash, array_hash, lookup_tile, store_tile, \
+    remove_tile
+from rover_sim.scripts.terrain_decimation import decimate, rtin_grid_size
+from rover_sim.scripts.mesh_writers import mesh_writer
+from rover_sim.scripts.profiling import stage
 
+# file formats of the visual and the collision meshes (stl has no texture coordinates)
+VISUAL_MESH_FORMATS = ('dae', 'obj')
+COLLISION_MESH_FORMATS = ('dae', 'obj', 'stl')
 
-def id(x, y, number_of_rows):
-    """Used to index a 1d-array with 2 indices
+# scripts generating the terrain meshes, the cached meshes are generated again if one of them changes
+MESH_SCRIPTS = ('generate_terrain.py', 'mesh_writers.py', 'terrain_decimation.py')
 
-    Arguments:
-        x {int} -- x value
-        y {int} -- y value
-        number_of_rows {int} -- number of rows in the array
+# hash of the MESH_SCRIPTS, None until it has been calculated
+_mesh_scripts_hash = None
+
+
+def mesh_scripts_hash():
+    """hash of the scripts generating the terrain meshes, part of the key of the cached meshes
 
     Returns:
-        int -- 1d index
+        str -- hex digests of the scripts
     """
 
-    return x * number_of_rows + y
+    global _mesh_scripts_hash
+
+    if _mesh_scripts_hash is None:
+        scripts_folder = os.path.dirname(os.path.abspath(__file__))
+        _mesh_scripts_hash = ' '.join(file_hash(os.path.join(scripts_folder, script)) for script in MESH_SCRIPTS)
+
+    return _mesh_scripts_hash
 
 
 def get_coordinates_from_csv(csv_file_path):
     """This function extracts the coordinates from a csv file based on the provided files of the ERC
 
     Arguments:
-        csv_file_path {str} -- path to the ERC csv file (ver2)
+        csv_file_path {str} -- path to the ERC csv file (ver2 or ver1)
 
     Returns:
         [[[]]] -- 2d array of 3d coordinates
     """
 
-    # read context informations from *.csv file
-    with open(csv_file_path) as fp:
-        for i, line in enumerate(fp):
-            if i != 1:
-                continue
+    return read_heightmap(csv_file_path).coordinates()
 
-            # we are only interested in the spacing and coords_0
-            _, _, spacing_y, spacing_x, x_0, y_0 = np.fromstring(
-                line, dtype=float, sep=' ')
-            break
 
-    # load heights from *.csv file
-    data = np.loadtxt(open(csv_file_path), delimiter=',', skiprows=2)
+def generate_vertex_array(coords):
+    """generate the vertex array out of the coordinates
 
-    # transform the matrix so heights are accessible by intuitive indices
-    data = np.swapaxes(np.flip(data, 0), 0, 1)
+    Arguments:
+        coords {[[[]]]} -- 2d array of 3d coordinates
 
-    # apply threshold (set invalid values to 0)
-    data[data >= 2.8] = 0
+    Returns:
+        [] -- linear array of vertecies
+    """
+
+    return coords.flatten()
 
-    # get dimensions of the matrix
-    number_of_cols, number_of_rows = data.shape
 
-    # convert y_0 to actual coordinate at ind_y=0
-    y_0 -= (number_of_rows-1)*spacing_y
+def generate_gradient_normals(coords):
+    """generate the vertex normals out of the central differences of the coordinates
 
-    # x-Axis
-    # generate vector
-    xs = np.mgrid[:number_of_cols] * spacing_x
-    # add possible offset
-    xs += x_0
-    # generate grid from vector
-    xs = np.stack((xs,) * number_of_rows, axis=-1)
+    Arguments:
+        coords {[[[]]]} -- 2d array of 3d coordinates
 
-    # y-Axis
-    # generate vector
-    ys = np.mgrid[:number_of_rows] * spacing_y
-    # add possible offset
-    ys += y_0
-    # generate grid from vector
-    ys = np.stack((ys,) * number_of_cols, axis=0)
+    Returns:
+        [[[]]] -- 2d array of unnormalized normals (inner vertices only)
+    """
 
-    # coordinates
-    coords = np.stack((xs, ys, data), axis=2)
+    # central differences along both grid axes
+    gradient_x = coords[2:, 1:-1] - coords[:-2, 1:-1]
+    gradient_y = coords[1:-1, 2:] - coords[1:-1, :-2]
 
-    return coords
+    # normal to gradient
+    return np.cross(gradient_x, gradient_y)
 
 
-def generate_vertex_array(coords):
-    """generate the vertex array out of the coordinates
+def generate_area_weighted_normals(coords):
+    """generate the vertex normals as sum of the adjacent face normals weighted by their area
 
     Arguments:
         coords {[[[]]]} -- 2d array of 3d coordinates
 
     Returns:
-        [] -- linear array of vertecies
+        [[[]]] -- 2d array of unnormalized normals (inner vertices only)
     """
 
-    return coords.flatten()
+    # corners of all the cells (same triangulation as in generate_index_array)
+    corner_00 = coords[:-1, :-1]
+    corner_10 = coords[1:, :-1]
+    corner_01 = coords[:-1, 1:]
+    corner_11 = coords[1:, 1:]
+
+    # the length of the cross product is twice the area of the triangle
+    face_1 = np.cross(corner_10 - corner_00, corner_01 - corner_00)
+    face_2 = np.cross(corner_01 - corner_11, corner_10 - corner_11)
+
+    # accumulate the face normals on the vertices of the faces
+    normals = np.zeros_like(coords)
+    normals[:-1, :-1] += face_1
+    normals[1:, :-1] += face_1 + face_2
+    normals[:-1, 1:] += face_1 + face_2
+    normals[1:, 1:] += face_2
+
+    return normals[1:-1, 1:-1]
+
+
+# available methods to calculate the vertex normals
+normal_modes = {
+    'gradient': generate_gradient_normals,
+    'area': generate_area_weighted_normals,
+}
 
 
-def generate_normal_array(coords):
+def generate_normal_array(coords, mode='gradient'):
     """generate the normal array out of the coordinates
 
     Arguments:
         coords {[[[]]]} -- 2d array of 3d coordinates
 
+    Keyword Arguments:
+        mode {str} -- 'gradient' (central differences) or 'area' (area weighted face normals) (default: {'gradient'})
+
     Returns:
         [] -- linear array of normals
     """
 
+    if mode not in normal_modes:
+        raise ValueError('Unknown normal mode: ' + str(mode))
+
     number_of_cols, number_of_rows, _ = coords.shape
 
-    normal_floats = []
-    for x in range(number_of_cols):
-        for y in range(number_of_rows):
-            # edge cases (normal points up)
-            if x == 0 or x == number_of_cols - 1 or y == 0 or y == number_of_rows - 1:
-                normal_floats.append([0, 0, 1])
-                continue
+    # edge cases (normal points up)
+    normals = np.zeros((number_of_cols, number_of_rows, 3), dtype=coords.dtype)
+    normals[..., 2] = 1
 
-            # calculate normal to gradient
-            current_normal = np.cross(coords[x+1, y]-coords[x-1, y],
-                                      coords[x, y+1]-coords[x, y-1])
+    # too small to have inner vertices
+    if number_of_cols < 3 or number_of_rows < 3:
+        return normals.reshape(-1, 3)
 
-            # normalize normal
-            current_normal /= np.linalg.norm(current_normal)
-            normal_floats.append(current_normal)
+    # calculate the normals of all inner vertices at once
+    inner_normals = normal_modes[mode](coords)
 
-    normal_floats = np.array(normal_floats)
+    # normalize normals
+    inner_normals /= np.linalg.norm(inner_normals, axis=-1, keepdims=True)
+    normals[1:-1, 1:-1] = inner_normals
 
-    return normal_floats
+    return normals.reshape(-1, 3)
 
 
 def generate_uv_array(coords):
@@ -155,9 +186,9 @@ def generate_uv_array(coords):
     x = np.squeeze(x)
     y = np.squeeze(y)
 
-    # normalize all the values
-    x /= width
-    y /= height
+    # normalize all the values (without modifying the coordinates)
+    x = x / width
+    y = y / height
 
     # recombine x and y
     uv_coords = np.stack((x, y), axis=2)
@@ -165,6 +196,21 @@ def generate_uv_array(coords):
     return uv_coords.flatten()
 
 
+def index_dtype(number_of_vertices):
+    """smallest index type which is able to address all the vertices
+
+    Arguments:
+        number_of_vertices {int} -- number of vertices in the mesh
+
+    Returns:
+        dtype -- uint32 if possible, else int64
+    """
+
+    if number_of_vertices <= np.iinfo(np.uint32).max:
+        return np.dtype(np.uint32)
+    return np.dtype(np.int64)
+
+
 def generate_index_array(coords):
     """generate the index array for a simple 2d mesh
 
@@ -172,40 +218,212 @@ def generate_index_array(coords):
         coords {[[[]]]} -- 2d array of 3d coordinates
 
     Returns:
-        [] -- linear array of uv indices
+        [[]] -- array of vertex indices, one row (3 indices) per triangle
+    """
+
+    number_of_cols, number_of_rows, _ = coords.shape
+    dtype = index_dtype(number_of_cols * number_of_rows)
+
+    # index of the lower left corner of each cell (ignore last row and col)
+    base = np.arange(number_of_cols - 1, dtype=dtype)[:, np.newaxis] * dtype.type(number_of_rows)
+    base = (base + np.arange(number_of_rows - 1, dtype=dtype)).reshape(-1)
+
+    indices = np.empty((base.size, 2, 3), dtype=dtype)
+    # 1. triangle
+    indices[:, 0, 0] = base
+    indices[:, 0, 1] = base + number_of_rows
+    indices[:, 0, 2] = base + 1
+    # 2. triangle
+    indices[:, 1, 0] = base + number_of_rows + 1
+    indices[:, 1, 1] = base + 1
+    indices[:, 1, 2] = base + number_of_rows
+
+    return indices.reshape(-1, 3)
+
+
+def downsample_coordinates(coords, resolution):
+    """reduce the resolution of the grid by skipping grid points, the border of the terrain is kept
+
+    Arguments:
+        coords {[[[]]]} -- 2d array of 3d coordinates
+        resolution {float} -- target spacing between the remaining grid points (m)
+
+    Returns:
+        [[[]]] -- 2d array of 3d coordinates
     """
 
     number_of_cols, number_of_rows, _ = coords.shape
+    spacing_x = coords[1, 0, 0] - coords[0, 0, 0] if number_of_cols > 1 else resolution
+    spacing_y = coords[0, 1, 1] - coords[0, 0, 1] if number_of_rows > 1 else resolution
+
+    def grid_indices(number_of_points, spacing):
+        step = max(1, int(round(resolution / spacing)))
+        indices = np.arange(0, number_of_points, step)
+        # always keep the last row/col, so the collision mesh covers the whole terrain
+        if indices[-1] != number_of_points - 1:
+            indices = np.append(indices, number_of_points - 1)
+        return indices
+
+    return coords[np.ix_(grid_indices(number_of_cols, spacing_x), grid_indices(number_of_rows, spacing_y))]
+
+
+def resample_heights(heights, size):
+    """resample the heights bilinearly to a square grid covering the same area
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y]
+        size {int} -- number of grid points along each side of the new grid
+
+    Returns:
+        [[]] -- 2d array of heights (size, size)
+    """
+
+    heights = np.asarray(heights, dtype=np.float64)
+    number_of_cols, number_of_rows = heights.shape
+
+    def weights(number_of_points):
+        positions = np.linspace(0, number_of_points - 1, size)
+        lower = np.minimum(positions.astype(int), max(number_of_points - 2, 0))
+        upper = np.minimum(lower + 1, number_of_points - 1)
+        return lower, upper, positions - lower
+
+    x_0, x_1, t_x = weights(number_of_cols)
+    y_0, y_1, t_y = weights(number_of_rows)
+    t_x = t_x[:, np.newaxis]
+
+    # interpolate along x, then along y
+    lower = heights[x_0][:, y_0] * (1 - t_x) + heights[x_1][:, y_0] * t_x
+    upper = heights[x_0][:, y_1] * (1 - t_x) + heights[x_1][:, y_1] * t_x
+
+    return lower * (1 - t_y) + upper * t_y
+
+
+def generate_heightmap_image(heightmap, image_path):
+    """write the heights as 16 bit grayscale png for the native gazebo heightmap geometry
+
+    Gazebo needs a square image with 2^n+1 pixels per side, the heights are resampled accordingly.
+
+    Arguments:
+        heightmap {Heightmap} -- the heights with their context information
+        image_path {str} -- path of the generated png file
+
+    Returns:
+        () -- size (x, y, height range) and pos (center x, center y, lowest height) of the heightmap in the sdf
+    """
+
+    number_of_cols, number_of_rows = heightmap.shape
+    heights = resample_heights(heightmap.heights, rtin_grid_size(number_of_cols, number_of_rows))
+
+    min_height = float(heights.min())
+    height_range = max(float(heights.max()) - min_height, 1e-3)
+    pixels = np.round((heights - min_height) / height_range * np.iinfo(np.uint16).max).astype(np.uint16)
+
+    # the first image row is the one with the largest y
+    Image.fromarray(np.ascontiguousarray(pixels.T[::-1])).save(image_path)
+
+    width = (number_of_cols - 1) * heightmap.spacing[0]
+    depth = (number_of_rows - 1) * heightmap.spacing[1]
+
+    size = [width, depth, height_range]
+    pos = [heightmap.origin[0] + width / 2, heightmap.origin[1] + depth / 2, min_height]
+
+    return size, pos
+
+
+def generate_mesh_arrays(coords, normal_mode='gradient', max_error=None, normals=None, uvs=None, keep_border=False):
+    """generate the vertex, normal, uv and index arrays of the terrain mesh
+
+    Arguments:
+        coords {[[[]]]} -- 2d array of 3d coordinates
 
-    indices = []
-    # iterate over grid (ignore last row and col)
-    for x in range(number_of_cols-1):
-        for y in range(number_of_rows-1):
-            # 1. triangle
-            indices.append([
-                id(x, y, number_of_rows),
-                id(x+1, y, number_of_rows),
-                id(x, y+1, number_of_rows)
-            ])
-            # 2. triangle
-            indices.append([
-                id(x+1, y+1, number_of_rows),
-                id(x, y+1, number_of_rows),
-                id(x+1, y, number_of_rows)
-            ])
-
-    indices = np.array(indices)
-
-    return indices
-
-
-def generate_collada(coords, relative_texture_path):
+    Keyword Arguments:
+        normal_mode {str} -- method used to calculate the vertex normals (default: {'gradient'})
+        max_error {float} -- decimate the mesh with this maximal vertical error (m) (default: {None}, full resolution)
+        normals {[[[]]]} -- 2d array of precalculated normals, e.g. of a tile cut out of a larger terrain (default: {None})
+        uvs {[[[]]]} -- 2d array of precalculated uv coordinates (default: {None})
+        keep_border {bool} -- do not decimate the border of the mesh, so neighbouring tiles fit together (default: {False})
+
+    Returns:
+        () -- vertices (n, 3), normals (n, 3), uvs (n, 2) and triangle indices (m, 3)
+    """
+
+    vertices = generate_vertex_array(coords).reshape(-1, 3)
+    with stage('normals'):
+        normals = generate_normal_array(coords, normal_mode) if normals is None else normals.reshape(-1, 3)
+    uvs = generate_uv_array(coords).reshape(-1, 2) if uvs is None else uvs.reshape(-1, 2)
+
+    if max_error is None:
+        return vertices, normals, uvs, generate_index_array(coords)
+
+    # simplify the grid, the normals of the full resolution grid are kept for shading
+    with stage('decimation'):
+        vertex_indices, indices = decimate(coords[..., 2], max_error, keep_border)
+    indices = indices.astype(index_dtype(len(vertex_indices)))
+
+    return vertices[vertex_indices], normals[vertex_indices], uvs[vertex_indices], indices
+
+
+def generate_collada(coords, relative_texture_path, normal_mode='gradient', shared_indices=False, max_error=None,
+                     normals=None, uvs=None, keep_border=False):
     """generate the pycollada mesh out of the coordinates array
 
     Arguments:
         coords {[[[]]]} -- 2d array of 3d coordinates
         relative_texture_path {str} -- relative path to the texture, relative to the generated collada file
 
+    Keyword Arguments:
+        normal_mode {str} -- method used to calculate the vertex normals (default: {'gradient'})
+        shared_indices {bool} -- vertex, normal and uv inputs share one index stream instead of
+                                 repeating every index for each input (default: {False})
+        max_error {float} -- decimate the mesh with this maximal vertical error (m) (default: {None}, full resolution)
+        normals {[[[]]]} -- 2d array of precalculated normals (default: {None})
+        uvs {[[[]]]} -- 2d array of precalculated uv coordinates (default: {None})
+        keep_border {bool} -- do not decimate the border of the mesh (default: {False})
+
+    Returns:
+        Collada -- final collada mesh
+    """
+
+    vertices, normals, uvs, indices = generate_mesh_arrays(coords, normal_mode, max_error, normals, uvs, keep_border)
+
+    return build_collada(vertices, normals, uvs, indices, relative_texture_path, shared_indices)
+
+
+def generate_mesh(coords, mesh_format, normal_mode='gradient', shared_indices=False, max_error=None, normals=None,
+                  uvs=None, keep_border=False):
+    """generate the mesh of the terrain in a file format which gazebo can load
+
+    The relative path to the texture is passed to the returned writer function, see write_mesh.
+
+    Arguments:
+        coords {[[[]]]} -- 2d array of 3d coordinates
+        mesh_format {str} -- file format of the mesh, 'dae', 'obj' or 'stl'
+
+    Keyword Arguments:
+        see generate_collada
+
+    Returns:
+        function -- writer function, streams the mesh into the file (see write_mesh)
+    """
+
+    vertices, normals, uvs, indices = generate_mesh_arrays(coords, normal_mode, max_error, normals, uvs, keep_border)
+    return mesh_writer(mesh_format, vertices, normals, uvs, indices, shared_indices)
+
+
+def build_collada(vertices, normals, uvs, indices, relative_texture_path, shared_indices=False):
+    """generate the pycollada mesh out of the mesh arrays
+
+    Arguments:
+        vertices {[[]]} -- array of vertices (n, 3)
+        normals {[[]]} -- array of normals (n, 3)
+        uvs {[[]]} -- array of uv coordinates (n, 2)
+        indices {[[]]} -- array of triangles (m, 3)
+        relative_texture_path {str} -- relative path to the texture, relative to the generated collada file
+
+    Keyword Arguments:
+        shared_indices {bool} -- vertex, normal and uv inputs share one index stream instead of
+                                 repeating every index for each input (default: {False})
+
     Returns:
         Collada -- final collada mesh
     """
@@ -215,26 +433,26 @@ def generate_collada(coords, relative_texture_path):
 
     # create source arrays
     vert_src = source.FloatSource(
-        'verts-array', generate_vertex_array(coords), ('X', 'Y', 'Z'))
+        'verts-array', vertices.reshape(-1), ('X', 'Y', 'Z'))
     normal_src = source.FloatSource(
-        'normals-array', generate_normal_array(coords), ('X', 'Y', 'Z'))
+        'normals-array', normals.reshape(-1), ('X', 'Y', 'Z'))
     uv_src = source.FloatSource(
-        'uv-array', generate_uv_array(coords), ('S', 'T'))
+        'uv-array', uvs.reshape(-1), ('S', 'T'))
 
     # create geometry and add the sources
     geom = geometry.Geometry(mesh, 'geometry', 'terrain', [
         vert_src, normal_src, uv_src])
 
     # define inputs to triangle set
+    # (vertex, normal and uv belong to the same grid point, so they can use the same offset)
     input_list = source.InputList()
     input_list.addInput(0, 'VERTEX', '#verts-array')
-    input_list.addInput(1, 'NORMAL', '#normals-array')
-    input_list.addInput(2, 'TEXCOORD', '#uv-array', set='0')
+    input_list.addInput(0 if shared_indices else 1, 'NORMAL', '#normals-array')
+    input_list.addInput(0 if shared_indices else 2, 'TEXCOORD', '#uv-array', set='0')
 
-    # create index array
-    indices = generate_index_array(coords)
-    # repeat each of the entries for vertex, normal, uv
-    indices = np.repeat(indices, 3)
+    if not shared_indices:
+        # repeat each of the entries for vertex, normal, uv
+        indices = np.repeat(indices, 3)
 
     # create triangle set, add it to list of geometries in the mesh
     triset = geom.createTriangleSet(indices, input_list, 'material')
@@ -268,45 +486,267 @@ def generate_collada(coords, relative_texture_path):
     return mesh
 
 
-def generate_terrain(name, csv_file_path, output_folder, model_folder=None):
+def generate_terrain_model(name, coords, output_folder, texture_path, model_folder=None, normal_mode='gradient',
+                           shared_indices=False, max_error=None, collision_resolution=0.5, normals=None, uvs=None,
+                           keep_border=False, cache_dir=None, mesh_format='dae', collision_format=None):
+    """generate the gazebo model of a terrain (or a tile of it) out of the coordinates array
+
+    Arguments:
+        name {str} -- name of the generated model
+        coords {[[[]]]} -- 2d array of 3d coordinates
+        output_folder {str} -- path to the folder in which the model will be generated
+        texture_path {str} -- path to the texture of the terrain
+
+    Keyword Arguments:
+        model_folder {str} -- path to the gazebo model folder (must be parent of output_folder) (default: {None})
+        normal_mode {str} -- method used to calculate the vertex normals (default: {'gradient'})
+        shared_indices {bool} -- write a single index stream for vertex, normal and uv (default: {False})
+        max_error {float} -- decimate the mesh with this maximal vertical error (m) (default: {None}, full resolution)
+        collision_resolution {float} -- grid spacing of the separate collision mesh (m) (default: {0.5})
+        normals {[[[]]]} -- 2d array of precalculated normals (default: {None})
+        uvs {[[[]]]} -- 2d array of precalculated uv coordinates (default: {None})
+        keep_border {bool} -- do not decimate the border of the mesh (default: {False})
+        cache_dir {str} -- reuse and store the generated meshes in this cache folder (default: {None}, no caching)
+        mesh_format {str} -- file format of the visual mesh, 'dae' or 'obj' (default: {'dae'})
+        collision_format {str} -- file format of the collision mesh, 'dae', 'obj' or 'stl' (default: {None}, same as visual)
+    """
+
+    if collision_format is None:
+        collision_format = mesh_format
+
+    _, extension = os.path.splitext(texture_path)
+    relative_texture_path = '../textures/texture' + extension
+
+    # everything the generated meshes depend on
+    options = {
+        'relative_texture_path': relative_texture_path,
+        'normal_mode': normal_mode,
+        'shared_indices': shared_indices,
+        'max_error': max_error,
+        'collision_resolution': collision_resolution,
+        'keep_border': keep_border,
+        'mesh_format': mesh_format,
+        'collision_format': collision_format,
+        'scripts': mesh_scripts_hash(),
+    }
+    key = array_hash([a for a in (coords, normals, uvs) if a is not None], options) if cache_dir else None
+    cached = lookup_tile(cache_dir, key) if cache_dir else None
+
+    # low resolution collision mesh, only worth it if the resolution is actually reduced
+    collision_coords = downsample_coordinates(coords, collision_resolution) if collision_resolution else None
+    if collision_coords is not None and collision_coords.shape == coords.shape:
+        collision_coords = None
+
+    if cached:
+        def cached_files(stem):
+            # a mesh can consist of several files with the same name (e.g. mesh.obj and mesh.mtl)
+            file_names = [f for f in os.listdir(cached) if os.path.splitext(f)[0] == stem]
+
+            def copy(output_file_path, _):
+                for file_name in file_names:
+                    copyfile(os.path.join(cached, file_name), os.path.join(os.path.dirname(output_file_path), file_name))
+
+            return copy if file_names else None
+
+        mesh = cached_files('mesh')
+        collision_mesh = cached_files('collision_mesh')
+
+        if mesh is None or (collision_mesh is None) != (collision_coords is None):
+            # files of the tile have been removed in the meantime, generate it again
+            remove_tile(cache_dir, key)
+            cached = None
+
+    if not cached:
+        # generate mesh
+        with stage('mesh arrays'):
+            mesh = generate_mesh(coords, mesh_format, normal_mode, shared_indices, max_error, normals, uvs, keep_border)
+
+        # generate low resolution collision mesh
+        collision_mesh = None
+        if collision_coords is not None:
+            with stage('collision mesh arrays'):
+                collision_mesh = generate_mesh(collision_coords, collision_format, normal_mode, shared_indices)
+
+    # gazebo model, the meshes are written directly into the model folder
+    created = create_gazebo_model(
+        name=name, 
+        output_folder=output_folder, 
+        template_mesh_vis=mesh, 
+        template_texture=texture_path,
+        template_mesh_col=collision_mesh,
+        model_folder=model_folder,
+        description="Terrain heightmap",
+        mesh_extension='.' + mesh_format,
+        collision_mesh_extension='.' + collision_format
+    )
+
+    if cache_dir and created and not cached:
+        meshes_folder = os.path.join(output_folder, name, 'meshes')
+        files = dict((file_name, os.path.join(meshes_folder, file_name)) for file_name in os.listdir(meshes_folder))
+        with stage('cache'):
+            store_tile(cache_dir, key, files)
+
+
+def generate_tile(kwargs):
+    """generate_terrain_model with keyword arguments, used by the worker processes
+
+    Arguments:
+        kwargs {dict} -- keyword arguments of generate_terrain_model
+    """
+
+    generate_terrain_model(**kwargs)
+
+
+def tile_ranges(number_of_points, number_of_tiles):
+    """split the grid points along one axis into ranges, neighbouring tiles share the grid points on their border
+
+    Arguments:
+        number_of_points {int} -- number of grid points along the axis
+        number_of_tiles {int} -- number of tiles along the axis
+
+    Returns:
+        [()] -- start and stop (exclusive) index of each tile
+    """
+
+    bounds = np.linspace(0, number_of_points - 1, number_of_tiles + 1).round().astype(int)
+    if number_of_tiles < 1 or np.any(np.diff(bounds) < 1):
+        raise ValueError('Can not split {} grid points into {} tiles'.format(number_of_points, number_of_tiles))
+
+    return [(bounds[i], bounds[i + 1] + 1) for i in range(number_of_tiles)]
+
+
+def generate_heightmap_model(name, heightmap, output_folder, texture_path, model_folder=None):
+    """generate a gazebo model using the native heightmap geometry instead of a mesh
+
+    Arguments:
+        name {str} -- name of the generated model
+        heightmap {Heightmap} -- the heights with their context information
+        output_folder {str} -- path to the folder in which the model will be generated
+        texture_path {str} -- path to the texture of the terrain
+
+    Keyword Arguments:
+        model_folder {str} -- path to the gazebo model folder (must be parent of output_folder) (default: {None})
+    """
+
+    handle, image_path = tempfile.mkstemp(suffix='.png', prefix='heightmap_')
+    os.close(handle)
+
+    try:
+        size, pos = generate_heightmap_image(heightmap, image_path)
+
+        create_gazebo_heightmap_model(
+            name=name,
+            output_folder=output_folder,
+            heightmap_image=image_path,
+            template_texture=texture_path,
+            size=size,
+            pos=pos,
+            model_folder=model_folder,
+            description="Terrain heightmap"
+        )
+    finally:
+        os.remove(image_path)
+
+
+def generate_terrain(name, csv_file_path, output_folder, model_folder=None, normal_mode='gradient', shared_indices=False,
+                     use_cache=True, max_error=None, collision_resolution=0.5, tiles=None, jobs=1, native_heightmap=False,
+                     cache_dir=None, mesh_format='dae', collision_format=None):
     """generate the texture and the mesh of a ERC terrain in a specified folder
 
     Arguments:
         name {str} -- name of the generated terrain model
-        csv_file_path {str} -- path to the ERC csv file (ver2)
+        csv_file_path {str} -- path to the ERC csv file (ver2 or ver1)
         output_folder {str} -- path to the folder in which the model will be generated
         model_folder {str} -- path to the gazebo model folder (must be parent of output_folder) (default: {None})
+        normal_mode {str} -- method used to calculate the vertex normals, 'gradient' or 'area' (default: {'gradient'})
+        shared_indices {bool} -- write a single index stream for vertex, normal and uv (default: {False})
+        use_cache {bool} -- use the binary heightmap and mesh cache instead of generating everything every time (default: {True})
+        max_error {float} -- decimate the mesh with this maximal vertical error (m) (default: {None}, full resolution)
+        collision_resolution {float} -- grid spacing of the separate collision mesh (m),
+                                        the visual mesh is used for collision if None (default: {0.5})
+        tiles {()} -- split the terrain into (nx, ny) tile models named <name>_<i>_<j> (default: {None}, single model)
+        jobs {int} -- number of processes generating the tiles in parallel (default: {1})
+        native_heightmap {bool} -- use the gazebo heightmap geometry (16 bit png) instead of a mesh,
+                                   the mesh options are ignored (default: {False})
+        cache_dir {str} -- path to the cache folder, can be shared by several terrains
+                           (default: {None}, folder '.cache' next to the csv file)
+        mesh_format {str} -- file format of the visual mesh, 'dae' or 'obj' (default: {'dae'})
+        collision_format {str} -- file format of the collision mesh, 'dae', 'obj' or 'stl' (default: {None}, same as visual)
+
+    Returns:
+        [str] -- names of the generated models
     """
 
-    # read coordinates
-    coords = get_coordinates_from_csv(csv_file_path)
+    # read heights
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_file_path)
+    with stage('parse'):
+        heightmap = load_heightmap(csv_file_path, use_cache=use_cache, cache_dir=cache_dir)
 
     # TODO: generate texture (currently only copy of resources)
-    texture_path = os.path.join(rover_sim_dir, 'resources/terrain/texture.jpg')
-    _, extension = os.path.splitext(texture_path)
+    texture_path = os.path.join(rover_sim_path(), 'resources/terrain/texture.jpg')
     if not os.path.exists(texture_path):
         raise ValueError('The texture file is missing in the folder ' + texture_path)
 
-    relative_texture_path = '../textures/texture' + extension
+    if native_heightmap:
+        if tiles is not None:
+            raise ValueError('Tiles are not supported for the native gazebo heightmap')
+        generate_heightmap_model(name, heightmap, output_folder, texture_path, model_folder)
+        return [name]
 
-    temp_mesh = '/tmp/terrain_temp.dae'
+    coords = heightmap.coordinates()
 
-    # generate mesh
-    mesh = generate_collada(coords, relative_texture_path)
-    # save collada to file
-    mesh.write(temp_mesh)
+    if not use_cache:
+        cache_dir = None
 
-    # gazebo model
-    create_gazebo_model(
-        name=name, 
-        output_folder=output_folder, 
-        template_mesh_vis=temp_mesh, 
-        template_texture=texture_path,
+    options = dict(
+        output_folder=output_folder,
+        texture_path=texture_path,
         model_folder=model_folder,
-        description="Terrain heightmap"
+        normal_mode=normal_mode,
+        shared_indices=shared_indices,
+        max_error=max_error,
+        collision_resolution=collision_resolution,
+        cache_dir=cache_dir,
+        mesh_format=mesh_format,
+        collision_format=collision_format
     )
 
-    os.remove(temp_mesh)
+    if tiles is None:
+        generate_terrain_model(name, coords, **options)
+        return [name]
+
+    # normals and uvs of the whole terrain, so there are no seams between the tiles
+    number_of_cols, number_of_rows, _ = coords.shape
+    with stage('normals'):
+        normals = generate_normal_array(coords, normal_mode).reshape(number_of_cols, number_of_rows, 3)
+    uvs = generate_uv_array(coords).reshape(number_of_cols, number_of_rows, 2)
+
+    tasks = []
+    for i, (start_x, stop_x) in enumerate(tile_ranges(number_of_cols, tiles[0])):
+        for j, (start_y, stop_y) in enumerate(tile_ranges(number_of_rows, tiles[1])):
+            tile = dict(options)
+            tile.update(
+                name='{}_{}_{}'.format(name, i, j),
+                coords=coords[start_x:stop_x, start_y:stop_y],
+                normals=normals[start_x:stop_x, start_y:stop_y],
+                uvs=uvs[start_x:stop_x, start_y:stop_y],
+                keep_border=True
+            )
+            tasks.append(tile)
+
+    if jobs > 1:
+        pool = Pool(jobs)
+        try:
+            pool.map(generate_tile, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for tile in tasks:
+            generate_tile(tile)
+
+    return [tile['name'] for tile in tasks]
 
 
 if __name__ == '__main__':
@@ -315,8 +755,8 @@ if __name__ == '__main__':
     
     # default values
     csv_file_path = os.path.join(
-        rover_sim_dir, 'providedFiles/erc2018final/DTM01_v2.txt')
-    output_folder = os.path.join(rover_sim_dir, 'models/terrain')
+        rover_sim_path(), 'providedFiles/erc2018final/DTM01_v2.txt')
+    output_folder = os.path.join(rover_sim_path(), 'models/terrain')
     terrain_name = 'terrain'
 
     # parse command line arguments
@@ -324,10 +764,23 @@ if __name__ == '__main__':
         description="generate a gazebo model with texture and mesh of a ERC terrain in a specified folder",
         formatter_class=ArgumentDefaultsHelpFormatter
     )
-    parser.add_argument("-i", "--input", type=str, help="path to the ERC csv file (ver2)", default=csv_file_path)
+    parser.add_argument("-i", "--input", type=str, help="path to the ERC csv file (ver2 or ver1)", default=csv_file_path)
     parser.add_argument("-o", "--output", type=str, help="path to the folder in which the model will be generated", default=output_folder)
     parser.add_argument("-n", "--name", type=str, help="name of the terrain collada file", default=terrain_name)
+    parser.add_argument("--normals", type=str, help="method used to calculate the vertex normals", choices=sorted(normal_modes), default='gradient')
+    parser.add_argument("--shared-indices", action="store_true", help="write a single index stream for vertex, normal and uv (smaller mesh file)")
+    parser.add_argument("--no-cache", action="store_true", help="always parse the heightmap csv file, do not use the binary cache")
+    parser.add_argument("-e", "--max-error", type=float, help="decimate the mesh with this maximal vertical error (m), full resolution if not given")
+    parser.add_argument("-c", "--collision-resolution", type=float, help="grid spacing of the separate collision mesh (m), 0 to use the visual mesh for collision", default=0.5)
+    parser.add_argument("-t", "--tiles", type=int, nargs=2, metavar=("NX", "NY"), help="split the terrain into NX x NY tile models")
+    parser.add_argument("-j", "--jobs", type=int, help="number of processes generating the tiles in parallel", default=1)
+    parser.add_argument("--native-heightmap", action="store_true", help="use the gazebo heightmap geometry (16 bit png) instead of a mesh")
+    parser.add_argument("--mesh-format", type=str, help="file format of the visual mesh", choices=VISUAL_MESH_FORMATS, default='dae')
+    parser.add_argument("--collision-format", type=str, help="file format of the collision mesh, same as the visual mesh if not given", choices=COLLISION_MESH_FORMATS)
     args = parser.parse_args()
 
     # generate terrain
-    generate_terrain(name=args.name, csv_file_path=args.input, output_folder=args.output)
+    generate_terrain(name=args.name, csv_file_path=args.input, output_folder=args.output,
+                     normal_mode=args.normals, shared_indices=args.shared_indices, use_cache=not args.no_cache, max_error=args.max_error,
+                     collision_resolution=args.collision_resolution, tiles=args.tiles, jobs=args.jobs,
+                     native_heightmap=args.native_heightmap, mesh_format=args.mesh_format, collision_format=args.collision_format)
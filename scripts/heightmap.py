@@ -0,0 +1,457 @@
+#!/usr/bin/env python
+"""
+read the heightmaps of the ERC (ver2 matrix format or ver1 list of X,Y,H points) into a regular grid of heights
+"""
+
+import numpy as np
+
+# heights above this value mark invalid points in the ERC files
+INVALID_HEIGHT_THRESHOLD = 2.8
+
+# first line of the ERC point list files (ver1), spaces removed
+POINT_LIST_HEADER = b'X,Y,H'
+
+# coordinates of a point list are rounded to this many decimals to find the grid spacing
+COORDINATE_DECIMALS = 6
+
+# a point list is irregular if the grid of its smallest coordinate steps has more cells per point
+MAX_CELLS_PER_POINT = 4
+
+
+class Heightmap(object):
+    """heights of a terrain on a regular grid
+
+    The heights are indexed by [ind_x, ind_y], the point heights[0, 0] is the
+    corner with the smallest x and y coordinates (origin).
+
+    Attributes:
+        heights {[[]]} -- 2d float32 array of heights (invalid values are set to 0)
+        spacing {()} -- grid spacing (x, y)
+        origin {()} -- coordinates of heights[0, 0] (x, y)
+        valid {[[]]} -- 2d boolean array, False for the invalid points of the ERC file (None if all points are valid)
+    """
+
+    def __init__(self, heights, spacing, origin, valid=None):
+        self.heights = heights
+        self.spacing = tuple(float(s) for s in spacing)
+        self.origin = tuple(float(o) for o in origin)
+        self.valid = valid
+
+    @property
+    def shape(self):
+        """number of grid points (x, y)"""
+        return self.heights.shape
+
+    @property
+    def xs(self):
+        """x coordinates of the grid points along the x axis"""
+        return self.origin[0] + np.arange(self.shape[0]) * self.spacing[0]
+
+    @property
+    def ys(self):
+        """y coordinates of the grid points along the y axis"""
+        return self.origin[1] + np.arange(self.shape[1]) * self.spacing[1]
+
+    def coordinates(self):
+        """generate the 3d coordinates of all the grid points
+
+        Returns:
+            [[[]]] -- 2d array of 3d coordinates
+        """
+
+        xs, ys = np.meshgrid(self.xs, self.ys, indexing='ij')
+        return np.stack((xs, ys, self.heights.astype(xs.dtype)), axis=2)
+
+    def sample(self, xs, ys):
+        """interpolate the heights bilinearly at arbitrary points
+
+        Points outside of the grid and points next to invalid grid points get NaN.
+
+        Arguments:
+            xs {[]} -- x coordinates of the points (array or scalar)
+            ys {[]} -- y coordinates of the points (same shape as xs)
+
+        Returns:
+            [] -- float64 array of heights with the shape of xs and ys (float for scalar coordinates)
+        """
+
+        xs, ys = np.broadcast_arrays(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+        number_of_cols, number_of_rows = self.shape
+
+        # continuous grid indices of the points
+        grid_x = (xs - self.origin[0]) / self.spacing[0]
+        grid_y = (ys - self.origin[1]) / self.spacing[1]
+
+        # snap points to the grid lines they are on, up to rounding errors
+        grid_x = np.where(np.abs(grid_x - np.round(grid_x)) < 1e-9, np.round(grid_x), grid_x)
+        grid_y = np.where(np.abs(grid_y - np.round(grid_y)) < 1e-9, np.round(grid_y), grid_y)
+
+        # bounds check (NaN coordinates are outside as well)
+        inside = (grid_x >= 0) & (grid_x <= number_of_cols - 1) & (grid_y >= 0) & (grid_y <= number_of_rows - 1)
+        grid_x = np.where(inside, grid_x, 0)
+        grid_y = np.where(inside, grid_y, 0)
+
+        # lower left corner of the grid cell and the position inside of it
+        x_0 = np.minimum(grid_x.astype(np.int64), max(number_of_cols - 2, 0))
+        y_0 = np.minimum(grid_y.astype(np.int64), max(number_of_rows - 2, 0))
+        x_1 = np.minimum(x_0 + 1, number_of_cols - 1)
+        y_1 = np.minimum(y_0 + 1, number_of_rows - 1)
+        t_x = grid_x - x_0
+        t_y = grid_y - y_0
+
+        heights = np.zeros(xs.shape)
+        for ind_x, ind_y, weight in ((x_0, y_0, (1 - t_x) * (1 - t_y)),
+                                     (x_1, y_0, t_x * (1 - t_y)),
+                                     (x_0, y_1, (1 - t_x) * t_y),
+                                     (x_1, y_1, t_x * t_y)):
+            heights += weight * self.heights[ind_x, ind_y]
+
+            # invalid grid points only matter if they contribute to the height
+            if self.valid is not None:
+                inside &= self.valid[ind_x, ind_y] | (weight == 0)
+
+        heights[~inside] = np.nan
+
+        return heights if heights.ndim else float(heights)
+
+
+def read_header(csv_file_path):
+    """read the context information from the header of an ERC csv file (ver2)
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC csv file (ver2)
+
+    Returns:
+        () -- spacing_y, spacing_x and the coordinates of the first point in the matrix (x_0, y_0)
+    """
+
+    with open(csv_file_path) as fp:
+        # first line only contains the description of the values
+        fp.readline()
+        _, _, spacing_y, spacing_x, x_0, y_0 = np.fromstring(fp.readline(), dtype=float, sep=' ')
+
+    return (spacing_y, spacing_x, x_0, y_0)
+
+
+def parse_rows(text, dtype=np.float32):
+    """parse comma separated rows of heights in one go
+
+    Arguments:
+        text {bytes} -- lines of comma separated values
+
+    Keyword Arguments:
+        dtype {dtype} -- type of the values (default: {np.float32})
+
+    Returns:
+        [[]] -- 2d array, one row per line
+    """
+
+    text = text.replace(b'\r', b'').strip()
+    if not text:
+        return np.empty((0, 0), dtype=dtype)
+
+    number_of_lines = text.count(b'\n') + 1
+    # the parser needs a separator between all the values
+    values = np.fromstring(text.replace(b'\n', b','), dtype=dtype, sep=',')
+
+    if values.size % number_of_lines:
+        raise ValueError('The rows of the heightmap do not have the same length')
+
+    return values.reshape(number_of_lines, -1)
+
+
+def iter_rows(csv_file_path, chunk_rows=1024):
+    """read the heights of an ERC csv file (ver2) chunk by chunk
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC csv file (ver2)
+
+    Keyword Arguments:
+        chunk_rows {int} -- number of rows (lines) per chunk (default: {1024})
+
+    Yields:
+        () -- index of the first row of the chunk and the 2d float32 array of the rows (in file order)
+    """
+
+    with open(csv_file_path, 'rb') as fp:
+        # skip header
+        fp.readline()
+        fp.readline()
+
+        first_row = 0
+        lines = []
+        for line in fp:
+            if not line.strip():
+                continue
+            lines.append(line)
+            if len(lines) == chunk_rows:
+                yield first_row, parse_rows(b''.join(lines))
+                first_row += len(lines)
+                lines = []
+
+        if lines:
+            yield first_row, parse_rows(b''.join(lines))
+
+
+def count_rows_and_cols(csv_file_path):
+    """get the dimensions of the height matrix without parsing all the values
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC csv file (ver2)
+
+    Returns:
+        () -- number of rows and number of columns
+    """
+
+    number_of_rows = 0
+    number_of_cols = 0
+    with open(csv_file_path, 'rb') as fp:
+        fp.readline()
+        fp.readline()
+        for line in fp:
+            if not line.strip():
+                continue
+            if not number_of_rows:
+                number_of_cols = parse_rows(line).shape[1]
+            number_of_rows += 1
+
+    return number_of_rows, number_of_cols
+
+
+def is_point_list(csv_file_path):
+    """check if an ERC file is a list of X,Y,H points (ver1) instead of a matrix (ver2)
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC file
+
+    Returns:
+        bool -- True for a point list
+    """
+
+    with open(csv_file_path, 'rb') as fp:
+        return fp.readline().replace(b' ', b'').strip().upper() == POINT_LIST_HEADER
+
+
+def grid_spacing(coordinates):
+    """smallest step between the distinct coordinates along an axis
+
+    Arguments:
+        coordinates {[]} -- coordinates of the points along the axis
+
+    Returns:
+        float -- the spacing, None if all points have the same coordinate
+    """
+
+    steps = np.diff(np.unique(np.round(coordinates, COORDINATE_DECIMALS)))
+    return round(float(steps.min()), COORDINATE_DECIMALS) if len(steps) else None
+
+
+def interpolate_rows(heights, known):
+    """interpolate the unknown heights of every row linearly between the closest known heights of the row
+
+    Heights outside of the first and last known height get the closest known height.
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights
+        known {[[]]} -- 2d boolean array, True for the known heights
+
+    Returns:
+        () -- 2d array of interpolated heights and 2d boolean array, False if the row has no known height
+    """
+
+    number_of_rows, length = heights.shape
+    positions = np.arange(length)
+    rows = np.arange(number_of_rows)[:, np.newaxis]
+
+    # index of the closest known height before and after every point
+    previous = np.maximum.accumulate(np.where(known, positions, -1), axis=1)
+    following = np.minimum.accumulate(np.where(known, positions, length)[:, ::-1], axis=1)[:, ::-1]
+    has_previous = previous >= 0
+    has_following = following < length
+
+    previous_heights = heights[rows, np.maximum(previous, 0)]
+    following_heights = heights[rows, np.minimum(following, length - 1)]
+
+    t = (positions - previous) / np.maximum(following - previous, 1).astype(np.float64)
+    interpolated = np.where(has_previous & has_following, previous_heights + t * (following_heights - previous_heights),
+                            np.where(has_previous, previous_heights, following_heights))
+
+    return interpolated, has_previous | has_following
+
+
+def fill_missing(heights, known):
+    """fill the unknown heights of a grid by interpolating the known heights along x and y
+
+    Points with known heights on both axes get the mean of both interpolations,
+    points without known heights in their row and column are filled from the newly filled points.
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights (changed in place)
+        known {[[]]} -- 2d boolean array, True for the known heights
+
+    Returns:
+        [[]] -- the heights
+    """
+
+    if not known.any():
+        raise ValueError('The heightmap has no valid points')
+
+    known = known.copy()
+    while not known.all():
+        along_y, found_y = interpolate_rows(heights, known)
+        along_x, found_x = interpolate_rows(heights.T, known.T)
+        along_x, found_x = along_x.T, found_x.T
+
+        missing = ~known
+        both = missing & found_x & found_y
+        heights[both] = (along_x[both] + along_y[both]) / 2
+
+        only_x = missing & found_x & ~found_y
+        heights[only_x] = along_x[only_x]
+        only_y = missing & found_y & ~found_x
+        heights[only_y] = along_y[only_y]
+
+        known |= found_x | found_y
+
+    return heights
+
+
+def read_point_list(csv_file_path, spacing=None):
+    """read an ERC point list (ver1, lines of X,Y,H) into a heightmap
+
+    The points are binned into the grid cell closest to them, several points in a cell are averaged.
+    Cells without a point (missing or irregular points) are interpolated from the surrounding valid cells,
+    they are invalid if most of the surrounding cells are invalid. Cells with only invalid points stay invalid.
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC point list (ver1)
+
+    Keyword Arguments:
+        spacing {()} -- grid spacing (x, y) (default: {None}, smallest step between the coordinates of the points,
+                        for irregular points the mean distance between the points)
+
+    Returns:
+        Heightmap -- the heights with their context information
+    """
+
+    with open(csv_file_path, 'rb') as fp:
+        # first line only contains the names of the columns
+        fp.readline()
+        points = parse_rows(fp.read(), dtype=np.float64)
+
+    if points.shape[1:] != (3,):
+        raise ValueError('The point list needs the three columns X,Y,H: ' + csv_file_path)
+
+    xs, ys, hs = points.T
+    origin = (float(xs.min()), float(ys.min()))
+    extent = (float(xs.max()) - origin[0], float(ys.max()) - origin[1])
+
+    if spacing is None:
+        spacing = [grid_spacing(xs), grid_spacing(ys)]
+        spacing = [s or other or 1.0 for s, other in zip(spacing, spacing[::-1])]
+
+        # the smallest steps of irregular points would give a huge grid
+        number_of_cells = (extent[0] / spacing[0] + 1) * (extent[1] / spacing[1] + 1)
+        if number_of_cells > MAX_CELLS_PER_POINT * len(points):
+            mean_distance = np.sqrt(max(extent[0], spacing[0]) * max(extent[1], spacing[1]) / len(points))
+            spacing = [mean_distance, mean_distance]
+    spacing = tuple(float(s) for s in spacing)
+
+    # closest grid point of every point
+    ind_x = np.round((xs - origin[0]) / spacing[0]).astype(np.int64)
+    ind_y = np.round((ys - origin[1]) / spacing[1]).astype(np.int64)
+    shape = (int(ind_x.max()) + 1, int(ind_y.max()) + 1)
+    cells = ind_x * shape[1] + ind_y
+
+    # mean of the valid points in every cell
+    valid_points = hs < INVALID_HEIGHT_THRESHOLD
+    counts = np.bincount(cells[valid_points], minlength=shape[0] * shape[1]).reshape(shape)
+    sums = np.bincount(cells[valid_points], hs[valid_points], minlength=shape[0] * shape[1]).reshape(shape)
+    known = counts > 0
+    heights = np.where(known, sums / np.maximum(counts, 1), 0)
+
+    # cells without any point (missing or irregular points) take the validity of the surrounding cells
+    has_points = np.zeros(shape, dtype=bool)
+    has_points.flat[cells] = True
+    valid = known.copy()
+
+    missing = ~has_points
+    if missing.any():
+        validity = fill_missing(known.astype(np.float64), has_points)
+        valid |= missing & (validity >= 0.5)
+
+        # only the valid points are used for the interpolation of the heights
+        if known.any():
+            fill_missing(heights, known)
+
+    heights[~valid] = 0
+
+    return Heightmap(heights.astype(np.float32), spacing, origin, None if valid.all() else valid)
+
+
+def read_heightmap(csv_file_path, chunk_rows=None, out=None):
+    """read an ERC csv file (ver2 matrix or ver1 point list, see read_point_list) into a heightmap
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC csv file (ver2 or ver1)
+
+    Keyword Arguments:
+        chunk_rows {int} -- stream the file in chunks of this many rows instead of reading it at once,
+                            point lists are always read at once (default: {None})
+        out {[[]]} -- array to store the heights in, e.g. a np.memmap for huge files (shape (cols, rows)) (default: {None})
+
+    Returns:
+        Heightmap -- the heights with their context information
+    """
+
+    if is_point_list(csv_file_path):
+        heightmap = read_point_list(csv_file_path)
+        if out is not None:
+            if out.shape != heightmap.shape:
+                raise ValueError('The output array has the wrong shape, expected ' + str(heightmap.shape))
+            out[...] = heightmap.heights
+            heightmap.heights = out
+        return heightmap
+
+    spacing_y, spacing_x, x_0, y_0 = read_header(csv_file_path)
+
+    if chunk_rows is None and out is None:
+        # load all the heights at once
+        with open(csv_file_path, 'rb') as fp:
+            fp.readline()
+            fp.readline()
+            data = parse_rows(fp.read())
+
+        # transform the matrix so heights are accessible by intuitive indices
+        heights = np.ascontiguousarray(np.swapaxes(np.flip(data, 0), 0, 1))
+
+        # apply threshold (set invalid values to 0)
+        valid = heights < INVALID_HEIGHT_THRESHOLD
+        heights[~valid] = 0
+    else:
+        number_of_rows, number_of_cols = count_rows_and_cols(csv_file_path)
+
+        if out is None:
+            out = np.empty((number_of_cols, number_of_rows), dtype=np.float32)
+        elif out.shape != (number_of_cols, number_of_rows):
+            raise ValueError('The output array has the wrong shape, expected ' + str((number_of_cols, number_of_rows)))
+        heights = out
+        valid = np.empty((number_of_cols, number_of_rows), dtype=bool)
+
+        for first_row, rows in iter_rows(csv_file_path, chunk_rows or 1024):
+            if rows.shape[1] != number_of_cols:
+                raise ValueError('The rows of the heightmap do not have the same length')
+
+            # apply threshold (set invalid values to 0)
+            rows_valid = rows < INVALID_HEIGHT_THRESHOLD
+            rows[~rows_valid] = 0
+
+            # the first row in the file is the one with the largest y
+            last_y = number_of_rows - first_row
+            heights[:, last_y - rows.shape[0]:last_y] = rows[::-1].T
+            valid[:, last_y - rows.shape[0]:last_y] = rows_valid[::-1].T
+
+    # convert y_0 to actual coordinate at ind_y=0
+    y_0 -= (heights.shape[1] - 1) * spacing_y
+
+    return Heightmap(heights, (spacing_x, spacing_y), (x_0, y_0), None if valid.all() else valid)
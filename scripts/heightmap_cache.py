@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+"""
+binary cache for parsed heightmaps, so the csv files only have to be parsed once
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from rover_sim.scripts.heightmap import Heightmap, read_heightmap
+
+# name of the cache folder (placed next to the heightmap csv file)
+CACHE_FOLDER_NAME = '.cache'
+
+# increase if the format or the processing of the cached heights changes
+CACHE_VERSION = 2
+
+# the least recently used entries are removed if the cache exceeds this size (bytes)
+DEFAULT_MAX_CACHE_SIZE = 512 * 1024 * 1024
+
+
+def default_cache_dir(csv_file_path):
+    """path of the cache folder next to a heightmap csv file
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC csv file
+
+    Returns:
+        str -- path to the cache folder
+    """
+
+    return os.path.join(os.path.dirname(os.path.abspath(csv_file_path)), CACHE_FOLDER_NAME)
+
+
+def file_hash(file_path, block_size=1024 * 1024):
+    """calculate the sha1 hash of the content of a file
+
+    Arguments:
+        file_path {str} -- path to the file
+
+    Keyword Arguments:
+        block_size {int} -- number of bytes read at once (default: {1024 * 1024})
+
+    Returns:
+        str -- hex digest of the content
+    """
+
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+
+def entry_paths(cache_dir, content_hash):
+    """paths of the heights array, the valid mask and the metadata of a cache entry
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        content_hash {str} -- hash of the heightmap csv file
+
+    Returns:
+        () -- path to the .npy file of the heights, to the .npy file of the valid mask
+              (only present if there are invalid points) and to the .json file
+    """
+
+    base = os.path.join(cache_dir, 'heightmap-' + content_hash)
+    return base + '.npy', base + '-valid.npy', base + '.json'
+
+
+def read_metadata(metadata_path):
+    """read the metadata of a cache entry
+
+    Arguments:
+        metadata_path {str} -- path to the .json file of the entry
+
+    Returns:
+        dict -- the metadata, None if it is missing, broken or of an old cache version
+    """
+
+    try:
+        with open(metadata_path) as fp:
+            metadata = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+
+    if metadata.get('version') != CACHE_VERSION:
+        return None
+
+    return metadata
+
+
+def default_permissions(path):
+    """give a file or folder created by tempfile (only accessible by the owner) the permissions
+    of a normally created one, as given by the umask
+
+    Arguments:
+        path {str} -- path to the file or folder
+    """
+
+    # the umask can only be read by setting it
+    umask = os.umask(0)
+    os.umask(umask)
+
+    os.chmod(path, (0o777 if os.path.isdir(path) else 0o666) & ~umask)
+
+
+def write_atomic(file_path, write):
+    """write a file in the cache atomically, so concurrent builds never see half written entries
+
+    Arguments:
+        file_path {str} -- path of the file
+        write {function} -- called with the opened (binary) file object
+    """
+
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as fp:
+            write(fp)
+        default_permissions(temp_path)
+        os.rename(temp_path, file_path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def write_metadata(metadata_path, metadata):
+    """write the metadata of a cache entry
+
+    Arguments:
+        metadata_path {str} -- path to the .json file of the entry
+        metadata {dict} -- the metadata
+    """
+
+    write_atomic(metadata_path, lambda fp: fp.write(json.dumps(metadata, indent=2, sort_keys=True).encode('utf8')))
+
+
+def list_entries(cache_dir):
+    """find all the valid entries in the cache
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+
+    Returns:
+        [()] -- list of (content hash, metadata) tuples
+    """
+
+    if not os.path.isdir(cache_dir):
+        return []
+
+    entries = []
+    for file_name in os.listdir(cache_dir):
+        if not (file_name.startswith('heightmap-') and file_name.endswith('.json')):
+            continue
+
+        content_hash = file_name[len('heightmap-'):-len('.json')]
+        metadata = read_metadata(os.path.join(cache_dir, file_name))
+        if metadata is not None:
+            entries.append((content_hash, metadata))
+
+    return entries
+
+
+def remove_entry(cache_dir, content_hash):
+    """remove an entry from the cache
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        content_hash {str} -- hash of the heightmap csv file
+    """
+
+    for path in entry_paths(cache_dir, content_hash):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def evict(cache_dir, max_cache_size, keep=None):
+    """remove the least recently used entries until the cache is smaller than max_cache_size
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        max_cache_size {int} -- maximal size of the cache (bytes)
+
+    Keyword Arguments:
+        keep {str} -- hash of an entry which should not be removed (default: {None})
+    """
+
+    entries = []
+    for content_hash, _ in list_entries(cache_dir):
+        array_path, valid_path, metadata_path = entry_paths(cache_dir, content_hash)
+        try:
+            size = os.path.getsize(array_path) + os.path.getsize(metadata_path)
+            last_used = os.path.getmtime(metadata_path)
+        except OSError:
+            continue
+        if os.path.exists(valid_path):
+            size += os.path.getsize(valid_path)
+        entries.append((last_used, size, content_hash))
+
+    total_size = sum(size for _, size, _ in entries)
+
+    # oldest entries first
+    for _, size, content_hash in sorted(entries):
+        if total_size <= max_cache_size:
+            break
+        if content_hash == keep:
+            continue
+
+        print('Removing heightmap ' + content_hash + ' from cache')
+        remove_entry(cache_dir, content_hash)
+        total_size -= size
+
+
+def forget_source(cache_dir, source_path, content_hash):
+    """invalidate the entries of a heightmap file which has changed since it was cached
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        source_path {str} -- absolute path to the heightmap csv file
+        content_hash {str} -- current hash of the heightmap csv file
+    """
+
+    for other_hash, metadata in list_entries(cache_dir):
+        if other_hash == content_hash or source_path not in metadata['sources']:
+            continue
+
+        del metadata['sources'][source_path]
+        if metadata['sources']:
+            write_metadata(entry_paths(cache_dir, other_hash)[2], metadata)
+        else:
+            # no heightmap file refers to this content anymore
+            remove_entry(cache_dir, other_hash)
+
+
+def load_heightmap(csv_file_path, use_cache=True, cache_dir=None, max_cache_size=DEFAULT_MAX_CACHE_SIZE):
+    """read a heightmap, use the binary cache if the csv file has been parsed before
+
+    Cached heights are memory mapped (read only).
+
+    Arguments:
+        csv_file_path {str} -- path to the ERC csv file (ver2 or ver1)
+
+    Keyword Arguments:
+        use_cache {bool} -- use and update the cache, otherwise always parse the csv file (default: {True})
+        cache_dir {str} -- path to the cache folder (default: {None}, folder '.cache' next to the csv file)
+        max_cache_size {int} -- maximal size of the cache (bytes) (default: {DEFAULT_MAX_CACHE_SIZE})
+
+    Returns:
+        Heightmap -- the heights with their context information
+    """
+
+    if not use_cache:
+        return read_heightmap(csv_file_path)
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir(csv_file_path)
+
+    source_path = os.path.abspath(csv_file_path)
+    stat = os.stat(source_path)
+    source_info = [stat.st_size, stat.st_mtime]
+
+    # fast path: unchanged file (same size and modification time), no need to hash it
+    content_hash = None
+    for other_hash, metadata in list_entries(cache_dir):
+        if metadata['sources'].get(source_path) == source_info:
+            content_hash = other_hash
+            break
+
+    if content_hash is None:
+        content_hash = file_hash(source_path)
+
+    array_path, valid_path, metadata_path = entry_paths(cache_dir, content_hash)
+    metadata = read_metadata(metadata_path)
+
+    if (metadata is not None and os.path.exists(array_path)
+            and (metadata['all_valid'] or os.path.exists(valid_path))):
+        heights = np.load(array_path, mmap_mode='r')
+        valid = None if metadata['all_valid'] else np.load(valid_path, mmap_mode='r')
+        heightmap = Heightmap(heights, metadata['spacing'], metadata['origin'], valid)
+    else:
+        # cache miss: parse the csv file and store the result
+        heightmap = read_heightmap(csv_file_path)
+
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+        write_atomic(array_path, lambda fp: np.save(fp, heightmap.heights))
+        if heightmap.valid is not None:
+            write_atomic(valid_path, lambda fp: np.save(fp, heightmap.valid))
+        metadata = {
+            'version': CACHE_VERSION,
+            'hash': content_hash,
+            'spacing': heightmap.spacing,
+            'origin': heightmap.origin,
+            'all_valid': heightmap.valid is None,
+            'sources': {},
+        }
+
+    if metadata['sources'].get(source_path) != source_info:
+        forget_source(cache_dir, source_path, content_hash)
+        metadata['sources'][source_path] = source_info
+
+    # (re)writing the metadata marks the entry as recently used
+    write_metadata(metadata_path, metadata)
+    evict(cache_dir, max_cache_size, keep=content_hash)
+
+    return heightmap
+
+
+def tile_cache_dir(cache_dir):
+    """path of the folder with the cached meshes of terrain tiles
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+
+    Returns:
+        str -- path to the tile cache folder
+    """
+
+    return os.path.join(cache_dir, 'tiles')
+
+
+def array_hash(arrays, options):
+    """calculate a hash for some arrays and generation options
+
+    Arguments:
+        arrays {[]} -- numpy arrays
+        options {dict} -- parameters which influence the generated files
+
+    Returns:
+        str -- hex digest
+    """
+
+    sha1 = hashlib.sha1()
+    sha1.update(repr(sorted(options.items())).encode('utf8'))
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        sha1.update(repr((array.dtype.str, array.shape)).encode('utf8'))
+        sha1.update(array.data)
+
+    return sha1.hexdigest()
+
+
+def lookup_tile(cache_dir, key):
+    """find the cached files of a tile
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        key {str} -- hash of the tile (see array_hash)
+
+    Returns:
+        str -- path to the folder with the cached files, None if the tile is not cached
+    """
+
+    tile_dir = os.path.join(tile_cache_dir(cache_dir), key)
+    if not os.path.isdir(tile_dir):
+        return None
+
+    # mark as recently used
+    os.utime(tile_dir, None)
+
+    return tile_dir
+
+
+def remove_tile(cache_dir, key):
+    """remove a tile from the cache
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        key {str} -- hash of the tile (see array_hash)
+    """
+
+    shutil.rmtree(os.path.join(tile_cache_dir(cache_dir), key), ignore_errors=True)
+
+
+def store_tile(cache_dir, key, files, max_cache_size=DEFAULT_MAX_CACHE_SIZE):
+    """add the generated files of a tile to the cache
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        key {str} -- hash of the tile (see array_hash)
+        files {dict} -- file names in the cache mapped to the paths of the generated files
+
+    Keyword Arguments:
+        max_cache_size {int} -- maximal size of the tile cache (bytes) (default: {DEFAULT_MAX_CACHE_SIZE})
+    """
+
+    tiles_dir = tile_cache_dir(cache_dir)
+    if not os.path.isdir(tiles_dir):
+        os.makedirs(tiles_dir)
+
+    # fill a temporary folder and move it into place at once
+    temp_dir = tempfile.mkdtemp(dir=tiles_dir, suffix='.tmp')
+    default_permissions(temp_dir)
+    for file_name, file_path in files.items():
+        shutil.copyfile(file_path, os.path.join(temp_dir, file_name))
+
+    try:
+        os.rename(temp_dir, os.path.join(tiles_dir, key))
+    except OSError:
+        # another build stored the same tile in the meantime
+        shutil.rmtree(temp_dir)
+
+    evict_tiles(cache_dir, max_cache_size, keep=key)
+
+
+def evict_tiles(cache_dir, max_cache_size, keep=None):
+    """remove the least recently used tiles until the tile cache is smaller than max_cache_size
+
+    Arguments:
+        cache_dir {str} -- path to the cache folder
+        max_cache_size {int} -- maximal size of the tile cache (bytes)
+
+    Keyword Arguments:
+        keep {str} -- hash of a tile which should not be removed (default: {None})
+    """
+
+    tiles_dir = tile_cache_dir(cache_dir)
+
+    entries = []
+    for key in os.listdir(tiles_dir):
+        tile_dir = os.path.join(tiles_dir, key)
+        if key.endswith('.tmp') or not os.path.isdir(tile_dir):
+            continue
+        try:
+            size = sum(os.path.getsize(os.path.join(tile_dir, f)) for f in os.listdir(tile_dir))
+            last_used = os.path.getmtime(tile_dir)
+        except OSError:
+            continue
+        entries.append((last_used, size, key))
+
+    total_size = sum(size for _, size, _ in entries)
+
+    # oldest tiles first
+    for _, size, key in sorted(entries):
+        if total_size <= max_cache_size:
+            break
+        if key == keep:
+            continue
+
+        shutil.rmtree(os.path.join(tiles_dir, key), ignore_errors=True)
+        total_size -= size
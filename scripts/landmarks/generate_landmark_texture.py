@@ -1,7 +1,11 @@
 #!/usr/bin/env python
 from PIL import Image, ImageDraw, ImageFont
+from collections import OrderedDict
 import numpy as np
 import os
+import shutil
+import subprocess
+import tempfile
 
 ######### DEFAULT VALUES #########
 
@@ -44,7 +48,168 @@ def getC(config, key):
 
 #########
 
-def generate_marker_image(number_of_marker, size):
+######### FONT CACHE #########
+
+# the text size is calculated from the extents of the text at this font size (the text is scaled linearly)
+REFERENCE_FONT_SIZE = 10000
+
+# number of fonts (path and size) and text extents kept in memory
+FONT_CACHE_SIZE = 64
+
+font_cache = OrderedDict()
+text_extents_cache = OrderedDict()
+
+def lru_get(cache, key, create):
+    """get a value from a least recently used cache, it will be created if it is missing
+    
+    Arguments:
+        cache {OrderedDict} -- the cache, ordered from the least to the most recently used value
+        key {} -- key of the value
+        create {function} -- called without arguments to create a missing value
+    
+    Returns:
+        [type] -- the cached value
+    """
+    if key in cache:
+        value = cache.pop(key)
+    else:
+        value = create()
+        if len(cache) >= FONT_CACHE_SIZE:
+            cache.popitem(last=False)
+
+    cache[key] = value
+    return value
+
+def load_font(font_path, size):
+    """loads a truetype font, recently used fonts are not loaded again
+    
+    Arguments:
+        font_path {str} -- path to the ttf font file
+        size {int} -- the size of the font (pixel)
+    
+    Returns:
+        FreeTypeFont -- the font
+    """
+    return lru_get(font_cache, (font_path, size), lambda: ImageFont.truetype(font_path, size))
+
+def text_extents(font_path, text):
+    """size of a text relative to the font size, measured once at REFERENCE_FONT_SIZE
+    
+    Arguments:
+        font_path {str} -- path to the ttf font file
+        text {str} -- the text
+    
+    Returns:
+        () -- width and height of the text per pixel of font size
+    """
+    def measure():
+        (text_width, text_height), (_, _) = load_font(font_path, REFERENCE_FONT_SIZE).font.getsize(text)
+        return float(text_width) / REFERENCE_FONT_SIZE, float(text_height) / REFERENCE_FONT_SIZE
+
+    return lru_get(text_extents_cache, (font_path, text), measure)
+
+######### ALVAR MARKERS #########
+
+# cells of the 5x5 content of an ALVAR number marker without data (1 = white),
+# the middle row and column hold the orientation pattern
+MARKER_BASE_CONTENT = np.array([
+    [1, 1, 0, 1, 1],
+    [1, 1, 0, 1, 1],
+    [1, 0, 1, 0, 1],
+    [1, 1, 1, 1, 1],
+    [1, 1, 1, 1, 1],
+], dtype=np.uint8)
+
+# cells holding the code word of the 4 least significant bits of the number (in code word order)
+MARKER_CODE_CELLS = ((3, 0), (3, 1), (3, 3), (3, 4), (4, 0), (4, 1), (4, 3), (4, 4))
+
+# black border around the content (cells)
+MARKER_MARGIN = 2
+
+# ALVAR renders every cell with this many pixels before it scales the marker to the requested size
+MARKER_CELL_PIXELS = 96
+
+# range of the numbers rendered in-process, the output has been compared pixel by pixel with
+# the markers of ar_track_alvar in this range (larger numbers use more code words)
+MIN_RENDERED_MARKER = 1
+MAX_RENDERED_MARKER = 15
+
+
+def hamming_encode(value):
+    """extended hamming(8,4) code word of a 4 bit value as used by ALVAR
+
+    The parity bits are at the positions 1, 2 and 4 of the code word, the data bits (most significant first)
+    at 3, 5, 6 and 7 and the last bit makes the parity of the whole code word even.
+
+    Arguments:
+        value {int} -- the value (0-15)
+
+    Returns:
+        [] -- the 8 bits of the code word
+    """
+
+    code = [0] * 8
+    code[2], code[4], code[5], code[6] = [(value >> shift) & 1 for shift in (3, 2, 1, 0)]
+
+    code[0] = code[2] ^ code[4] ^ code[6]
+    code[1] = code[2] ^ code[5] ^ code[6]
+    code[3] = code[4] ^ code[5] ^ code[6]
+    code[7] = sum(code[:7]) % 2
+
+    return code
+
+
+def marker_content(number_of_marker):
+    """cells of the content of an ALVAR number marker
+
+    Arguments:
+        number_of_marker {int} -- the number of the marker (MIN_RENDERED_MARKER - MAX_RENDERED_MARKER)
+
+    Returns:
+        [[]] -- 2d array of the cells (1 = white)
+    """
+
+    content = MARKER_BASE_CONTENT.copy()
+    for (row, col), bit in zip(MARKER_CODE_CELLS, hamming_encode(number_of_marker)):
+        if bit:
+            content[row, col] = 0
+
+    return content
+
+
+def render_marker_image(number_of_marker, size):
+    """renders the black and white ALVAR marker in-process, like 'rosrun ar_track_alvar createMarker' does
+
+    The cells are scaled with nearest neighbour sampling in the same way as ALVAR (via OpenCV) does it,
+    so the output is identical to the image of createMarker.
+
+    Arguments:
+        number_of_marker {int} -- the number of the marker which has to be generated
+        size {int} -- the size of the square marker in pixel
+
+    Returns:
+        Image -- the generated marker, None if the number can not be rendered in-process
+    """
+
+    if not MIN_RENDERED_MARKER <= number_of_marker <= MAX_RENDERED_MARKER:
+        return None
+
+    content = marker_content(number_of_marker)
+    cells = np.pad(content, MARKER_MARGIN, mode='constant')
+
+    # nearest neighbour scaling of the image with MARKER_CELL_PIXELS per cell (cvResize with CV_INTER_NN)
+    side_length = int(size + 0.5)
+    source_length = MARKER_CELL_PIXELS * len(cells)
+    inverse_scale = 1. / (float(side_length) / source_length)
+    source_pixels = np.minimum(np.floor(np.arange(side_length) * inverse_scale).astype(int), source_length - 1)
+    indices = source_pixels // MARKER_CELL_PIXELS
+
+    pixels = cells[np.ix_(indices, indices)] * np.uint8(255)
+
+    return Image.fromarray(pixels, 'L')
+
+
+def create_marker_with_alvar(number_of_marker, size):
     """generates the black and white marker with the script of the ar_track_alvar package (make sure to install it first)
     
     Arguments:
@@ -54,16 +219,37 @@ def generate_marker_image(number_of_marker, size):
     Returns:
         Image -- the generated marker
     """
-    # use /tmp folder as temporary place to generate and load the marker
-    temp_marker_path = '/tmp/MarkerData_' + str(number_of_marker) + '.png'
+    # use a unique temporary folder to generate and load the marker (several markers can be generated at the same time)
+    temp_dir = tempfile.mkdtemp(prefix='marker_')
+    temp_marker_path = os.path.join(temp_dir, 'MarkerData_' + str(number_of_marker) + '.png')
 
-    # generate the marker with the ar_track_alvar package (-u = resolution per unit) (-s = size in units) -> therefore the marker will have the pixel resoltion of size
-    os.system('cd /tmp; rosrun ar_track_alvar createMarker -u ' + str(size) + ' -s 1 ' + str(number_of_marker))
-    print ("")
-    marker = Image.open(temp_marker_path)
+    try:
+        # generate the marker with the ar_track_alvar package (-u = resolution per unit) (-s = size in units) -> therefore the marker will have the pixel resoltion of size
+        subprocess.call(['rosrun', 'ar_track_alvar', 'createMarker', '-u', str(size), '-s', '1', str(number_of_marker)], cwd=temp_dir)
+        print ("")
+        marker = Image.open(temp_marker_path)
+        marker.load()
 
-    # delete temporary file from /tmp folder
-    os.remove(temp_marker_path)
+    finally:
+        # delete temporary folder
+        shutil.rmtree(temp_dir)
+
+    return marker
+
+def generate_marker_image(number_of_marker, size):
+    """generates the black and white ALVAR marker, in-process if possible, otherwise with ar_track_alvar
+    
+    Arguments:
+        number_of_marker {int} -- the number of the marker which has to be generated
+        size {int} -- the size of the square marker in pixel
+    
+    Returns:
+        Image -- the generated marker
+    """
+
+    marker = render_marker_image(number_of_marker, size)
+    if marker is None:
+        marker = create_marker_with_alvar(number_of_marker, size)
 
     return marker
 
@@ -82,20 +268,18 @@ def draw_centered_text_inside_rectangle(context, text, color, font_path, x, y, w
         height {float} -- height of the bounding box (pixel)
     """
 
-    # probe the text to find the correct text height so that the text fits the bounding box
-    probe_height = 10000
-    font = ImageFont.truetype(font_path, probe_height)
-    (text_width, text_height), (_,_) = font.font.getsize(text)
+    # get the size of the text relative to the font size to find the correct text height so that the text fits the bounding box
+    text_width, text_height = text_extents(font_path, text)
 
-    # calculate the correct text heights based on the probed aspect ratios (only works if the font scaling works linearly)
-    new_height_based_on_width = float(width) / float(text_width) * probe_height
-    new_height_based_on_height = float(height) / float(text_height) * probe_height
+    # calculate the correct text heights based on the aspect ratios (only works if the font scaling works linearly)
+    new_height_based_on_width = float(width) / text_width
+    new_height_based_on_height = float(height) / text_height
 
     # use the smaller text size so that the text is totaly within the bounding box
     new_height = int(round(min(new_height_based_on_width, new_height_based_on_height)))
     
-    # create the font with the correct size
-    font = ImageFont.truetype(font_path, new_height)
+    # get the font with the correct size
+    font = load_font(font_path, new_height)
     (text_width, text_height), (offset_x, offset_y) = font.font.getsize(text)
 
     # calculate offsets
@@ -165,15 +349,17 @@ def draw_bit_circles_centered_around(context, number, color, x, y, radius, bits,
     # use draw_bit_circles_inside_rectangle to draw the circles
     draw_bit_circles_inside_rectangle(context, number, color, x-width/2.0, y-height/2.0, width, height, bits, space_between) 
 
-def create_texture(number_of_marker, output_file_path, font_path, config = {}):
-    """generates a texture like the landmarks of the ERC
+def create_texture_image(number_of_marker, font_path, config = {}):
+    """renders a texture like the landmarks of the ERC
     Arguments:
         number_of_marker {int} -- the number of the marker, which will be generated
-        output_file_path {str} -- path of the output file
         font_path {str} -- path to the font which should be used
     
     Keyword Arguments:
         config {dict} -- dictionary with more custmization variables (more information in the script or by calling it with --help) (default: {{}})
+    
+    Returns:
+        Image -- the rendered texture
     """
 
     # get the size and resolution
@@ -246,26 +432,84 @@ def create_texture(number_of_marker, output_file_path, font_path, config = {}):
     marker = generate_marker_image(number_of_marker, marker_size)
     img.paste(marker, (int((page_width - marker_size) / 2.0), int(marker_offset_top)))
 
+    return img
+
+def create_texture(number_of_marker, output_file_path, font_path, config = {}):
+    """generates a texture like the landmarks of the ERC
+    Arguments:
+        number_of_marker {int} -- the number of the marker, which will be generated
+        output_file_path {str} -- path of the output file
+        font_path {str} -- path to the font which should be used
+    
+    Keyword Arguments:
+        config {dict} -- dictionary with more custmization variables (more information in the script or by calling it with --help) (default: {{}})
+    """
+
     # save the texture
-    img.save(output_file_path)
+    create_texture_image(number_of_marker, font_path, config).save(output_file_path)
+
+def create_texture_atlas(numbers_of_markers, output_file_path, font_path, config = {}, columns = None):
+    """generates a single texture (atlas) with the textures of several landmarks arranged in a grid
+    Arguments:
+        numbers_of_markers {[int]} -- the numbers of the markers, which will be generated
+        output_file_path {str} -- path of the output file
+        font_path {str} -- path to the font which should be used
+    
+    Keyword Arguments:
+        config {dict} -- dictionary with more custmization variables (see create_texture) (default: {{}})
+        columns {int} -- number of landmark textures per row (default: {None}, square grid)
+    
+    Returns:
+        dict -- uv offset (u, v) and uv scale (u, v) of the texture of every number inside of the atlas
+    """
+
+    # every number only once, in the given order
+    numbers = []
+    for number in numbers_of_markers:
+        if number not in numbers:
+            numbers.append(number)
+
+    if columns is None:
+        columns = int(np.ceil(np.sqrt(len(numbers))))
+    rows = int(np.ceil(len(numbers) / float(columns)))
+
+    # calculate the size of a single texture in pixel
+    page_width, page_height = (np.array(getC(config, "size")) * getC(config, "resolution")).astype(int)
+
+    # create canvas for all the textures
+    atlas = Image.new('RGBA', (columns * page_width, rows * page_height), tuple(getC(config, "background_color")))
+
+    uv_transforms = {}
+    for index, number in enumerate(numbers):
+        col, row = index % columns, index // columns
+        atlas.paste(create_texture_image(number, font_path, config), (col * page_width, row * page_height))
+
+        # the origin of the uv coordinates is the lower left corner of the image
+        uv_transforms[number] = ((float(col) / columns, float(rows - 1 - row) / rows), (1.0 / columns, 1.0 / rows))
+
+    # save the atlas
+    atlas.save(output_file_path)
+
+    return uv_transforms
 
 if __name__ == '__main__':
     
     from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
     # get path of package
-    from rospkg import RosPack
-    rospack = RosPack()
-    rover_sim_dir = rospack.get_path('rover_sim')
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
+    from rover_sim.scripts.package_path import rover_sim_path
+
     # get default font path
-    font_path = os.path.join(rover_sim_dir, 'resources/landmarks/Roboto-Bold.ttf')
+    font_path = os.path.join(rover_sim_path(), 'resources/landmarks/Roboto-Bold.ttf')
     default_texture_path='texture.png'
 
     # parse command line arguments
     parser = ArgumentParser(
         description="generates a texture like the landmarks of the ERC",
     )
-    parser.add_argument("number", type=int, help="the number of the landmark texture to generate")
+    parser.add_argument("number", type=int, nargs="+", help="the number of the landmark texture to generate, several numbers are rendered into one texture atlas")
     parser.add_argument("-o", "--output", type=str, help="the output file and path to the texture which will be created in this process (default: " + default_texture_path + ")", default=default_texture_path)
     parser.add_argument("-f", "--font", type=str, help="path to the font (ttf) (default: " + font_path + ")", default=font_path)
     parser.add_argument("-c", "--config", type=str, help="path to a json config file with the following possible parameters (they will be overritten if given here explicitly)")
@@ -295,4 +539,7 @@ if __name__ == '__main__':
             config[key] = value
 
     # generate texture
-    create_texture(args.number, args.output, args.font, config)
\ No newline at end of file
+    if len(args.number) > 1:
+        create_texture_atlas(args.number, args.output, args.font, config)
+    else:
+        create_texture(args.number[0], args.output, args.font, config)
\ No newline at end of file
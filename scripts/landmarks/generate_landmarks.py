@@ -1,97 +1,234 @@
 #!/usr/bin/env python
 from lxml import etree
 import csv
+import hashlib
 import os, sys
-from rospkg import RosPack
+import shutil
+from multiprocessing import Pool
 
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
 
-from rover_sim.scripts.landmarks.generate_single_landmark import create_single_landmark
+from rover_sim.scripts.package_path import rover_sim_path
+from rover_sim.scripts.landmarks.generate_single_landmark import create_single_landmark, COLLADA_NAMESPACE
+from rover_sim.scripts.landmarks.generate_landmark_texture import create_texture_atlas
 from rover_sim.scripts.generate_gazebo_model import create_model_config
+from rover_sim.scripts.profiling import stage
 
 
-def all_landmarks_model(input_csv_path, landmark_models_path):
+def create_landmark_model(args):
+    """create_single_landmark with a tuple of arguments, used by the worker processes
+    
+    Arguments:
+        args {()} -- name, number, output folder, atlas texture and uv transform of the landmark
+    """
+
+    name, number, output_folder, atlas_texture, uv_transform = args
+
+    print("# Creating Landmark " + name)
+    create_single_landmark(name, number, output_folder, atlas_texture=atlas_texture, uv_transform=uv_transform)
+
+
+def landmark_atlas_folder(landmark_folder):
+    """find the texture atlas referenced by the meshes of a landmark model
+
+    Arguments:
+        landmark_folder {str} -- path to the landmark model
+
+    Returns:
+        str -- path to the folder of the texture atlas, None if the landmark has its own texture
+    """
+
+    meshes_folder = os.path.join(landmark_folder, 'meshes')
+    mesh_path = os.path.join(meshes_folder, 'mesh.dae')
+    if not os.path.exists(mesh_path):
+        return None
+
+    for init_from in etree.parse(mesh_path).iterfind('.//c:image/c:init_from', COLLADA_NAMESPACE):
+        texture_folder = os.path.dirname(os.path.normpath(os.path.join(meshes_folder, init_from.text)))
+        if not texture_folder.startswith(landmark_folder + os.sep):
+            return texture_folder
+
+    return None
+
+
+def landmark_model_paths(landmark_names):
+    """paths to the models of landmarks in rover_sim/models/landmarks and the texture atlases they reference
+
+    Arguments:
+        landmark_names {[str]} -- names of the landmarks, e.g. 'L12'
+
+    Returns:
+        [str] -- paths to the landmark models and the atlas folders
+    """
+
+    base_path = os.path.join(rover_sim_path(), "models/landmarks")
+
+    paths = []
+    for landmark_name in landmark_names:
+        landmark_folder = os.path.join(base_path, landmark_name)
+        atlas_folder = landmark_atlas_folder(landmark_folder)
+
+        for path in (landmark_folder, atlas_folder):
+            if path is not None and path not in paths:
+                paths.append(path)
+
+    return paths
+
+
+def create_missing_landmarks(landmark_names, jobs=1, atlas=False):
+    """create the models of the landmarks which do not exist yet in rover_sim/models/landmarks
+    
+    Arguments:
+        landmark_names {[str]} -- names of the landmarks, e.g. 'L12'
+    
+    Keyword Arguments:
+        jobs {int} -- number of processes generating the missing landmark models in parallel (default: {1})
+        atlas {bool} -- the missing landmark models share a single texture atlas (default: {False})
+    
+    Returns:
+        [str] -- names of the created landmarks
+    """
+
+    base_path = os.path.join(rover_sim_path(), "models/landmarks")
+
+    # find the landmark models which have to be created
+    missing = []
+    for landmark_name in landmark_names:
+        landmark_folder = os.path.join(base_path, landmark_name)
+
+        # a landmark of a removed texture atlas has to be created again
+        atlas_folder = landmark_atlas_folder(landmark_folder)
+        if atlas_folder is not None and not os.path.exists(atlas_folder):
+            print("The texture atlas of the landmark is missing: " + atlas_folder)
+            print("Removing old landmark\n")
+            shutil.rmtree(landmark_folder)
+
+        # check if landmark's folder already exists
+        if os.path.exists(landmark_folder):
+            print("The folder already exists: " + landmark_folder)
+            print("Skipping creation, leaving old landmark\n")
+        elif landmark_name not in [landmark[0] for landmark in missing]:
+            missing.append((landmark_name, int(landmark_name[1:]), base_path, None, None))
+
+    # render the textures of all the missing landmarks into one atlas
+    if atlas and missing:
+        numbers = [landmark[1] for landmark in missing]
+        atlas_name = 'atlas_' + hashlib.sha1(','.join(map(str, numbers)).encode('utf8')).hexdigest()[:10]
+        atlas_folder = os.path.join(base_path, atlas_name)
+        if not os.path.isdir(atlas_folder):
+            os.makedirs(atlas_folder)
+
+        print("# Creating texture atlas " + atlas_name)
+        atlas_texture = os.path.join(atlas_folder, 'texture.png')
+        font_path = os.path.join(rover_sim_path(), 'resources/landmarks/Roboto-Bold.ttf')
+        with stage('texture atlas'):
+            uv_transforms = create_texture_atlas(numbers, atlas_texture, font_path)
+
+        missing = [(name, number, folder, atlas_texture, uv_transforms[number]) for name, number, folder, _, _ in missing]
+
+    # create the missing landmark models
+    if jobs > 1 and len(missing) > 1:
+        pool = Pool(min(jobs, len(missing)))
+        try:
+            pool.map(create_landmark_model, missing)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for landmark in missing:
+            with stage('landmark model'):
+                create_landmark_model(landmark)
+
+    return [landmark[0] for landmark in missing]
+
+
+def read_landmark_rows(input_csv_path):
+    """read the rows of a landmarks csv file
+    
+    Arguments:
+        input_csv_path {str} -- path to the csv file which contains the positions of the landmarks
+    
+    Returns:
+        [[str]] -- name and position of every landmark (without the header)
+    """
+
+    with open (input_csv_path) as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)
+        return list(reader)
+
+
+def all_landmarks_model(input_csv_path, landmark_models_path, jobs=1, atlas=False):
     """generates the xml tree for the landmarks model
         and calls 'generate_single_landmark' to create all the landmark models required by the csv
     
     Arguments:
         input_csv_path {str} -- path to the csv file which contains the positions of the landmarks
     
+    Keyword Arguments:
+        jobs {int} -- number of processes generating the missing landmark models in parallel (default: {1})
+        atlas {bool} -- the missing landmark models share a single texture atlas (default: {False})
+    
     Returns:
         object -- xml tree for the landmarks model
     """
 
-    landmark_models_path = "models/landmarks"
+    rows = read_landmark_rows(input_csv_path)
+
+    # (we define the pose in the <include>)
+    create_missing_landmarks([row[0] for row in rows], jobs, atlas)
 
     landmarks = etree.Element('model')
     landmarks.set('name', 'landmarks')
-    
-    with open (input_csv_path) as csvfile:
-        reader = csv.reader(csvfile)
-        next(reader, None)
+
+    # include the landmark model for each landmark in the file
+    for row in rows:
+        landmark_name = row[0]
+
+        model = etree.Element('model')
+        model.set('name', landmark_name)
+
+        include = etree.Element('include')
+        
+        uri = etree.Element('uri')
+        uri.text = 'model://rover_sim/models/landmarks/' + landmark_name
+
+        pose = etree.Element('pose')
+        pose.text = ' '.join(row[1:4]) + ' 0 0 0'
+
+        include.append(uri)
+        include.append(pose)
+        model.append(include)
         
-        # create landmark model and include it for each landmark in the file
-        for row in reader:
-            landmark_name = row[0]
-            i = row[0][1:]
-
-            print("# Creating Landmark " + landmark_name)
-
-            base_path = os.path.join(rover_sim_dir, landmark_models_path)
-            landmark_folder = os.path.join(base_path, landmark_name)
-
-            # check if landmark's folder already exists
-            if os.path.exists(landmark_folder):
-                print("The folder already exists: " + landmark_folder)
-                print("Skipping creation, leaving old landmark\n")
-
-            # create a single landmark model if necessary
-            # (we define the pose in the <include>)
-            else:
-                create_single_landmark(landmark_name, int(i), base_path)
-
-            model = etree.Element('model')
-            model.set('name', landmark_name)
-
-            include = etree.Element('include')
-            
-            uri = etree.Element('uri')
-            uri.text = 'model://rover_sim/models/landmarks/' + landmark_name
-
-            pose = etree.Element('pose')
-            pose.text = ' '.join(row[1:4]) + ' 0 0 0'
-
-            include.append(uri)
-            include.append(pose)
-            model.append(include)
-            
-            landmarks.append(model)
+        landmarks.append(model)
     
     return landmarks
 
 
-def create_landmarks_sdf(input_csv_path, output_path, landmark_models_path):
+def create_landmarks_sdf(input_csv_path, output_path, landmark_models_path, jobs=1, atlas=False):
     """generate the sdf file for the landmarks gazebo model which includes all the models needed in the scene
 
     Arguments:
         input_csv_path {str} -- path to the csv file which contains the positions of the landmarks
         output_path {str} -- path to the folder where the sdf file should be placed
+    
+    Keyword Arguments:
+        jobs {int} -- number of processes generating the missing landmark models in parallel (default: {1})
+        atlas {bool} -- the missing landmark models share a single texture atlas (default: {False})
     """
 
     sdf = etree.Element('sdf')
     sdf.set('version', '1.6')
 
-    landmarks = all_landmarks_model(input_csv_path, landmark_models_path)
+    landmarks = all_landmarks_model(input_csv_path, landmark_models_path, jobs, atlas)
 
     sdf.append(landmarks)
 
     tree = etree.ElementTree(sdf)
     tree.write(os.path.join(output_path, 'model.sdf'), pretty_print=True, encoding='utf8', xml_declaration=True)
 
-def create_landmarks(name, input_csv_path, output_path, landmark_models_path):
+def create_landmarks(name, input_csv_path, output_path, landmark_models_path, jobs=1, atlas=False):
     """create the landmarks gazebo model which includes all the landmarks specified in the csv file (it will automatically generate those landmarks)
     
     Arguments:
@@ -99,6 +236,10 @@ def create_landmarks(name, input_csv_path, output_path, landmark_models_path):
         input_csv_path {str} -- path to the csv file which contains the positions of the landmarks
         output_path {str} -- path to the folder where the model will be placed
         landmark_models_path {str} -- path to the folder in which the individual landmark models will be placed
+    
+    Keyword Arguments:
+        jobs {int} -- number of processes generating the missing landmark models in parallel (default: {1})
+        atlas {bool} -- the missing landmark models share a single texture atlas (default: {False})
     """
 
 
@@ -123,7 +264,7 @@ def create_landmarks(name, input_csv_path, output_path, landmark_models_path):
     create_model_config(name, base_path)
 
     # generate sdf
-    create_landmarks_sdf(input_csv_path, base_path, landmark_models_path)
+    create_landmarks_sdf(input_csv_path, base_path, landmark_models_path, jobs, atlas)
 
 if __name__ == '__main__':
 
@@ -139,6 +280,8 @@ if __name__ == '__main__':
     parser.add_argument("output_path", type=str, help = "path where the gazebo model should be generated")
     parser.add_argument("landmark_models_path", type=str, help = "folder in which the individual landmark models should be generated")
     parser.add_argument("-n", "--name", type=str, help = "name of the gazebo model", default="landmarks")
+    parser.add_argument("-j", "--jobs", type=int, help = "number of processes generating the landmark models in parallel", default=1)
+    parser.add_argument("-a", "--atlas", action="store_true", help = "render the textures of all new landmarks into a single texture atlas")
     args = parser.parse_args()
 
-    create_landmarks(args.name, args.input_csv_path, args.output_path, args.landmark_models_path)
\ No newline at end of file
+    create_landmarks(args.name, args.input_csv_path, args.output_path, args.landmark_models_path, args.jobs, args.atlas)
\ No newline at end of file
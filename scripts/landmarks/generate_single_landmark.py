@@ -1,16 +1,90 @@
 #!/usr/bin/env python
+from lxml import etree
+import numpy as np
 import os, sys
-from rospkg import RosPack
+import tempfile
 
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))))
 
+from rover_sim.scripts.package_path import rover_sim_path
 from rover_sim.scripts.landmarks.generate_landmark_texture import create_texture
 from rover_sim.scripts.generate_gazebo_model import create_gazebo_model
+from rover_sim.scripts.profiling import stage
 
-def create_single_landmark(name, number, output_folder, pose=[0, 0, 0, 0, 0, 0]):
+COLLADA_NAMESPACE = {'c': 'http://www.collada.org/2005/11/COLLADASchema'}
+
+def atlas_mesh_writer(template_file_path, uv_offset, uv_scale, template_texture_path='texture.png'):
+    """creates a mesh writer for create_gazebo_model, which maps the uv coordinates of a template mesh
+    into the area of a single texture inside of a texture atlas
+    
+    The template meshes repeat their texture (uv coordinates outside of [0, 1]), so every triangle
+    is moved into [0, 1] first. Only <triangles> primitives are supported.
+    
+    Arguments:
+        template_file_path {str} -- path to the template mesh (collada)
+        uv_offset {()} -- uv coordinates of the lower left corner of the texture in the atlas
+        uv_scale {()} -- size of the texture in the atlas (uv)
+    
+    Keyword Arguments:
+        template_texture_path {str} -- texture path in the template mesh file (default: {'texture.png'})
+    
+    Returns:
+        function -- writer called with the output file path and the relative path to the atlas
+    """
+
+    def write(output_file_path, new_texture_relative_path):
+        tree = etree.parse(template_file_path)
+
+        # new uv coordinates (one per triangle corner) of every uv source
+        new_uvs = {}
+
+        for triangles in tree.iterfind('.//c:mesh/c:triangles', COLLADA_NAMESPACE):
+            texcoord = triangles.find('c:input[@semantic="TEXCOORD"]', COLLADA_NAMESPACE)
+            if texcoord is None:
+                continue
+
+            source_id = texcoord.get('source')[1:]
+            source = tree.find('.//c:source[@id="' + source_id + '"]', COLLADA_NAMESPACE)
+            stride = int(source.find('.//c:accessor', COLLADA_NAMESPACE).get('stride', 1))
+            uvs = np.array(source.find('c:float_array', COLLADA_NAMESPACE).text.split(), dtype=float).reshape(-1, stride)
+
+            inputs = triangles.findall('c:input', COLLADA_NAMESPACE)
+            offset = int(texcoord.get('offset'))
+            p = triangles.find('c:p', COLLADA_NAMESPACE)
+            indices = np.array(p.text.split(), dtype=int).reshape(-1, max(int(i.get('offset')) for i in inputs) + 1)
+
+            # move every triangle into [0, 1] and into the area of the texture
+            corners = uvs[indices[:, offset]].reshape(-1, 3, stride)
+            corners[..., :2] -= np.floor(corners[..., :2].min(axis=1, keepdims=True) + 1e-6)
+            corners[..., :2] = np.array(uv_offset) + corners[..., :2] * np.array(uv_scale)
+
+            # reference the new uv coordinates
+            previous = new_uvs.setdefault(source_id, [])
+            first_index = sum(len(block) for block in previous)
+            indices[:, offset] = first_index + np.arange(len(indices))
+            previous.append(corners.reshape(-1, stride))
+            p.text = ' '.join(map(str, indices.reshape(-1)))
+
+        for source_id, blocks in new_uvs.items():
+            source = tree.find('.//c:source[@id="' + source_id + '"]', COLLADA_NAMESPACE)
+            uvs = np.concatenate(blocks)
+
+            float_array = source.find('c:float_array', COLLADA_NAMESPACE)
+            float_array.text = ' '.join('%.7g' % value for value in uvs.reshape(-1))
+            float_array.set('count', str(uvs.size))
+            source.find('.//c:accessor', COLLADA_NAMESPACE).set('count', str(len(uvs)))
+
+        # replace texture path
+        for init_from in tree.iterfind('.//c:image/c:init_from', COLLADA_NAMESPACE):
+            if init_from.text == template_texture_path:
+                init_from.text = new_texture_relative_path
+
+        tree.write(output_file_path, encoding='utf-8', xml_declaration=True)
+
+    return write
+
+def create_single_landmark(name, number, output_folder, pose=[0, 0, 0, 0, 0, 0], atlas_texture=None, uv_transform=None):
     """generates a full gazebo model for a ERC landmark
     
     Arguments:
@@ -20,34 +94,57 @@ def create_single_landmark(name, number, output_folder, pose=[0, 0, 0, 0, 0, 0])
     
     Keyword Arguments:
         pose {list} -- the pose of the model (default: {[0, 0, 0, 0, 0, 0]})
+        atlas_texture {str} -- path to a shared texture atlas which contains the texture of the landmark,
+                               a separate texture is generated if None (default: {None})
+        uv_transform {()} -- uv offset and uv scale of the landmark texture in the atlas (see create_texture_atlas) (default: {None})
     """
 
-    font_path = os.path.join(rover_sim_dir, 'resources/landmarks/Roboto-Bold.ttf')
-    template_vis = os.path.join(rover_sim_dir, 'resources/landmarks/marker.dae')
-    template_col = os.path.join(rover_sim_dir, 'resources/landmarks/marker_coll.dae')
+    font_path = os.path.join(rover_sim_path(), 'resources/landmarks/Roboto-Bold.ttf')
+    template_vis = os.path.join(rover_sim_path(), 'resources/landmarks/marker.dae')
+    template_col = os.path.join(rover_sim_path(), 'resources/landmarks/marker_coll.dae')
     size = [0.210, 0.210, 0.297]
 
-    temp_texture_path = '/tmp/landmark.png'
-
-    # generate texture
-    create_texture(number, temp_texture_path, font_path)
-
-    # generate gazebo model
-    #create_gazebo_model(name, os.path.join(output_folder, name), template_path, temp_texture_path, pose, description="Landmark for the ERC")
-    create_gazebo_model(
-        name=name, 
-        output_folder=output_folder, 
-        template_mesh_vis=template_vis, 
-        template_texture=temp_texture_path,
-        pose=pose, size=size, 
-        template_mesh_col=template_col,
-        description="Landmark for the ERC",
-        static=True, 
-        ghost=False
-    )
+    if atlas_texture is not None:
+        # the meshes reference the shared atlas, no texture has to be generated
+        create_gazebo_model(
+            name=name, 
+            output_folder=output_folder, 
+            template_mesh_vis=atlas_mesh_writer(template_vis, *uv_transform), 
+            template_texture=atlas_texture,
+            pose=pose, size=size, 
+            template_mesh_col=atlas_mesh_writer(template_col, *uv_transform),
+            description="Landmark for the ERC",
+            static=True, 
+            ghost=False,
+            copy_texture=False
+        )
+        return
+
+    # unique temporary texture, several landmarks can be generated at the same time
+    handle, temp_texture_path = tempfile.mkstemp(suffix='.png', prefix='landmark_')
+    os.close(handle)
+
+    try:
+        # generate texture
+        with stage('landmark texture'):
+            create_texture(number, temp_texture_path, font_path)
 
-    # remove temporary texture
-    os.remove(temp_texture_path)
+        # generate gazebo model
+        #create_gazebo_model(name, os.path.join(output_folder, name), template_path, temp_texture_path, pose, description="Landmark for the ERC")
+        create_gazebo_model(
+            name=name, 
+            output_folder=output_folder, 
+            template_mesh_vis=template_vis, 
+            template_texture=temp_texture_path,
+            pose=pose, size=size, 
+            template_mesh_col=template_col,
+            description="Landmark for the ERC",
+            static=True, 
+            ghost=False
+        )
+    finally:
+        # remove temporary texture, also if the generation failed
+        os.remove(temp_texture_path)
 
 
 if __name__ == '__main__':
@@ -55,7 +152,7 @@ if __name__ == '__main__':
     from argparse import ArgumentParser, ArgumentDefaultsHelpFormatter
 
     # default values
-    output_folder = os.path.join(rover_sim_dir, 'models')
+    output_folder = os.path.join(rover_sim_path(), 'models')
 
     # parse command line arguments
     parser = ArgumentParser(
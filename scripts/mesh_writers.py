@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+"""
+write meshes directly from the vertex, normal, uv and index arrays in formats which gazebo can load
+
+The writers stream the arrays in chunks into the files, so no text copy of a whole array is kept in memory:
+    'dae': Collada with the same structure as the pycollada mesh of generate_terrain.build_collada
+    'stl': binary STL, positions only (e.g. collision meshes)
+    'obj': Wavefront OBJ with a MTL material referencing the texture
+"""
+
+import os
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+import numpy as np
+
+# record of a triangle in a binary STL file
+STL_TRIANGLE = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attributes', '<u2')])
+
+# maximal number of lines, triangles or values formatted at once
+CHUNK_SIZE = 64 * 1024
+
+
+def triangle_normals(vertices, indices):
+    """calculate the normalized face normals of triangles
+
+    Arguments:
+        vertices {[[]]} -- array of vertices (n, 3)
+        indices {[[]]} -- array of triangles (m, 3)
+
+    Returns:
+        [[]] -- array of normals (m, 3)
+    """
+
+    corners = vertices[indices]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return normals / np.where(lengths > 0, lengths, 1)
+
+
+def write_stl(file_path, vertices, indices):
+    """write a binary STL file
+
+    Arguments:
+        file_path {str} -- path of the STL file
+        vertices {[[]]} -- array of vertices (n, 3)
+        indices {[[]]} -- array of triangles (m, 3)
+    """
+
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    indices = np.asarray(indices).reshape(-1, 3)
+
+    with open(file_path, 'wb') as fp:
+        fp.write(b'binary STL'.ljust(80, b' '))
+        np.array([len(indices)], dtype='<u4').tofile(fp)
+
+        for start in range(0, len(indices), CHUNK_SIZE):
+            chunk = indices[start:start + CHUNK_SIZE]
+            triangles = np.zeros(len(chunk), dtype=STL_TRIANGLE)
+            triangles['normal'] = triangle_normals(vertices, chunk)
+            triangles['vertices'] = vertices[chunk]
+            triangles.tofile(fp)
+
+
+def write_rows(fp, line, rows):
+    """write the rows of an array as text lines in chunks
+
+    Arguments:
+        fp {file} -- opened (binary) file
+        line {str} -- format of a line, e.g. 'v %g %g %g\\n'
+        rows {[[]]} -- 2d array, one line per row
+    """
+
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start:start + CHUNK_SIZE]
+        fp.write((line * len(chunk) % tuple(chunk.reshape(-1))).encode('ascii'))
+
+
+def write_values(fp, value, values):
+    """write the values of an array as space separated text in chunks
+
+    Arguments:
+        fp {file} -- opened (binary) file
+        value {str} -- format of a value, e.g. '%.7g'
+        values {[]} -- 1d array
+    """
+
+    for start in range(0, len(values), CHUNK_SIZE):
+        chunk = values[start:start + CHUNK_SIZE]
+        separator = ' ' if start else ''
+        fp.write((separator + ' '.join([value] * len(chunk)) % tuple(chunk)).encode('ascii'))
+
+
+# Collada document, split at the streamed arrays
+COLLADA_HEAD = """<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">
+  <asset>
+    <created>{date}</created>
+    <modified>{date}</modified>
+    <up_axis>Y_UP</up_axis>
+  </asset>
+  <library_effects>
+    <effect id="material-effect" name="material-effect">
+      <profile_COMMON>
+        <newparam sid="material-image-surface">
+          <surface type="2D">
+            <init_from>material-image</init_from>
+            <format>A8R8G8B8</format>
+          </surface>
+        </newparam>
+        <newparam sid="material-image-sampler">
+          <sampler2D>
+            <source>material-image-surface</source>
+          </sampler2D>
+        </newparam>
+        <technique sid="common">
+          <lambert>
+            <emission>
+              <color>0.0 0.0 0.0 1</color>
+            </emission>
+            <ambient>
+              <color>0.0 0.0 0.0 1</color>
+            </ambient>
+            <diffuse>
+              <texture texture="material-image-sampler" texcoord="UVSET0"/>
+            </diffuse>
+            <specular>
+              <color>0.0 0.0 0.0 1.0</color>
+            </specular>
+            <shininess>
+              <float>0.0</float>
+            </shininess>
+            <reflective>
+              <color>0.0 0.0 0.0 1.0</color>
+            </reflective>
+            <reflectivity>
+              <float>0.0</float>
+            </reflectivity>
+            <transparent>
+              <texture texture="material-image-sampler" texcoord="UVSET0"/>
+            </transparent>
+            <transparency>
+              <float>0.0</float>
+            </transparency>
+          </lambert>
+        </technique>
+        <extra>
+          <technique profile="GOOGLEEARTH">
+            <double_sided>1</double_sided>
+          </technique>
+        </extra>
+      </profile_COMMON>
+    </effect>
+  </library_effects>
+  <library_geometries>
+    <geometry id="geometry" name="terrain">
+      <mesh>
+"""
+
+COLLADA_SOURCE_HEAD = """        <source id="{id}">
+          <float_array count="{count}" id="{id}-array">"""
+
+COLLADA_SOURCE_TAIL = """</float_array>
+          <technique_common>
+            <accessor count="{number}" source="#{id}-array" stride="{stride}">
+{params}
+            </accessor>
+          </technique_common>
+        </source>
+"""
+
+COLLADA_TRIANGLES_HEAD = """        <vertices id="verts-array-vertices">
+          <input semantic="POSITION" source="#verts-array"/>
+        </vertices>
+        <triangles count="{count}" material="material">
+          <input offset="0" semantic="VERTEX" source="#verts-array-vertices"/>
+          <input offset="{normal_offset}" semantic="NORMAL" source="#normals-array"/>
+          <input offset="{uv_offset}" semantic="TEXCOORD" source="#uv-array" set="0"/>
+          <p>"""
+
+COLLADA_TAIL = """</p>
+        </triangles>
+      </mesh>
+    </geometry>
+  </library_geometries>
+  <library_images>
+    <image id="material-image" name="material-image">
+      <init_from>{texture}</init_from>
+    </image>
+  </library_images>
+  <library_materials>
+    <material id="materialID" name="material">
+      <instance_effect url="#material-effect"/>
+    </material>
+  </library_materials>
+  <library_visual_scenes>
+    <visual_scene id="scene">
+      <node id="model" name="model">
+        <instance_geometry url="#geometry">
+          <bind_material>
+            <technique_common>
+              <instance_material symbol="material" target="#materialID"/>
+            </technique_common>
+          </bind_material>
+        </instance_geometry>
+      </node>
+    </visual_scene>
+  </library_visual_scenes>
+  <scene>
+    <instance_visual_scene url="#scene"/>
+  </scene>
+</COLLADA>
+"""
+
+
+def write_collada_source(fp, source_id, values, components):
+    """write a float source of a Collada mesh
+
+    Arguments:
+        fp {file} -- opened (binary) file
+        source_id {str} -- id of the source
+        values {[[]]} -- 2d array, one row per element
+        components {()} -- names of the columns, e.g. ('X', 'Y', 'Z')
+    """
+
+    values = np.asarray(values).reshape(-1, len(components))
+    params = '\n'.join('              <param type="float" name={}/>'.format(quoteattr(c)) for c in components)
+
+    fp.write(COLLADA_SOURCE_HEAD.format(id=source_id, count=values.size).encode('utf8'))
+    write_values(fp, '%.7g', values.reshape(-1))
+    fp.write(COLLADA_SOURCE_TAIL.format(id=source_id, number=len(values), stride=len(components),
+                                        params=params).encode('utf8'))
+
+
+def write_collada(file_path, vertices, normals, uvs, indices, relative_texture_path, shared_indices=False):
+    """write a textured Collada mesh without building the document in memory
+
+    Arguments:
+        file_path {str} -- path of the Collada file
+        vertices {[[]]} -- array of vertices (n, 3)
+        normals {[[]]} -- array of normals (n, 3)
+        uvs {[[]]} -- array of uv coordinates (n, 2)
+        indices {[[]]} -- array of triangles (m, 3)
+        relative_texture_path {str} -- path of the texture relative to the Collada file
+
+    Keyword Arguments:
+        shared_indices {bool} -- vertex, normal and uv inputs share one index stream instead of
+                                 repeating every index for each input (default: {False})
+    """
+
+    indices = np.asarray(indices).reshape(-1)
+
+    with open(file_path, 'wb') as fp:
+        fp.write(COLLADA_HEAD.format(date=datetime.now().isoformat()).encode('utf8'))
+
+        write_collada_source(fp, 'verts-array', vertices, ('X', 'Y', 'Z'))
+        write_collada_source(fp, 'normals-array', normals, ('X', 'Y', 'Z'))
+        write_collada_source(fp, 'uv-array', uvs, ('S', 'T'))
+
+        fp.write(COLLADA_TRIANGLES_HEAD.format(count=len(indices) // 3, normal_offset=0 if shared_indices else 1,
+                                               uv_offset=0 if shared_indices else 2).encode('utf8'))
+
+        # the index of every corner is repeated for vertex, normal and uv chunk by chunk
+        step = CHUNK_SIZE if shared_indices else CHUNK_SIZE // 3
+        for start in range(0, len(indices), step):
+            chunk = indices[start:start + step]
+            if start:
+                fp.write(b' ')
+            write_values(fp, '%d', chunk if shared_indices else np.repeat(chunk, 3))
+
+        fp.write(COLLADA_TAIL.format(texture=escape(relative_texture_path)).encode('utf8'))
+
+
+def write_obj(file_path, vertices, normals, uvs, indices, relative_texture_path):
+    """write a Wavefront OBJ file and its MTL material file (same name, extension .mtl)
+
+    Arguments:
+        file_path {str} -- path of the OBJ file
+        vertices {[[]]} -- array of vertices (n, 3)
+        normals {[[]]} -- array of normals (n, 3)
+        uvs {[[]]} -- array of uv coordinates (n, 2)
+        indices {[[]]} -- array of triangles (m, 3)
+        relative_texture_path {str} -- path of the texture relative to the OBJ file
+    """
+
+    material_path = os.path.splitext(file_path)[0] + '.mtl'
+
+    with open(material_path, 'w') as fp:
+        fp.write('newmtl material\n')
+        fp.write('Ka 0 0 0\nKd 1 1 1\nKs 0 0 0\nd 1\nillum 1\n')
+        fp.write('map_Kd ' + relative_texture_path + '\n')
+
+    # vertex, uv and normal of a grid point share the same (one based) index
+    faces = np.repeat(np.asarray(indices).reshape(-1, 3).astype(np.int64) + 1, 3, axis=1)
+    corner = '%d/%d/%d'
+
+    with open(file_path, 'wb') as fp:
+        fp.write(('mtllib ' + os.path.basename(material_path) + '\n').encode('ascii'))
+        write_rows(fp, 'v %.7g %.7g %.7g\n', np.asarray(vertices).reshape(-1, 3))
+        write_rows(fp, 'vt %.6g %.6g\n', np.asarray(uvs).reshape(-1, 2))
+        write_rows(fp, 'vn %.5g %.5g %.5g\n', np.asarray(normals).reshape(-1, 3))
+        fp.write(b'usemtl material\n')
+        write_rows(fp, 'f ' + ' '.join([corner] * 3) + '\n', faces)
+
+
+def mesh_writer(mesh_format, vertices, normals, uvs, indices, shared_indices=False):
+    """writer function of a mesh for create_gazebo_model (see write_mesh)
+
+    Arguments:
+        mesh_format {str} -- 'dae', 'stl' or 'obj'
+        vertices {[[]]} -- array of vertices (n, 3)
+        normals {[[]]} -- array of normals (n, 3)
+        uvs {[[]]} -- array of uv coordinates (n, 2)
+        indices {[[]]} -- array of triangles (m, 3)
+
+    Keyword Arguments:
+        shared_indices {bool} -- single index stream for vertex, normal and uv (only 'dae') (default: {False})
+
+    Returns:
+        function -- called with the output file path and the relative texture path
+    """
+
+    if mesh_format == 'dae':
+        return lambda output_file_path, relative_texture_path: write_collada(
+            output_file_path, vertices, normals, uvs, indices, relative_texture_path, shared_indices)
+    if mesh_format == 'stl':
+        return lambda output_file_path, _: write_stl(output_file_path, vertices, indices)
+    if mesh_format == 'obj':
+        return lambda output_file_path, relative_texture_path: write_obj(
+            output_file_path, vertices, normals, uvs, indices, relative_texture_path)
+
+    raise ValueError('Unknown mesh format: ' + mesh_format)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+location of the rover_sim package, only looked up with rospkg when it is needed the first time
+"""
+
+import os
+
+# environment variable with the path to the rover_sim package, skips the rospkg lookup
+PACKAGE_DIR_VARIABLE = 'ROVER_SIM_DIR'
+
+# path to the rover_sim package, None until it has been looked up or set
+_rover_sim_dir = None
+
+
+def rover_sim_path():
+    """path to the rover_sim package
+
+    The path is taken from set_rover_sim_path or the environment variable ROVER_SIM_DIR,
+    otherwise the first call looks the package up with rospkg (crawls the ROS_PACKAGE_PATH).
+
+    Returns:
+        str -- absolute path to the rover_sim package
+    """
+
+    global _rover_sim_dir
+
+    if _rover_sim_dir is None:
+        if os.environ.get(PACKAGE_DIR_VARIABLE):
+            set_rover_sim_path(os.environ[PACKAGE_DIR_VARIABLE])
+        else:
+            from rospkg import RosPack
+            _rover_sim_dir = RosPack().get_path('rover_sim')
+
+    return _rover_sim_dir
+
+
+def set_rover_sim_path(path):
+    """use this path for the rover_sim package instead of looking it up with rospkg
+
+    Arguments:
+        path {str} -- path to the rover_sim package
+    """
+
+    global _rover_sim_dir
+
+    if not os.path.isdir(path):
+        raise ValueError('The rover_sim package folder does not exist: ' + path)
+
+    _rover_sim_dir = os.path.abspath(path)
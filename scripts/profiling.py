@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""
+measure the duration and memory of the build stages
+
+The generation scripts mark their stages with 'with stage(name):', this costs nothing unless a profile is active.
+Inside of 'with profiled(folder):' every stage reports its duration and memory, stages inside of stages get
+names like 'terrain/parse' and repeated stages (e.g. one per landmark) are summed up. Optionally the top level stages
+are captured with cProfile and the allocated memory is traced with tracemalloc (slow), otherwise only
+the peak RSS of the process is reported.
+
+The report of every build is written into its own folder, so the profiles of different versions can be compared:
+    <folder>/<date>/profile.json  -- duration and memory of the stages
+    <folder>/<date>/<stage>.prof  -- cProfile statistics of the top level stages (e.g. for snakeviz or pstats)
+
+Worker processes (e.g. 'jobs' > 1) are not profiled, only the time the stage waited for them.
+"""
+
+import cProfile
+import json
+import os
+import platform
+import pstats
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+# folder of the profiles inside of a world folder
+PROFILE_FOLDER_NAME = '.profile'
+
+# active profile, None if the build is not profiled
+_profile = None
+
+
+def peak_rss():
+    """peak memory (resident set size) of the current process
+
+    Returns:
+        float -- peak RSS (MB), None if it is not available
+    """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes everywhere else
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+class Profile(object):
+    """durations and memory of the stages of a build
+
+    Attributes:
+        stages {OrderedDict} -- calls, time (s), memory (MB, peak traced memory above the start of the stage)
+                                and rss (MB, peak RSS of the process after the stage) by stage name
+        profiles {OrderedDict} -- cProfile.Profile objects of the top level stages by stage name
+        cprofile {bool} -- capture the top level stages with cProfile
+        memory {bool} -- trace the allocated memory with tracemalloc
+    """
+
+    def __init__(self, cprofile=True, memory=False):
+        self.stages = OrderedDict()
+        self.profiles = OrderedDict()
+        self.cprofile = cprofile
+        self.memory = memory and tracemalloc is not None
+
+        # names, start memory and peak memory of the open stages
+        self._open = []
+
+    def traced_peak(self):
+        """update the peak memory of the open stages and start a new measurement
+
+        Returns:
+            int -- currently traced memory (bytes)
+        """
+
+        current, peak = tracemalloc.get_traced_memory()
+        for open_stage in self._open:
+            open_stage[2] = max(open_stage[2], peak)
+
+        # python < 3.9 can not reset the peak, the peaks are measured since the start of tracing then
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+
+        return current
+
+    @contextmanager
+    def stage(self, name):
+        """measure a stage, see stage()"""
+
+        full_name = self._open[-1][0] + '/' + name if self._open else name
+        # listed in the order the stages start, parents before their children
+        result = self.stages.setdefault(full_name, {'calls': 0, 'time': 0.0, 'memory': None, 'rss': None})
+
+        profile = None
+        if self.cprofile and not self._open:
+            profile = cProfile.Profile()
+
+        current = self.traced_peak() if self.memory else 0
+        self._open.append([full_name, current, current])
+
+        start = time.time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            duration = time.time() - start
+
+            if self.memory:
+                self.traced_peak()
+            _, start_memory, peak_memory = self._open.pop()
+
+            result['calls'] += 1
+            result['time'] += duration
+            result['rss'] = peak_rss()
+            if self.memory:
+                result['memory'] = max(result['memory'] or 0, (peak_memory - start_memory) / (1024.0 * 1024.0))
+
+            if profile is not None:
+                self.profiles.setdefault(full_name, []).append(profile)
+
+    def write(self, output_folder):
+        """write the report and the cProfile statistics into a new folder
+
+        Arguments:
+            output_folder {str} -- folder of the profiles, a subfolder with the current date is created
+
+        Returns:
+            str -- path to the created folder
+        """
+
+        report_folder = os.path.join(output_folder, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        if not os.path.isdir(report_folder):
+            os.makedirs(report_folder)
+
+        report = OrderedDict([
+            ('date', datetime.now().isoformat()),
+            ('command', sys.argv),
+            ('python', platform.python_version()),
+            ('platform', platform.platform()),
+            ('stages', [OrderedDict([('name', name)] + sorted(result.items())) for name, result in self.stages.items()]),
+        ])
+        with open(os.path.join(report_folder, 'profile.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+
+        for name, profiles in self.profiles.items():
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(report_folder, name.replace(' ', '_') + '.prof'))
+
+        return report_folder
+
+    def summary(self):
+        """table of the stages
+
+        Returns:
+            str -- one line per stage with calls, time and memory
+        """
+
+        def megabytes(value):
+            return '-' if value is None else '{:.1f}'.format(value)
+
+        width = max([len("Stage")] + [len(name) for name in self.stages])
+        lines = ["{:<{}} {:>6} {:>10} {:>12} {:>10}".format("Stage", width, "Calls", "Time (s)", "Memory (MB)", "RSS (MB)")]
+        for name, result in self.stages.items():
+            lines.append("{:<{}} {:>6} {:>10.3f} {:>12} {:>10}".format(name, width, result['calls'], result['time'],
+                                                                        megabytes(result['memory']), megabytes(result['rss'])))
+        return '\n'.join(lines)
+
+
+def stage(name):
+    """context manager measuring a stage of the build, does nothing if no profile is active
+
+    Arguments:
+        name {str} -- name of the stage, e.g. 'parse'
+
+    Returns:
+        context manager
+    """
+
+    if _profile is None:
+        return _no_profile()
+    return _profile.stage(name)
+
+
+@contextmanager
+def _no_profile():
+    yield
+
+
+@contextmanager
+def profiled(output_folder, enabled=True, cprofile=True, memory=False):
+    """profile the stages inside of the context and write the report afterwards
+
+    Nested calls use the active profile, e.g. world_build inside of a profiled world_create.
+
+    Arguments:
+        output_folder {str} -- folder of the profiles, the report of this build is written into a new subfolder
+
+    Keyword Arguments:
+        enabled {bool} -- profile the build, otherwise nothing is done (default: {True})
+        cprofile {bool} -- capture the top level stages with cProfile (default: {True})
+        memory {bool} -- trace the allocated memory with tracemalloc (python 3), this slows down
+                         code creating many python objects (e.g. text formatting) considerably (default: {False})
+    """
+
+    global _profile
+
+    if not enabled or _profile is not None:
+        yield
+        return
+
+    profile = Profile(cprofile, memory)
+    started_tracing = profile.memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+
+    _profile = profile
+    try:
+        yield
+    finally:
+        _profile = None
+        if started_tracing:
+            tracemalloc.stop()
+
+        print("\n" + profile.summary())
+        print("Profile written to " + profile.write(output_folder) + "\n")
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+"""
+simplify a regular terrain grid to a right-triangulated irregular network (RTIN)
+with a maximal vertical error
+"""
+
+import numpy as np
+
+
+def rtin_grid_size(number_of_cols, number_of_rows):
+    """size of the smallest square RTIN grid (2^n + 1) which covers the terrain grid
+
+    Arguments:
+        number_of_cols {int} -- number of grid points along x
+        number_of_rows {int} -- number of grid points along y
+
+    Returns:
+        int -- number of grid points along each side of the RTIN grid
+    """
+
+    size = 2
+    while size + 1 < max(number_of_cols, number_of_rows, 3):
+        size *= 2
+
+    return size + 1
+
+
+def root_triangles(size):
+    """the two triangles which cover the whole RTIN grid
+
+    Every triangle is stored as its hypotenuse endpoints a, b and the right angle corner c.
+
+    Arguments:
+        size {int} -- number of grid points along each side of the RTIN grid
+
+    Returns:
+        () -- arrays a, b and c of the grid coordinates (n, 2)
+    """
+
+    tile_size = size - 1
+    a = np.array([[0, 0], [tile_size, tile_size]], dtype=np.int64)
+    b = np.array([[tile_size, tile_size], [0, 0]], dtype=np.int64)
+    c = np.array([[tile_size, 0], [0, tile_size]], dtype=np.int64)
+
+    return a, b, c
+
+
+def split_triangles(a, b, c):
+    """split triangles at the midpoint of their hypotenuse
+
+    Arguments:
+        a {[[]]} -- first endpoints of the hypotenuses (n, 2)
+        b {[[]]} -- second endpoints of the hypotenuses (n, 2)
+        c {[[]]} -- right angle corners (n, 2)
+
+    Returns:
+        () -- arrays a, b and c of the child triangles (2n, 2)
+    """
+
+    m = (a + b) // 2
+
+    # left child (c, a, m) and right child (b, c, m)
+    return np.concatenate((c, b)), np.concatenate((a, c)), np.concatenate((m, m))
+
+
+def is_splittable(a, c):
+    """triangles with legs longer than one grid cell can be split further
+
+    Arguments:
+        a {[[]]} -- first endpoints of the hypotenuses (n, 2)
+        c {[[]]} -- right angle corners (n, 2)
+
+    Returns:
+        [] -- boolean mask of the splittable triangles
+    """
+
+    return np.abs(a - c).sum(axis=1) > 1
+
+
+def on_border(p, q, last_x, last_y):
+    """check if the edges between p and q are longer than one grid cell and lie on the border of the terrain
+
+    Arguments:
+        p {[[]]} -- first endpoints of the edges (n, 2)
+        q {[[]]} -- second endpoints of the edges (n, 2)
+        last_x {int} -- largest x index of the terrain
+        last_y {int} -- largest y index of the terrain
+
+    Returns:
+        [] -- boolean mask of the edges on the border
+    """
+
+    inside = (p[:, 0] <= last_x) & (p[:, 1] <= last_y) & (q[:, 0] <= last_x) & (q[:, 1] <= last_y)
+    long_edge = np.abs(p - q).sum(axis=1) > 1
+
+    vertical = (p[:, 0] == q[:, 0]) & ((p[:, 0] == 0) | (p[:, 0] == last_x))
+    horizontal = (p[:, 1] == q[:, 1]) & ((p[:, 1] == 0) | (p[:, 1] == last_y))
+
+    return inside & long_edge & (vertical | horizontal)
+
+
+def covered_points(a, b, c):
+    """grid points covered by a triangle, relative to its corner a
+
+    Arguments:
+        a {[]} -- first endpoint of the hypotenuse (2,)
+        b {[]} -- second endpoint of the hypotenuse (2,)
+        c {[]} -- right angle corner (2,)
+
+    Returns:
+        () -- offsets of the covered grid points (n, 2) and their barycentric weights of a, b and c (n,)
+    """
+
+    corners = np.stack((a, b, c)) - a
+    lower = corners.min(axis=0)
+    upper = corners.max(axis=0)
+    offsets = np.stack(np.meshgrid(np.arange(lower[0], upper[0] + 1), np.arange(lower[1], upper[1] + 1),
+                                   indexing='ij'), axis=-1).reshape(-1, 2)
+
+    v0, v1 = corners[1], corners[2]
+    denominator = float(v0[0] * v1[1] - v1[0] * v0[1])
+    weight_b = (offsets[:, 0] * v1[1] - v1[0] * offsets[:, 1]) / denominator
+    weight_c = (v0[0] * offsets[:, 1] - offsets[:, 0] * v0[1]) / denominator
+    weight_a = 1 - weight_b - weight_c
+
+    inside = (weight_a >= -1e-9) & (weight_b >= -1e-9) & (weight_c >= -1e-9)
+    return offsets[inside], weight_a[inside], weight_b[inside], weight_c[inside]
+
+
+def triangle_deviations(heights, size, a, b, c, chunk_size=1000000):
+    """calculate the maximal vertical distance between the grid points covered by triangles and the triangles
+
+    Arguments:
+        heights {[]} -- flattened heights of the (square) RTIN grid
+        size {int} -- number of grid points along each side of the RTIN grid
+        a {[[]]} -- first endpoints of the hypotenuses (n, 2)
+        b {[[]]} -- second endpoints of the hypotenuses (n, 2)
+        c {[[]]} -- right angle corners (n, 2)
+
+    Keyword Arguments:
+        chunk_size {int} -- maximal number of grid points tested at once (default: {1000000})
+
+    Returns:
+        [] -- maximal deviation (m) of every triangle
+    """
+
+    deviations = np.zeros(len(a))
+
+    # triangles of the same shape cover the same grid points relative to their corner a
+    shapes = np.concatenate((b - a, c - a), axis=1) + size
+    keys = ((shapes[:, 0] * 2 * size + shapes[:, 1]) * 2 * size + shapes[:, 2]) * 2 * size + shapes[:, 3]
+    unique_keys, first = np.unique(keys, return_index=True)
+
+    for key, index in zip(unique_keys, first):
+        offsets, weight_a, weight_b, weight_c = covered_points(a[index], b[index], c[index])
+        flat_offsets = offsets[:, 0] * size + offsets[:, 1]
+
+        selected = np.nonzero(keys == key)[0]
+        step = max(1, chunk_size // len(offsets))
+
+        for start in range(0, len(selected), step):
+            chunk = selected[start:start + step]
+            flat_a = a[chunk, 0] * size + a[chunk, 1]
+            heights_a = heights[flat_a][:, np.newaxis]
+            heights_b = heights[b[chunk, 0] * size + b[chunk, 1]][:, np.newaxis]
+            heights_c = heights[c[chunk, 0] * size + c[chunk, 1]][:, np.newaxis]
+
+            interpolated = weight_a * heights_a + weight_b * heights_b + weight_c * heights_c
+            real = heights[flat_a[:, np.newaxis] + flat_offsets]
+            deviations[chunk] = np.abs(interpolated - real).max(axis=1)
+
+    return deviations
+
+
+def compute_rtin_errors(heights, keep_border=False):
+    """calculate the approximation error of every possible split of the RTIN grid
+
+    The error of a grid point is the error of the triangles which are split at this point, i.e. the maximal
+    vertical distance between these triangles and the grid points they cover, including the errors of all
+    their descendants. So a triangle which is not split deviates at most by its error from the terrain.
+    Triangles which cross the border of the terrain are always split, triangles outside of the terrain never.
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y]
+
+    Keyword Arguments:
+        keep_border {bool} -- keep all the grid points on the border, so neighbouring tiles fit together (default: {False})
+
+    Returns:
+        [[]] -- 2d array of errors of the (square) RTIN grid
+    """
+
+    number_of_cols, number_of_rows = heights.shape
+    size = rtin_grid_size(number_of_cols, number_of_rows)
+    last_x, last_y = number_of_cols - 1, number_of_rows - 1
+
+    # extend the terrain to the RTIN grid
+    padded = np.pad(np.asarray(heights, dtype=np.float64),
+                    ((0, size - number_of_cols), (0, size - number_of_rows)), mode='edge').reshape(-1)
+
+    # collect all splittable triangles, from the largest to the smallest
+    levels = []
+    a, b, c = root_triangles(size)
+    while len(a) and is_splittable(a[:1], c[:1])[0]:
+        levels.append((a, b, c))
+        a, b, c = split_triangles(a, b, c)
+
+    errors = np.zeros(size * size)
+
+    # smallest triangles first so the errors of the children are known for their parents
+    for depth in reversed(range(len(levels))):
+        a, b, c = levels[depth]
+
+        m = (a + b) // 2
+        flat_m = m[:, 0] * size + m[:, 1]
+
+        corners = np.stack((a, b, c))
+        lower = corners.min(axis=0)
+        upper = corners.max(axis=0)
+
+        # triangles crossing the border of the terrain have to be split
+        crossing = (((lower[:, 0] < last_x) & (upper[:, 0] > last_x))
+                    | ((lower[:, 1] < last_y) & (upper[:, 1] > last_y)))
+        # triangles completely outside of the terrain do not matter
+        outside = ~crossing & ((upper[:, 0] > last_x) | (upper[:, 1] > last_y))
+        inside = ~(crossing | outside)
+
+        # difference between the interpolated and the real heights of all the covered grid points
+        triangle_errors = np.zeros(len(a))
+        triangle_errors[inside] = triangle_deviations(padded, size, a[inside], b[inside], c[inside])
+
+        # include the errors of the children (midpoints of their hypotenuses)
+        if depth + 1 < len(levels):
+            left = (a + c) // 2
+            right = (b + c) // 2
+            triangle_errors = np.maximum(triangle_errors, errors[left[:, 0] * size + left[:, 1]])
+            triangle_errors = np.maximum(triangle_errors, errors[right[:, 0] * size + right[:, 1]])
+
+        triangle_errors[crossing] = np.inf
+        triangle_errors[outside] = 0
+
+        if keep_border:
+            border = on_border(a, b, last_x, last_y) | on_border(a, c, last_x, last_y) | on_border(b, c, last_x, last_y)
+            triangle_errors[border] = np.inf
+
+        # neighbouring triangles share the midpoint of their hypotenuse
+        np.maximum.at(errors, flat_m, triangle_errors)
+
+    return errors.reshape(size, size)
+
+
+def extract_rtin_triangles(errors, max_error, number_of_cols, number_of_rows):
+    """generate the triangles of the RTIN mesh for a maximal error
+
+    Arguments:
+        errors {[[]]} -- 2d array of errors of the RTIN grid (see compute_rtin_errors)
+        max_error {float} -- maximal vertical error (m)
+        number_of_cols {int} -- number of grid points of the terrain along x
+        number_of_rows {int} -- number of grid points of the terrain along y
+
+    Returns:
+        [[]] -- array of triangles (n, 3), grid indices (ind_x * number_of_rows + ind_y) of the corners
+    """
+
+    size = errors.shape[0]
+    errors = errors.reshape(-1)
+
+    triangles = []
+    a, b, c = root_triangles(size)
+    while len(a):
+        m = (a + b) // 2
+        split = is_splittable(a, c) & (errors[m[:, 0] * size + m[:, 1]] > max_error)
+
+        # keep the corners counter clockwise (normal points up)
+        triangles.append(np.stack((a[~split], c[~split], b[~split]), axis=1))
+
+        a, b, c = split_triangles(a[split], b[split], c[split])
+
+    triangles = np.concatenate(triangles)
+
+    # remove the triangles outside of the terrain
+    inside = ((triangles[..., 0] < number_of_cols) & (triangles[..., 1] < number_of_rows)).all(axis=1)
+    triangles = triangles[inside]
+
+    return triangles[..., 0] * number_of_rows + triangles[..., 1]
+
+
+def mesh_height_deviation(heights, triangles, chunk_size=1000000):
+    """calculate the maximal vertical distance between the grid points and the mesh
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y]
+        triangles {[[]]} -- array of triangles (n, 3), grid indices of the corners
+
+    Keyword Arguments:
+        chunk_size {int} -- maximal number of grid points tested at once (default: {1000000})
+
+    Returns:
+        float -- maximal deviation (m)
+    """
+
+    number_of_cols, number_of_rows = heights.shape
+    flat_heights = np.asarray(heights, dtype=np.float64).reshape(-1)
+
+    corners = np.stack(np.divmod(triangles, number_of_rows), axis=-1)
+    lower = corners.min(axis=1)
+    extent = (corners.max(axis=1) - lower).max(axis=1)
+
+    max_deviation = 0.0
+
+    # triangles of the same size share the same offsets to the grid points inside their bounding box
+    for triangle_size in np.unique(extent):
+        offsets = np.stack(np.meshgrid(np.arange(triangle_size + 1), np.arange(triangle_size + 1),
+                                       indexing='ij'), axis=-1).reshape(-1, 2)
+        selected = np.nonzero(extent == triangle_size)[0]
+        step = max(1, chunk_size // len(offsets))
+
+        for start in range(0, len(selected), step):
+            chunk = selected[start:start + step]
+            a, b, c = corners[chunk, 0], corners[chunk, 1], corners[chunk, 2]
+            points = lower[chunk, np.newaxis] + offsets
+
+            # barycentric coordinates of the grid points
+            v0 = (b - a)[:, np.newaxis]
+            v1 = (c - a)[:, np.newaxis]
+            v2 = points - a[:, np.newaxis]
+            denominator = (v0[..., 0] * v1[..., 1] - v1[..., 0] * v0[..., 1]).astype(np.float64)
+            weight_b = (v2[..., 0] * v1[..., 1] - v1[..., 0] * v2[..., 1]) / denominator
+            weight_c = (v0[..., 0] * v2[..., 1] - v2[..., 0] * v0[..., 1]) / denominator
+            weight_a = 1 - weight_b - weight_c
+
+            inside = ((weight_a >= 0) & (weight_b >= 0) & (weight_c >= 0)
+                      & (points[..., 0] < number_of_cols) & (points[..., 1] < number_of_rows))
+            if not inside.any():
+                continue
+
+            heights_a = flat_heights[triangles[chunk, 0]][:, np.newaxis]
+            heights_b = flat_heights[triangles[chunk, 1]][:, np.newaxis]
+            heights_c = flat_heights[triangles[chunk, 2]][:, np.newaxis]
+            interpolated = weight_a * heights_a + weight_b * heights_b + weight_c * heights_c
+
+            flat_points = np.minimum(points[..., 0], number_of_cols - 1) * number_of_rows \
+                + np.minimum(points[..., 1], number_of_rows - 1)
+            deviation = np.abs(interpolated - flat_heights[flat_points])[inside]
+            max_deviation = max(max_deviation, float(deviation.max()))
+
+    return max_deviation
+
+
+def decimate(heights, max_error, keep_border=False, verbose=True):
+    """simplify the regular grid of a terrain to a mesh with a maximal vertical error
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y]
+        max_error {float} -- maximal vertical error (m)
+
+    Keyword Arguments:
+        keep_border {bool} -- keep all the grid points on the border, so neighbouring tiles fit together (default: {False})
+        verbose {bool} -- print the triangle count reduction and the height deviation (default: {True})
+
+    Returns:
+        () -- grid indices of the used vertices and the triangles (n, 3) indexing into these vertices
+    """
+
+    number_of_cols, number_of_rows = heights.shape
+
+    errors = compute_rtin_errors(heights, keep_border)
+    grid_triangles = extract_rtin_triangles(errors, max_error, number_of_cols, number_of_rows)
+
+    if verbose:
+        full_count = 2 * (number_of_cols - 1) * (number_of_rows - 1)
+        count = len(grid_triangles)
+        deviation = mesh_height_deviation(heights, grid_triangles)
+        print('Decimated terrain mesh from {} to {} triangles ({:.1f}% less), max height deviation {:.3f} m'.format(
+            full_count, count, 100.0 * (full_count - count) / full_count, deviation))
+
+    # only keep the vertices used by the triangles
+    vertex_indices, triangles = np.unique(grid_triangles, return_inverse=True)
+
+    return vertex_indices, triangles.reshape(-1, 3)
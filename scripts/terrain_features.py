@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+"""
+stamp procedural terrain features (craters, boulders and slopes) into a heightmap grid
+
+The features are binned by size, every feature only evaluates the stencil of grid points around it
+which matches its size class, so thousands of features never touch the whole grid.
+"""
+
+import numpy as np
+
+# maximal number of (grid point, feature) pairs evaluated at once
+CHUNK_SIZE = 1024 * 1024
+
+
+def crater_profile(r, rim_height=0.15):
+    """relative height of a crater (bowl with a raised rim)
+
+    Arguments:
+        r {[]} -- distance to the center relative to the crater radius
+
+    Keyword Arguments:
+        rim_height {float} -- height of the rim relative to the depth (default: {0.15})
+
+    Returns:
+        [] -- height relative to the depth, -1 + rim_height at the center, 0 from twice the radius
+    """
+
+    inside = r * r - 1 + rim_height
+    outside = rim_height * np.square(np.clip(2 - r, 0, 1))
+    return np.where(r < 1, inside, outside)
+
+
+def boulder_profile(r):
+    """relative height of a boulder (half ellipsoid)
+
+    Arguments:
+        r {[]} -- distance to the center relative to the boulder radius
+
+    Returns:
+        [] -- height relative to the boulder height, 0 outside of the radius
+    """
+
+    return np.sqrt(np.clip(1 - r * r, 0, 1))
+
+
+# profile function and radius of influence (relative to the feature radius) of the feature types
+PROFILES = {
+    'crater': (crater_profile, 2.0),
+    'boulder': (boulder_profile, 1.0),
+}
+
+
+def power_law_sizes(random_state, count, min_size, max_size, exponent):
+    """draw sizes from a truncated power law, the number of features larger than s is proportional to s^-exponent
+
+    Arguments:
+        random_state {np.random.RandomState} -- random generator
+        count {int} -- number of sizes
+        min_size {float} -- smallest size
+        max_size {float} -- largest size
+        exponent {float} -- exponent of the cumulative distribution
+
+    Returns:
+        [] -- sizes
+    """
+
+    u = random_state.uniform(size=count)
+    low, high = min_size ** -exponent, max_size ** -exponent
+    return (low - u * (low - high)) ** (-1.0 / exponent)
+
+
+def random_features(random_state, extent, density, min_radius, max_radius, exponent, height_ratio):
+    """random positions and sizes of round features
+
+    Arguments:
+        random_state {np.random.RandomState} -- random generator
+        extent {()} -- width and depth of the terrain (m)
+        density {float} -- average number of features per square meter
+        min_radius {float} -- smallest radius (m)
+        max_radius {float} -- largest radius (m)
+        exponent {float} -- exponent of the size distribution (see power_law_sizes)
+        height_ratio {float} -- height (or depth) of a feature relative to its radius
+
+    Returns:
+        () -- arrays of the x and y coordinates (m), radii (m) and heights (m)
+    """
+
+    count = random_state.poisson(density * extent[0] * extent[1])
+    xs = random_state.uniform(0, extent[0], count)
+    ys = random_state.uniform(0, extent[1], count)
+    radii = power_law_sizes(random_state, count, min_radius, max_radius, exponent)
+
+    return xs, ys, radii, radii * height_ratio
+
+
+def size_classes(reach):
+    """sort features into classes of similar size, the features of a class share the same stencil of grid points
+
+    Arguments:
+        reach {[]} -- radii of influence (grid points)
+
+    Returns:
+        [] -- half width of the stencil of every feature (power of two, grid points)
+    """
+
+    # the center is rounded to the closest grid point, so one more point is needed
+    needed = np.ceil(reach).astype(np.int64) + 1
+    return 2 ** np.ceil(np.log2(needed)).astype(np.int64)
+
+
+def stamp_features(heights, spacing, xs, ys, radii, amplitudes, kind):
+    """add round features to a heightmap grid (in place)
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y], grid point (0, 0) at (0, 0)
+        spacing {float} -- distance between the grid points (m)
+        xs {[]} -- x coordinates of the feature centers (m)
+        ys {[]} -- y coordinates of the feature centers (m)
+        radii {[]} -- radii of the features (m)
+        amplitudes {[]} -- heights (boulders) or depths (craters) of the features (m)
+        kind {str} -- type of the features, 'crater' or 'boulder'
+
+    Returns:
+        [[]] -- the heights
+    """
+
+    profile, influence = PROFILES[kind]
+    if not len(xs):
+        return heights
+
+    number_of_cols, number_of_rows = heights.shape
+    cols = np.asarray(xs, dtype=np.float64) / spacing
+    rows = np.asarray(ys, dtype=np.float64) / spacing
+    radii = np.asarray(radii, dtype=np.float64) / spacing
+    amplitudes = np.asarray(amplitudes, dtype=np.float64)
+
+    # works for views of the heights as well (e.g. transposed)
+    added = np.zeros(heights.size)
+
+    half_widths = size_classes(radii * influence)
+    for half_width in np.unique(half_widths):
+        offsets = np.arange(-half_width, half_width + 1)
+        offset_cols = np.repeat(offsets, len(offsets))
+        offset_rows = np.tile(offsets, len(offsets))
+
+        selected = np.nonzero(half_widths == half_width)[0]
+        step = max(1, CHUNK_SIZE // len(offset_cols))
+
+        for first in range(0, len(selected), step):
+            chunk = selected[first:first + step, np.newaxis]
+
+            # grid points around the rounded center of every feature
+            point_cols = np.round(cols[chunk]).astype(np.int64) + offset_cols
+            point_rows = np.round(rows[chunk]).astype(np.int64) + offset_rows
+            distance = np.hypot(point_cols - cols[chunk], point_rows - rows[chunk]) / radii[chunk]
+
+            inside = ((distance < influence) & (point_cols >= 0) & (point_cols < number_of_cols)
+                      & (point_rows >= 0) & (point_rows < number_of_rows))
+            values = (amplitudes[chunk] * profile(distance))[inside]
+            added += np.bincount((point_cols * number_of_rows + point_rows)[inside], values, minlength=added.size)
+
+    heights += added.reshape(heights.shape)
+
+    return heights
+
+
+def add_slope(heights, spacing, angle, offset, width, height):
+    """add a smooth step (slope) across the whole heightmap grid (in place)
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y], grid point (0, 0) at (0, 0)
+        spacing {float} -- distance between the grid points (m)
+        angle {float} -- direction in which the terrain rises (rad)
+        offset {float} -- distance of the center of the slope from (0, 0) along this direction (m)
+        width {float} -- horizontal length of the slope (m)
+        height {float} -- height difference of the slope (m)
+
+    Returns:
+        [[]] -- the heights
+    """
+
+    xs = np.arange(heights.shape[0])[:, np.newaxis] * spacing
+    ys = np.arange(heights.shape[1])[np.newaxis, :] * spacing
+    t = np.clip(((xs * np.cos(angle) + ys * np.sin(angle)) - offset) / width + 0.5, 0, 1)
+    heights += height * t * t * (3 - 2 * t)
+
+    return heights
+
+
+def add_terrain_features(heights, spacing, seed=0, crater_density=0.0, crater_radius=(1.0, 8.0), crater_depth_ratio=0.2,
+                         boulder_density=0.0, boulder_radius=(0.1, 0.6), boulder_height_ratio=0.6, slopes=0,
+                         slope_height=1.0, size_exponent=2.0):
+    """stamp random craters, boulders and slopes into a heightmap grid (in place)
+
+    Arguments:
+        heights {[[]]} -- 2d array of heights [ind_x, ind_y], grid point (0, 0) at (0, 0)
+        spacing {float} -- distance between the grid points (m)
+
+    Keyword Arguments:
+        seed {int} -- seed of the random generator (default: {0})
+        crater_density {float} -- average number of craters per square meter (default: {0.0})
+        crater_radius {()} -- smallest and largest crater radius (m) (default: {(1.0, 8.0)})
+        crater_depth_ratio {float} -- depth of a crater relative to its radius (default: {0.2})
+        boulder_density {float} -- average number of boulders per square meter (default: {0.0})
+        boulder_radius {()} -- smallest and largest boulder radius (m) (default: {(0.1, 0.6)})
+        boulder_height_ratio {float} -- height of a boulder relative to its radius (default: {0.6})
+        slopes {int} -- number of slopes across the terrain (default: {0})
+        slope_height {float} -- largest height difference of a slope (m) (default: {1.0})
+        size_exponent {float} -- exponent of the size distributions, larger: more small features (default: {2.0})
+
+    Returns:
+        [[]] -- the heights
+    """
+
+    random_state = np.random.RandomState(seed)
+    extent = ((heights.shape[0] - 1) * spacing, (heights.shape[1] - 1) * spacing)
+
+    for _ in range(slopes):
+        add_slope(heights, spacing, random_state.uniform(0, 2 * np.pi), random_state.uniform(0, max(extent)),
+                  random_state.uniform(0.1, 0.5) * max(extent), random_state.uniform(0.2, 1) * slope_height)
+
+    xs, ys, radii, depths = random_features(random_state, extent, crater_density, crater_radius[0], crater_radius[1],
+                                            size_exponent, crater_depth_ratio)
+    stamp_features(heights, spacing, xs, ys, radii, depths, 'crater')
+
+    xs, ys, radii, sizes = random_features(random_state, extent, boulder_density, boulder_radius[0], boulder_radius[1],
+                                           size_exponent, boulder_height_ratio)
+    stamp_features(heights, spacing, xs, ys, radii, sizes, 'boulder')
+
+    return heights
@@ -2,39 +2,80 @@
 # -*- coding: utf-8 -*-
 """
 This script calls all the necessary generation scripts and creates a world folder
-from specified provided files. If the world already exists, it replaces 
-landmarks and terrain but keeps manual changes to the .world file
+from specified provided files. If the world already exists, it regenerates
+outdated landmarks and terrain but keeps manual changes to the .world file
 """
 from lxml import etree
 import os.path as op
 import os, sys
 from argparse import ArgumentParser
+from glob import glob
 import shutil
 import yaml
 
-from rospkg import RosPack
-
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.package_path import rover_sim_path, set_rover_sim_path
+from rover_sim.scripts.landmarks.generate_landmarks import create_landmarks, read_landmark_rows, landmark_model_paths
+from rover_sim.scripts.generate_terrain import generate_terrain, VISUAL_MESH_FORMATS, COLLISION_MESH_FORMATS
+from rover_sim.scripts.profiling import stage, profiled, PROFILE_FOLDER_NAME
+from rover_sim.scripts.build_manifest import read_manifest, write_manifest, input_state, is_up_to_date, record_step, previous_inputs
+
+
+def backup_output(path, backup_folder):
+    """move an outdated generated model into the backup folder
+
+    Arguments:
+        path {str} -- path to the generated model
+        backup_folder {str} -- path to the backup folder
+    """
 
-from rover_sim.scripts.landmarks.generate_landmarks import create_landmarks
-from rover_sim.scripts.generate_terrain import generate_terrain
+    if not op.exists(path):
+        return
 
+    if not op.isdir(backup_folder):
+        os.makedirs(backup_folder)
 
-def world_build(world_path=None, force=False):
+    target = op.join(backup_folder, op.basename(path))
+    if op.exists(target):
+        shutil.rmtree(target)
+
+    print("Moving outdated " + path + " to backup at " + target)
+    os.rename(path, target)
+
+
+def world_build(world_path=None, force=False, use_cache=True, max_error=None, collision_resolution=0.5, tiles=None, jobs=1,
+                native_heightmap=False, landmark_atlas=False, rebuild=False, cache_dir=None, yes=False, mesh_format='dae',
+                collision_format=None):
     """
     Builds the world from files in the specified folder. The following files should be present:
-        'Heightmap.csv':  heightmap csv file (ERC ver2) 
+        'Heightmap.csv':  heightmap csv file (ERC ver2 matrix or ver1 point list) 
         'Landmarks.csv':  position list of the landmarks
     
+    The inputs and outputs of every step are recorded in the build manifest '.build_manifest.json',
+    steps whose inputs (files, resources, scripts) and options did not change are skipped.
+    
     Arguments:
         world_path {str} -- path to the directory where the world will be generated,
                             if empty: use current path of the shell (default: {None})
         force {bool} -- delete old .world file (default: {False})
+        use_cache {bool} -- use the binary heightmap cache in '.cache' (default: {True})
+        max_error {float} -- decimate the terrain mesh with this maximal vertical error (m) (default: {None}, full resolution)
+        collision_resolution {float} -- grid spacing of the terrain collision mesh (m), None: use the visual mesh (default: {0.5})
+        tiles {()} -- split the terrain into (nx, ny) tile models (default: {None}, single model)
+        jobs {int} -- number of processes generating the terrain tiles and the landmarks in parallel (default: {1})
+        native_heightmap {bool} -- use the gazebo heightmap geometry instead of a terrain mesh (default: {False})
+        landmark_atlas {bool} -- new landmark models share a single texture atlas (default: {False})
+        rebuild {bool} -- regenerate all the models, even if they are up to date (default: {False})
+        cache_dir {str} -- path to the heightmap and mesh cache folder (default: {None}, '.cache' in the world folder)
+        yes {bool} -- do not ask for confirmation if the world is not inside the 'worlds' directory (default: {False})
+        mesh_format {str} -- file format of the visual terrain mesh, 'dae' or 'obj' (default: {'dae'})
+        collision_format {str} -- file format of the terrain collision mesh, 'dae', 'obj' or 'stl' (default: {None}, same as visual)
     """
 
+    rover_sim_dir = rover_sim_path()
+
     if world_path is None:
         base_path = os.getcwd()
     else:
@@ -51,7 +92,7 @@ def world_build(world_path=None, force=False):
     heightmap_csv = op.join(base_path, "Heightmap.csv")
 
 
-    if not op.samefile(op.split(base_path)[0], op.join(rover_sim_dir, "worlds")):
+    if not yes and not op.samefile(op.split(base_path)[0], op.join(rover_sim_dir, "worlds")):
         print("The world will be generated at " + base_path)
         if "y" != raw_input("This is not the standard location inside the 'worlds' directory.\n"
                 + "Are you sure? Type y to continue\n").lower():
@@ -65,15 +106,17 @@ def world_build(world_path=None, force=False):
     if os.path.exists(custom_models):
         if not os.path.isdir(custom_models):
             raise ValueError("'models' has to be a directory, found file at " + custom_models)
-        else:
-            if os.path.exists(backup_models):
-                print("Removing old models backup folder at " + backup_models)
-                shutil.rmtree(backup_models)
-            print("Copying old 'models' folder to backup at " + backup_models)
-            os.rename(custom_models, backup_models)
-    
-    print("Creating new models directory at " + custom_models + "\n")
-    os.mkdir(custom_models)
+    else:
+        print("Creating new models directory at " + custom_models + "\n")
+        os.mkdir(custom_models)
+
+    manifest = read_manifest(base_path)
+    if rebuild:
+        manifest['steps'].pop('terrain', None)
+        manifest['steps'].pop('landmarks', None)
+
+    # the generated models depend on the scripts as well
+    scripts_folder = op.join(rover_sim_dir, "scripts")
 
 
     no_terrain = False
@@ -89,8 +132,9 @@ def world_build(world_path=None, force=False):
         print("Building world without landmarks\n")
         no_landmarks = True
 
+    start_yaml = os.path.join(base_path, "start.yaml")
     try:
-        with open(os.path.join(base_path, "start.yaml"), 'r') as stream:
+        with open(start_yaml, 'r') as stream:
             loaded = yaml.safe_load(stream)
             cam_pos = (loaded.get('start_x'), loaded.get('start_y'), loaded.get('start_z'))
             print(cam_pos)
@@ -101,11 +145,67 @@ def world_build(world_path=None, force=False):
 
     ## Generate the Models from the Resources
     
-    if not no_terrain:
-        generate_terrain(name=terran_name, csv_file_path=heightmap_csv, output_folder=custom_models, model_folder=custom_models)
+    terrain_models = []
+    old_terrain = manifest['steps'].get('terrain', {})
+    if no_terrain:
+        # models of a previous terrain
+        for output in old_terrain.get('outputs', []):
+            backup_output(output, backup_models)
+        manifest['steps'].pop('terrain', None)
+        write_manifest(base_path, manifest)
+    else:
+        terrain_inputs = input_state([heightmap_csv, op.join(rover_sim_dir, "resources", "terrain"), scripts_folder],
+                                     previous_inputs(manifest, 'terrain'))
+        terrain_options = dict(max_error=max_error, collision_resolution=collision_resolution, tiles=tiles,
+                               native_heightmap=native_heightmap, mesh_format=mesh_format, collision_format=collision_format)
+
+        if is_up_to_date(manifest, 'terrain', terrain_inputs, terrain_options):
+            print("Terrain is up to date, skipping generation\n")
+            terrain_models = old_terrain['models']
+        else:
+            # old terrain models, also from builds without manifest
+            old_outputs = old_terrain.get('outputs', []) + glob(op.join(custom_models, terran_name)) \
+                + glob(op.join(custom_models, terran_name + "_*_*"))
+            for output in sorted(set(old_outputs)):
+                backup_output(output, backup_models)
+
+            with stage('terrain'):
+                terrain_models = generate_terrain(name=terran_name, csv_file_path=heightmap_csv, output_folder=custom_models,
+                                                  model_folder=custom_models, use_cache=use_cache, max_error=max_error,
+                                                  collision_resolution=collision_resolution, tiles=tiles, jobs=jobs,
+                                                  native_heightmap=native_heightmap, cache_dir=cache_dir, mesh_format=mesh_format,
+                                                  collision_format=collision_format)
+
+            record_step(manifest, 'terrain', terrain_inputs, terrain_options,
+                        [op.join(custom_models, model) for model in terrain_models], models=terrain_models)
+        write_manifest(base_path, manifest)
     
-    if not no_landmarks:                                                                                                         # ↓TODO
-        create_landmarks(name=all_landmarks_name, input_csv_path=landmarks_csv, output_path=custom_models, landmark_models_path="/tmp/not_used_yet_TODO")
+    landmarks_output = op.join(custom_models, all_landmarks_name)
+    if no_landmarks:
+        # model of previous landmarks, the landmark models in rover_sim/models are shared with other worlds
+        for output in manifest['steps'].pop('landmarks', {}).get('outputs', []):
+            if op.dirname(output) == custom_models:
+                backup_output(output, backup_models)
+        write_manifest(base_path, manifest)
+    else:
+        landmarks_inputs = input_state([landmarks_csv, op.join(rover_sim_dir, "resources", "landmarks"), scripts_folder],
+                                       previous_inputs(manifest, 'landmarks'))
+        landmarks_options = dict(atlas=landmark_atlas)
+
+        if is_up_to_date(manifest, 'landmarks', landmarks_inputs, landmarks_options):
+            print("Landmarks are up to date, skipping generation\n")
+        else:
+            backup_output(landmarks_output, backup_models)
+                                                                                                                             # ↓TODO
+            with stage('landmarks'):
+                create_landmarks(name=all_landmarks_name, input_csv_path=landmarks_csv, output_path=custom_models, landmark_models_path="/tmp/not_used_yet_TODO",
+                                 jobs=jobs, atlas=landmark_atlas)
+
+            # the world's model only includes the landmark models, so they are outputs as well
+            landmark_names = [row[0] for row in read_landmark_rows(landmarks_csv)]
+            record_step(manifest, 'landmarks', landmarks_inputs, landmarks_options,
+                        [landmarks_output] + landmark_model_paths(landmark_names))
+        write_manifest(base_path, manifest)
 
     try:
         os.rmdir( custom_models )
@@ -116,6 +216,9 @@ def world_build(world_path=None, force=False):
 
     ## Create .world file
 
+    world_inputs = input_state([start_yaml], previous_inputs(manifest, 'world'))
+    world_options = dict(terrain_models=terrain_models, landmarks=not no_landmarks)
+
     if force:
         if op.exists(world_file):
             print("Removing old world file at " + world_file)
@@ -124,6 +227,8 @@ def world_build(world_path=None, force=False):
     if op.exists(world_file):
         print("World file found at " + world_file)
         print("Skipping creation, leaving old world file\n")
+        if not is_up_to_date(manifest, 'world', world_inputs, world_options):
+            print("The world file does not match the current models or start position, use --force to recreate it\n")
     else:
         root = etree.Element('sdf')
         root.set("version", "1.3")
@@ -161,13 +266,18 @@ def world_build(world_path=None, force=False):
         light.set("name", "light2")
         world.append(light)
 
-        include_terrain = etree.Element("include")
-        uri = etree.SubElement(include_terrain,"uri")
         if no_terrain:
+            include_terrain = etree.Element("include")
+            uri = etree.SubElement(include_terrain,"uri")
             uri.text = "model://ground_plane"
-        else:
-            uri.text = "model://" + terran_name
-        world.append(include_terrain)
+            world.append(include_terrain)
+
+        # one include per terrain tile
+        for terrain_model in terrain_models:
+            include_terrain = etree.Element("include")
+            uri = etree.SubElement(include_terrain,"uri")
+            uri.text = "model://" + terrain_model
+            world.append(include_terrain)
 
         if not no_landmarks:
             include_landmarks = etree.Element("include")
@@ -182,7 +292,11 @@ def world_build(world_path=None, force=False):
 
 
         #print(etree.tostring(tree, pretty_print=True, encoding='utf8', xml_declaration=True))
-        tree.write(world_file, pretty_print=True, encoding='utf8', xml_declaration=True)
+        with stage('world file'):
+            tree.write(world_file, pretty_print=True, encoding='utf8', xml_declaration=True)
+
+        record_step(manifest, 'world', world_inputs, world_options, [world_file])
+        write_manifest(base_path, manifest)
 
 
 if __name__ == '__main__':
@@ -192,15 +306,37 @@ if __name__ == '__main__':
     # parse command line arguments
     parser = ArgumentParser(
         description="Builds the world from files in the specified folder. The following files should be present:\n"
-                + "  'Heightmap.csv':  heightmap csv file (ERC ver2)\n"
+                + "  'Heightmap.csv':  heightmap csv file (ERC ver2 matrix or ver1 point list)\n"
                 + "  'Landmarks.csv':  position list of the landmarks""",
         formatter_class=RawDescriptionHelpFormatter
     )
 
     parser.add_argument("world", type=str, help = "Path to the world directory, if empty: use shell working dir" , nargs="?", default=None)
     parser.add_argument("-f", "--force", action="store_true", help = "Force overwrite of old world file")
+    parser.add_argument("--no-cache", action="store_true", help = "Always parse the heightmap csv file, do not use the binary cache")
+    parser.add_argument("-e", "--max-error", type=float, help = "Decimate the terrain mesh with this maximal vertical error (m), full resolution if not given")
+    parser.add_argument("-c", "--collision-resolution", type=float, help = "Grid spacing of the terrain collision mesh (m), 0 to use the visual mesh (default: 0.5)", default=0.5)
+    parser.add_argument("-t", "--tiles", type=int, nargs=2, metavar=("NX", "NY"), help = "Split the terrain into NX x NY tile models")
+    parser.add_argument("-j", "--jobs", type=int, help = "Number of processes generating the terrain tiles and the landmarks in parallel (default: 1)", default=1)
+    parser.add_argument("--native-heightmap", action="store_true", help = "Use the gazebo heightmap geometry (16 bit png) instead of a terrain mesh")
+    parser.add_argument("--mesh-format", type=str, help = "File format of the visual terrain mesh", choices=VISUAL_MESH_FORMATS, default='dae')
+    parser.add_argument("--collision-format", type=str, help = "File format of the terrain collision mesh, same as the visual mesh if not given", choices=COLLISION_MESH_FORMATS)
+    parser.add_argument("--landmark-atlas", action="store_true", help = "Render the textures of all new landmarks into a single texture atlas")
+    parser.add_argument("--rebuild", action="store_true", help = "Regenerate all models, even if they are up to date")
+    parser.add_argument("-y", "--yes", action="store_true", help = "Do not ask for confirmation, e.g. if the world is not inside the 'worlds' directory")
+    parser.add_argument("--package-dir", type=str, help = "Path to the rover_sim package, instead of looking it up with rospkg")
+    parser.add_argument("--profile", action="store_true", help = "Report duration and memory of the build stages and write the profiles (cProfile) into '" + PROFILE_FOLDER_NAME + "' in the world directory")
+    parser.add_argument("--profile-memory", action="store_true", help = "Trace the memory allocated by the stages with tracemalloc while profiling (slows the build down)")
     args = parser.parse_args()
 
+    if args.package_dir is not None:
+        set_rover_sim_path(args.package_dir)
+
     # generate model
-    world_build(world_path=args.world, force=args.force)
+    profile_folder = op.join(args.world or os.getcwd(), PROFILE_FOLDER_NAME)
+    with profiled(profile_folder, enabled=args.profile or args.profile_memory, memory=args.profile_memory):
+        world_build(world_path=args.world, force=args.force, use_cache=not args.no_cache, max_error=args.max_error,
+                    collision_resolution=args.collision_resolution, tiles=args.tiles, jobs=args.jobs,
+                    native_heightmap=args.native_heightmap, landmark_atlas=args.landmark_atlas,
+                    rebuild=args.rebuild, yes=args.yes, mesh_format=args.mesh_format, collision_format=args.collision_format)
     
\ No newline at end of file
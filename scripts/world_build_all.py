@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Builds all the worlds in the 'worlds' directory in parallel, e.g. after the resources changed.
+The worlds share the heightmap and mesh cache and the landmark models.
+"""
+import os.path as op
+import os, sys
+import time
+import traceback
+from multiprocessing import Pool
+
+# import relative to rover_sim
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.package_path import rover_sim_path, set_rover_sim_path
+from rover_sim.scripts.world_build import world_build
+from rover_sim.scripts.landmarks.generate_landmarks import create_missing_landmarks, read_landmark_rows
+from rover_sim.scripts.heightmap_cache import CACHE_FOLDER_NAME
+from rover_sim.scripts.generate_terrain import VISUAL_MESH_FORMATS, COLLISION_MESH_FORMATS
+
+
+def find_worlds(worlds_path):
+    """find the world folders, folders which contain a heightmap or landmarks file
+
+    Arguments:
+        worlds_path {str} -- path to the folder with the worlds
+
+    Returns:
+        [str] -- sorted paths to the world folders
+    """
+
+    worlds = []
+    for name in sorted(os.listdir(worlds_path)):
+        world_path = op.join(worlds_path, name)
+        if name.startswith('.') or not op.isdir(world_path):
+            continue
+        if op.exists(op.join(world_path, "Heightmap.csv")) or op.exists(op.join(world_path, "Landmarks.csv")):
+            worlds.append(world_path)
+
+    return worlds
+
+
+def build_world(args):
+    """world_build with a tuple of arguments, used by the worker processes
+
+    Arguments:
+        args {()} -- path to the world folder and keyword arguments of world_build
+
+    Returns:
+        () -- path to the world folder, build time (s) and the error message (None if successful)
+    """
+
+    world_path, options = args
+
+    start = time.time()
+    try:
+        world_build(world_path, **options)
+        error = None
+    except Exception:
+        # keep building the other worlds
+        error = traceback.format_exc()
+
+    return world_path, time.time() - start, error
+
+
+def world_build_all(worlds_path=None, jobs=1, **options):
+    """build all the worlds in a folder
+
+    Arguments:
+        worlds_path {str} -- path to the folder with the worlds (default: {None}, rover_sim/worlds)
+
+    Keyword Arguments:
+        jobs {int} -- number of worlds built in parallel (default: {1})
+        options -- keyword arguments of world_build, e.g. force, max_error or yes
+
+    Returns:
+        [()] -- path, build time (s) and error message (None if successful) of every world
+    """
+
+    if worlds_path is None:
+        worlds_path = op.join(rover_sim_path(), "worlds")
+    worlds_path = op.abspath(worlds_path)
+
+    worlds = find_worlds(worlds_path)
+    if not worlds:
+        print("No worlds found in " + worlds_path)
+        return []
+
+    # ask once here, the worker processes can not ask for confirmation
+    if not options.get('yes') and not op.samefile(worlds_path, op.join(rover_sim_path(), "worlds")):
+        print("The worlds will be generated in " + worlds_path)
+        if "y" != raw_input("This is not the standard 'worlds' directory.\n"
+                + "Are you sure? Type y to continue\n").lower():
+            raise KeyboardInterrupt("Cancelled by user")
+    options['yes'] = True
+
+    # one cache for all worlds, the same terrain tiles are only generated once
+    if options.get('cache_dir') is None:
+        options['cache_dir'] = op.join(worlds_path, CACHE_FOLDER_NAME)
+
+    # create the landmark models needed by the worlds before, so the workers do not create the same landmark
+    landmark_names = []
+    for world_path in worlds:
+        landmarks_csv = op.join(world_path, "Landmarks.csv")
+        if op.exists(landmarks_csv):
+            landmark_names.extend(row[0] for row in read_landmark_rows(landmarks_csv))
+    create_missing_landmarks(landmark_names, jobs, options.get('landmark_atlas', False))
+
+    start = time.time()
+    if jobs > 1 and len(worlds) > 1:
+        # worker processes can not start processes of their own
+        options['jobs'] = 1
+        pool = Pool(min(jobs, len(worlds)))
+        try:
+            results = pool.map(build_world, [(world_path, options) for world_path in worlds])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        options['jobs'] = jobs
+        results = [build_world((world_path, options)) for world_path in worlds]
+    total_time = time.time() - start
+
+    # summary
+    print("\n{:<30} {:>10}  {}".format("World", "Time (s)", "Result"))
+    for world_path, build_time, error in results:
+        print("{:<30} {:>10.2f}  {}".format(op.basename(world_path), build_time, "ok" if error is None else "FAILED"))
+    print("{:<30} {:>10.2f}".format("Total", total_time))
+
+    for world_path, _, error in results:
+        if error is not None:
+            print("\nBuilding " + world_path + " failed:\n" + error)
+
+    return results
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+
+    # parse command line arguments
+    parser = ArgumentParser(
+        description="Builds all the worlds (folders with a 'Heightmap.csv' or 'Landmarks.csv') in parallel"
+    )
+
+    parser.add_argument("worlds", type=str, help = "Path to the folder with the worlds, if empty: rover_sim/worlds", nargs="?", default=None)
+    parser.add_argument("-j", "--jobs", type=int, help = "Number of worlds built in parallel (default: 1)", default=1)
+    parser.add_argument("-f", "--force", action="store_true", help = "Force overwrite of old world files")
+    parser.add_argument("--no-cache", action="store_true", help = "Always parse the heightmap csv files, do not use the binary cache")
+    parser.add_argument("-e", "--max-error", type=float, help = "Decimate the terrain meshes with this maximal vertical error (m), full resolution if not given")
+    parser.add_argument("-c", "--collision-resolution", type=float, help = "Grid spacing of the terrain collision meshes (m), 0 to use the visual mesh (default: 0.5)", default=0.5)
+    parser.add_argument("-t", "--tiles", type=int, nargs=2, metavar=("NX", "NY"), help = "Split the terrains into NX x NY tile models")
+    parser.add_argument("--native-heightmap", action="store_true", help = "Use the gazebo heightmap geometry (16 bit png) instead of terrain meshes")
+    parser.add_argument("--mesh-format", type=str, help = "File format of the visual terrain meshes", choices=VISUAL_MESH_FORMATS, default='dae')
+    parser.add_argument("--collision-format", type=str, help = "File format of the terrain collision meshes, same as the visual mesh if not given", choices=COLLISION_MESH_FORMATS)
+    parser.add_argument("--landmark-atlas", action="store_true", help = "Render the textures of all new landmarks into a single texture atlas")
+    parser.add_argument("--rebuild", action="store_true", help = "Regenerate all models, even if they are up to date")
+    parser.add_argument("-y", "--yes", action="store_true", help = "Do not ask for confirmation, e.g. if the folder is not the 'worlds' directory")
+    parser.add_argument("--package-dir", type=str, help = "Path to the rover_sim package, instead of looking it up with rospkg")
+    args = parser.parse_args()
+
+    if args.package_dir is not None:
+        set_rover_sim_path(args.package_dir)
+
+    results = world_build_all(worlds_path=args.worlds, jobs=args.jobs, force=args.force, use_cache=not args.no_cache,
+                              max_error=args.max_error, collision_resolution=args.collision_resolution, tiles=args.tiles,
+                              native_heightmap=args.native_heightmap, landmark_atlas=args.landmark_atlas,
+                              rebuild=args.rebuild, yes=args.yes, mesh_format=args.mesh_format,
+                              collision_format=args.collision_format)
+
+    if any(error is not None for _, _, error in results):
+        sys.exit(1)
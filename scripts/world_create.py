@@ -9,33 +9,32 @@ import os, sys
 import copy
 from argparse import ArgumentParser
 import shutil
-import subprocess
-
-from rospkg import RosPack
 
 # import relative to rover_sim
-rospack = RosPack()
-rover_sim_dir = rospack.get_path('rover_sim')
-sys.path.append(os.path.dirname(rover_sim_dir))
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
+from rover_sim.scripts.package_path import rover_sim_path, set_rover_sim_path
 from rover_sim.scripts.world_build import world_build
 from rover_sim.scripts.generate_random_heightmap import create_random_heightmap
+from rover_sim.scripts.profiling import stage, profiled, PROFILE_FOLDER_NAME
 
 
-def world_create(name, template_dir, landmarks, heightmap, random=False, build=True, force=False):
+def world_create(name, template_dir, landmarks, heightmap, random=False, build=True, force=False, use_cache=True, seed=None):
     """pulls in resources
     
     Arguments:
         name {str} -- name of the generated world in rover_sim/worlds
         template_dir {str} -- template folder with correctly named resources for generation, e.g. another world
         landmarks {str} -- path to landmarks csv file
-        heightmap {str} -- path to heightmap csv file (ERC ver2)
+        heightmap {str} -- path to heightmap csv file (ERC ver2 or ver1)
         random {bool} -- create a random heightmap custom to world (default: {False})
         build {bool} -- call world_build.py afterwards (default: {True})
         force {bool} -- delete old world file (default: {False})
+        use_cache {bool} -- use the binary heightmap cache while building (default: {True})
+        seed {int} -- seed of the random heightmap, stored in 'Heightmap.yaml' (default: {None}, random)
     """
 
-    base_path = op.join(rover_sim_dir, "worlds", name)
+    base_path = op.join(rover_sim_path(), "worlds", name)
 
     landmarks_name = "Landmarks.csv"
     heightmap_name = "Heightmap.csv"
@@ -53,9 +52,9 @@ def world_create(name, template_dir, landmarks, heightmap, random=False, build=T
     ## Create or pull in Resources
 
     if random:
-        # need the subprocess call because random_heightmap uses python3
-        subprocess.call(["python3", op.join(rover_sim_dir, "scripts", "generate_random_heightmap.py"),
-                "--output", heightmap_csv])
+        with stage('random heightmap'):
+            seed = create_random_heightmap(heightmap_csv, seed=seed)
+        print("Created random heightmap with seed " + str(seed))
     
     #TODO add generate_random_landmarks.py once the script is ready
 
@@ -84,7 +83,8 @@ def world_create(name, template_dir, landmarks, heightmap, random=False, build=T
     ## Build using the resources
 
     if build:
-        world_build(base_path, force) 
+        # the world is always inside the 'worlds' directory, no need to confirm
+        world_build(base_path, force, use_cache, yes=True)
 
 
 
@@ -102,14 +102,25 @@ if __name__ == '__main__':
     parser.add_argument("-t", "--template", type=str, help = "Template folder with correctly named Resources for generation.\n"
                                                             + "Overridden by individual resource arguments like '-l'. Use this to create world with same settings as an old one")
     parser.add_argument("-l", "--landmarks", type=str, help = "Path to landmarks csv file")
-    parser.add_argument("-m", "--heightmap", type=str, help = "Path to heightmap csv file (ERC ver2)")
+    parser.add_argument("-m", "--heightmap", type=str, help = "Path to heightmap csv file (ERC ver2 or ver1)")
     parser.add_argument("-r", "--random", action="store_true", help = "Random heightmap and landmarks")
     parser.add_argument("-b", "--build", action="store_false", help = "Call world_build afterwards")
     parser.add_argument("-f", "--force", action="store_true", help = "Force overwrite of old world file")
+    parser.add_argument("--no-cache", action="store_true", help = "Always parse the heightmap csv file, do not use the binary cache")
+    parser.add_argument("--seed", type=int, help = "Seed of the random heightmap, random if not given")
+    parser.add_argument("--package-dir", type=str, help = "Path to the rover_sim package, instead of looking it up with rospkg")
+    parser.add_argument("--profile", action="store_true", help = "Report duration and memory of the stages and write the profiles (cProfile) into '" + PROFILE_FOLDER_NAME + "' in the world directory")
+    parser.add_argument("--profile-memory", action="store_true", help = "Trace the memory allocated by the stages with tracemalloc while profiling (slows the build down)")
     args = parser.parse_args()
 
+    if args.package_dir is not None:
+        set_rover_sim_path(args.package_dir)
+
     # pull in resources
-    world_create(name=args.world, template_dir=args.template, landmarks=args.landmarks, 
-            heightmap=args.heightmap, random=args.random, build=args.build, force=args.force)
+    profile_folder = op.join(rover_sim_path(), "worlds", args.world, PROFILE_FOLDER_NAME)
+    with profiled(profile_folder, enabled=args.profile or args.profile_memory, memory=args.profile_memory):
+        world_create(name=args.world, template_dir=args.template, landmarks=args.landmarks, 
+                heightmap=args.heightmap, random=args.random, build=args.build, force=args.force, use_cache=not args.no_cache,
+                seed=args.seed)
 
     
\ No newline at end of file
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+the vectorized vertex normals match the per vertex calculation
+"""
+
+import os, sys
+import unittest
+
+import numpy as np
+
+# import relative to rover_sim
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.generate_terrain import generate_normal_array
+
+
+def random_coords(number_of_cols, number_of_rows, seed=0):
+    """2d array of 3d coordinates of a random terrain with a spacing of 0.5 m"""
+
+    x, y = np.meshgrid(np.arange(number_of_cols) * 0.5, np.arange(number_of_rows) * 0.5, indexing='ij')
+    z = np.random.RandomState(seed).uniform(-1, 1, (number_of_cols, number_of_rows))
+    return np.stack((x, y, z), axis=-1)
+
+
+def loop_gradient_normals(coords):
+    """vertex normals calculated one vertex after the other (former generate_normal_array)"""
+
+    number_of_cols, number_of_rows, _ = coords.shape
+
+    normal_floats = []
+    for x in range(number_of_cols):
+        for y in range(number_of_rows):
+            # edge cases (normal points up)
+            if x == 0 or x == number_of_cols - 1 or y == 0 or y == number_of_rows - 1:
+                normal_floats.append([0, 0, 1])
+                continue
+
+            # calculate normal to gradient
+            current_normal = np.cross(coords[x+1, y]-coords[x-1, y],
+                                      coords[x, y+1]-coords[x, y-1])
+
+            # normalize normal
+            current_normal /= np.linalg.norm(current_normal)
+            normal_floats.append(current_normal)
+
+    normal_floats = np.array(normal_floats)
+
+    return normal_floats
+
+
+def loop_area_weighted_normals(coords):
+    """vertex normals as sum of the adjacent face normals, calculated one triangle after the other"""
+
+    number_of_cols, number_of_rows, _ = coords.shape
+
+    normals = np.zeros((number_of_cols, number_of_rows, 3))
+    for x in range(number_of_cols - 1):
+        for y in range(number_of_rows - 1):
+            # the two triangles of the cell, counter clockwise
+            for a, b, c in (((x, y), (x+1, y), (x, y+1)), ((x+1, y+1), (x, y+1), (x+1, y))):
+                face_normal = np.cross(coords[b] - coords[a], coords[c] - coords[a])
+                for corner in (a, b, c):
+                    normals[corner] += face_normal
+
+    for x in range(number_of_cols):
+        for y in range(number_of_rows):
+            # edge cases (normal points up)
+            if x == 0 or x == number_of_cols - 1 or y == 0 or y == number_of_rows - 1:
+                normals[x, y] = [0, 0, 1]
+            else:
+                normals[x, y] /= np.linalg.norm(normals[x, y])
+
+    return normals.reshape(-1, 3)
+
+
+class TestNormals(unittest.TestCase):
+
+    # square, non square and minimal grids
+    shapes = [(12, 12), (17, 9), (5, 23), (3, 3)]
+
+    def test_gradient(self):
+        for shape in self.shapes:
+            coords = random_coords(*shape)
+            expected = loop_gradient_normals(coords)
+            normals = generate_normal_array(coords, 'gradient')
+
+            self.assertEqual(normals.shape, expected.shape)
+            self.assertTrue(np.allclose(normals, expected), 'gradient normals differ for grid {}'.format(shape))
+
+    def test_area_weighted(self):
+        for shape in self.shapes:
+            coords = random_coords(*shape)
+            expected = loop_area_weighted_normals(coords)
+            normals = generate_normal_array(coords, 'area')
+
+            self.assertEqual(normals.shape, expected.shape)
+            self.assertTrue(np.allclose(normals, expected), 'area weighted normals differ for grid {}'.format(shape))
+
+    def test_border(self):
+        # the normals on the border point up, also for grids without inner vertices
+        for shape in self.shapes + [(2, 7), (6, 1)]:
+            for mode in ('gradient', 'area'):
+                normals = generate_normal_array(random_coords(*shape), mode).reshape(shape + (3,))
+                border = np.ones(shape, dtype=bool)
+                border[1:-1, 1:-1] = False
+
+                self.assertTrue(np.array_equal(normals[border], np.tile([0.0, 0.0, 1.0], (border.sum(), 1))))
+
+    def test_plane(self):
+        # both modes give the normal of a tilted plane
+        coords = random_coords(9, 14)
+        coords[..., 2] = 0.3 * coords[..., 0] - 0.2 * coords[..., 1]
+        expected = np.array([-0.3, 0.2, 1.0]) / np.linalg.norm([-0.3, 0.2, 1.0])
+
+        for mode in ('gradient', 'area'):
+            normals = generate_normal_array(coords, mode).reshape(9, 14, 3)
+            self.assertTrue(np.allclose(normals[1:-1, 1:-1], expected))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            generate_normal_array(random_coords(4, 4), 'unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
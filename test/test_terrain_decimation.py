@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+the decimated terrain meshes keep their maximal vertical error
+"""
+
+import os, sys
+import unittest
+
+# import relative to rover_sim
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from rover_sim.scripts.heightmap import read_heightmap
+from rover_sim.scripts.terrain_decimation import compute_rtin_errors, extract_rtin_triangles, mesh_height_deviation
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# shipped heightmaps of the tests
+HEIGHTMAPS = ['providedFiles/erc2018final/DTM05_v2.txt', 'providedFiles/erc2018final/DTM01_v2.txt']
+
+# maximal vertical errors (m) of the tests
+MAX_ERRORS = [0.005, 0.01, 0.02, 0.05, 0.1]
+
+# float rounding of the deviation
+TOLERANCE = 1e-6
+
+
+class TestTerrainDecimation(unittest.TestCase):
+
+    def check_deviation(self, keep_border):
+        for heightmap_file in HEIGHTMAPS:
+            heights = read_heightmap(os.path.join(PACKAGE_DIR, heightmap_file)).coordinates()[..., 2]
+            errors = compute_rtin_errors(heights, keep_border)
+
+            full_count = 2 * (heights.shape[0] - 1) * (heights.shape[1] - 1)
+            for max_error in MAX_ERRORS:
+                triangles = extract_rtin_triangles(errors, max_error, *heights.shape)
+                deviation = mesh_height_deviation(heights, triangles)
+
+                self.assertLess(len(triangles), full_count)
+                self.assertLessEqual(deviation, max_error + TOLERANCE,
+                                     '{} with max error {}: deviation {}'.format(heightmap_file, max_error, deviation))
+
+    def test_max_error(self):
+        self.check_deviation(keep_border=False)
+
+    def test_max_error_keep_border(self):
+        self.check_deviation(keep_border=True)
+
+    def test_zero_error(self):
+        # without error the mesh passes through all the grid points
+        heights = read_heightmap(os.path.join(PACKAGE_DIR, HEIGHTMAPS[0])).coordinates()[..., 2]
+        triangles = extract_rtin_triangles(compute_rtin_errors(heights), 0.0, *heights.shape)
+
+        self.assertEqual(mesh_height_deviation(heights, triangles), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()